@@ -46,12 +46,37 @@ class BaseDataType(object):
         """
         pass
 
+    def append_to_document_many(self, document, values, provisional=False):
+        """
+        Assigns the values of a node from a batch of tiles to the corresponding keys in a document
+        in preparation to index the document, values is a list of (nodevalue, nodeid, tile) tuples
+        Override this to process all the values at once, by default each value is appended on its own
+        """
+        for nodevalue, nodeid, tile in values:
+            self.append_to_document(document, nodevalue, nodeid, tile, provisional)
+
     def after_update_all(self, tile=None):
         """
         Refreshes geojson_geometries table after save.
         """
         pass
 
+    def after_update_tiles(self, tiles):
+        """
+        Does the work of after_update_all for a batch of saved tiles (see Tile.bulk_save)
+        Override this to refresh all the tiles at once, by default after_update_all is called for each tile
+        """
+        for tile in tiles:
+            self.after_update_all(tile=tile)
+
+    def requires_after_update_all(self):
+        """
+        Whether after_update_all has any work to do, so that it can be skipped after bulk changes (an import for example)
+        for the datatypes that don't need it, by default True if the datatype overrides after_update_all
+        """
+
+        return type(self).after_update_all is not BaseDataType.after_update_all
+
     def values_match(self, value1, value2):
         return value1 == value2
 
@@ -1,7 +1,7 @@
 from arches.app.utils.betterJSONSerializer import JSONSerializer
 import uuid
 import csv
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.utils.translation import ugettext as _
 from arches.app.models import models
 from arches.app.models import concept
@@ -59,6 +59,19 @@ class BaseConceptDataType(BaseDataType):
             result = date_range
         return result
 
+    def get_concept_dates_many(self, conceptids):
+        """
+        Returns the date ranges (see get_concept_dates) of a list of concepts keyed by concept id, loaded with a single query
+        """
+        date_ranges = {}
+        for conceptid, valuetype, value in models.Value.objects.filter(
+            concept_id__in=conceptids, valuetype_id__in=["min_year", "max_year"]
+        ).values_list("concept_id", "valuetype_id", "value"):
+            date_ranges.setdefault(conceptid, {})[valuetype] = value
+        return {
+            conceptid: date_range for conceptid, date_range in date_ranges.items() if "min_year" in date_range and "max_year" in date_range
+        }
+
     def append_to_document(self, document, nodevalue, nodeid, tile, provisional=False):
         try:
             assert isinstance(nodevalue, (list, tuple))  # assert nodevalue is an array
@@ -66,24 +79,40 @@ class BaseConceptDataType(BaseDataType):
             nodevalue = [nodevalue]
         for valueid in nodevalue:
             value = self.get_value(valueid)
-            date_range = self.get_concept_dates(value.concept)
-            if date_range is not None:
-                min_date = ExtendedDateFormat(date_range["min_year"]).lower
-                max_date = ExtendedDateFormat(date_range["max_year"]).upper
-                if {"gte": min_date, "lte": max_date} not in document["date_ranges"]:
-                    document["date_ranges"].append(
-                        {"date_range": {"gte": min_date, "lte": max_date}, "nodegroup_id": tile.nodegroup_id, "provisional": provisional}
-                    )
-            document["domains"].append(
-                {
-                    "label": value.value,
-                    "conceptid": value.concept_id,
-                    "valueid": valueid,
-                    "nodegroup_id": tile.nodegroup_id,
-                    "provisional": provisional,
-                }
-            )
-            document["strings"].append({"string": value.value, "nodegroup_id": tile.nodegroup_id, "provisional": provisional})
+            self._append_value_to_document(document, value, valueid, self.get_concept_dates(value.concept), tile, provisional)
+
+    def append_to_document_many(self, document, values, provisional=False):
+        values = [(nodevalue if isinstance(nodevalue, (list, tuple)) else [nodevalue], tile) for nodevalue, nodeid, tile in values]
+        valueids = {valueid for nodevalue, tile in values for valueid in nodevalue if valueid not in self.value_lookup}
+        if len(valueids) > 0:
+            try:
+                for value in models.Value.objects.filter(pk__in=valueids):
+                    self.value_lookup[str(value.pk)] = value
+            except ValidationError:
+                pass  # an invalid value id, get_value falls back to an empty value
+        concept_values = [(valueid, self.get_value(valueid), tile) for nodevalue, tile in values for valueid in nodevalue]
+        date_ranges = self.get_concept_dates_many({value.concept_id for valueid, value, tile in concept_values if value.concept_id})
+        for valueid, value, tile in concept_values:
+            self._append_value_to_document(document, value, valueid, date_ranges.get(value.concept_id), tile, provisional)
+
+    def _append_value_to_document(self, document, value, valueid, date_range, tile, provisional):
+        if date_range is not None:
+            min_date = ExtendedDateFormat(date_range["min_year"]).lower
+            max_date = ExtendedDateFormat(date_range["max_year"]).upper
+            if {"gte": min_date, "lte": max_date} not in document["date_ranges"]:
+                document["date_ranges"].append(
+                    {"date_range": {"gte": min_date, "lte": max_date}, "nodegroup_id": tile.nodegroup_id, "provisional": provisional}
+                )
+        document["domains"].append(
+            {
+                "label": value.value,
+                "conceptid": value.concept_id,
+                "valueid": valueid,
+                "nodegroup_id": tile.nodegroup_id,
+                "provisional": provisional,
+            }
+        )
+        document["strings"].append({"string": value.value, "nodegroup_id": tile.nodegroup_id, "provisional": provisional})
 
     def append_search_filters(self, value, node, query, request):
         try:
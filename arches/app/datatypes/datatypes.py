@@ -20,6 +20,8 @@ from arches.app.utils.date_utils import ExtendedDateFormat
 from arches.app.utils.module_importer import get_class_from_modulename
 from arches.app.utils.permission_backend import user_is_resource_reviewer
 from arches.app.utils.geo_utils import GeoUtils
+from arches.app.utils import mvt
+from arches.app.utils import graph_metadata
 import arches.app.utils.task_management as task_management
 from arches.app.search.elasticsearch_dsl_builder import Query, Dsl, Bool, Match, Range, Term, Terms, Nested, Exists, RangeDSLException
 from arches.app.search.search_engine_factory import SearchEngineInstance as se
@@ -59,14 +61,20 @@ logger = logging.getLogger(__name__)
 class DataTypeFactory(object):
     _datatypes = None
     _datatype_instances = {}
+    _instances_by_datatype = {}
 
     def __init__(self):
         if DataTypeFactory._datatypes is None:
             DataTypeFactory._datatypes = {datatype.datatype: datatype for datatype in models.DDataType.objects.all()}
         self.datatypes = DataTypeFactory._datatypes
         self.datatype_instances = DataTypeFactory._datatype_instances
+        self.node_datatypes = {}
 
     def get_instance(self, datatype):
+        try:
+            return DataTypeFactory._instances_by_datatype[datatype]
+        except KeyError:
+            pass
         try:
             d_datatype = DataTypeFactory._datatypes[datatype]
         except KeyError:
@@ -80,8 +88,28 @@ class DataTypeFactory(object):
             datatype_instance = class_method(d_datatype)
             DataTypeFactory._datatype_instances[d_datatype.classname] = datatype_instance
             self.datatype_instances = DataTypeFactory._datatype_instances
+        DataTypeFactory._instances_by_datatype[datatype] = datatype_instance
         return datatype_instance
 
+    def get_node_datatypes(self, graphid):
+        """
+        Returns a dict of the datatype instances of the nodes of a graph keyed by node id
+
+        The dict is built once per graph by each process (and rebuilt when the graph changes),
+        and is held by the factory so that later calls for the same graph are a single lookup
+
+        """
+
+        graphid = str(graphid)
+        try:
+            return self.node_datatypes[graphid]
+        except KeyError:
+            metadata = graph_metadata.get_graph_metadata(graphid)
+            if metadata.node_datatypes is None:
+                metadata.node_datatypes = {nodeid: self.get_instance(node.datatype) for nodeid, node in metadata.nodes.items()}
+            self.node_datatypes[graphid] = metadata.node_datatypes
+            return metadata.node_datatypes
+
 
 class StringDataType(BaseDataType):
     def validate(self, value, row_number=None, source=None, node=None, nodeid=None, strict=False):
@@ -1117,6 +1145,8 @@ class GeojsonFeatureCollectionDataType(BaseDataType):
         }
 
     def after_update_all(self, tile=None):
+        if tile is not None:
+            bounds_by_node = mvt.get_geometry_bounds(tileid=tile.pk)
         with connection.cursor() as cursor:
             if tile is not None:
                 cursor.execute(
@@ -1126,6 +1156,24 @@ class GeojsonFeatureCollectionDataType(BaseDataType):
             else:
                 cursor.execute("SELECT * FROM refresh_geojson_geometries();")
 
+        if tile is not None:
+            for nodeid, bounds_list in mvt.get_geometry_bounds(tileid=tile.pk).items():
+                bounds_by_node.setdefault(nodeid, []).extend(bounds_list)
+            mvt.geometries_changed(bounds_by_node)
+        else:
+            for node in models.Node.objects.filter(datatype="geojson-feature-collection"):
+                mvt.refresh_clusters(node)
+                transaction.on_commit(lambda nodeid=node.nodeid: mvt.clear_cached_tiles(nodeid))
+
+    def after_update_tiles(self, tiles):
+        # the geometries of the batch are rebuilt with a single DELETE and INSERT
+        mvt.geometries_changed(mvt.refresh_geometries([tile.pk for tile in tiles]))
+
+    def post_tile_delete(self, tile, nodeid, index=True):
+        bounds = self.get_bounds_from_value(tile.data.get(nodeid)) if tile.data.get(nodeid) is not None else None
+        if bounds is not None:
+            mvt.geometries_changed({nodeid: [bounds]})
+
     def default_es_mapping(self):
         mapping = {
             "properties": {
@@ -1873,6 +1921,43 @@ class ResourceInstanceDataType(BaseDataType):
             for rr in models.ResourceXResource.objects.filter(pk__in=to_delete):
                 rr.delete()
 
+    def get_relations(self, tile, nodeid, graphids):
+        """
+        Returns unsaved ResourceXResource models for the related resources of a node of a new tile, for loaders that save
+        tiles in bulk rather than one at a time with pre_tile_save, the ids of the relations are set in the tile's data
+
+        Arguments:
+        tile -- the tile
+        nodeid -- the id of the node
+        graphids -- a dict of the graph ids of the tile's resource and of the related resources keyed by resource instance id,
+            used to fill in the relationship types (from the node's config) of relations that don't have their own
+
+        """
+
+        relations = []
+        now = datetime.now()
+        graphs = {str(graph["graphid"]): graph for graph in (graph_metadata.get_node(nodeid).config or {}).get("graphs") or []}
+        for related_resource in self.get_id_list(tile.data[str(nodeid)]):
+            resourceid = str(related_resource["resourceId"])
+            graph = graphs.get(str(graphids.get(resourceid)), {})
+            relation = models.ResourceXResource(
+                resourcexid=related_resource.get("resourceXresourceId") or uuid.uuid1(),
+                resourceinstanceidfrom_id=tile.resourceinstance_id,
+                resourceinstancefrom_graphid_id=graphids.get(str(tile.resourceinstance_id)),
+                resourceinstanceidto_id=resourceid,
+                resourceinstanceto_graphid_id=graphids.get(resourceid),
+                notes="",
+                relationshiptype=related_resource.get("ontologyProperty") or graph.get("ontologyProperty", ""),
+                inverserelationshiptype=related_resource.get("inverseOntologyProperty") or graph.get("inverseOntologyProperty", ""),
+                tileid_id=tile.tileid,
+                nodeid_id=nodeid,
+                created=now,
+                modified=now,
+            )
+            related_resource["resourceXresourceId"] = str(relation.resourcexid)
+            relations.append(relation)
+        return relations
+
     def post_tile_delete(self, tile, nodeid, index=True):
         if tile.data and tile.data[nodeid] and index:
             for related in tile.data[nodeid]:
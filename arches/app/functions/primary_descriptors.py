@@ -1,10 +1,15 @@
+import logging
 import uuid
 from arches.app.functions.base import BaseFunction
 from arches.app.models import models
 from arches.app.models.tile import Tile
+from arches.app.models.system_settings import settings
 from arches.app.datatypes.datatypes import DataTypeFactory
+from django.core.cache import cache
 from django.utils.translation import ugettext as _
 
+logger = logging.getLogger(__name__)
+
 
 class PrimaryDescriptorsFunction(BaseFunction):
     def get_primary_descriptor_from_nodes(self, resource, config):
@@ -39,3 +44,107 @@ class PrimaryDescriptorsFunction(BaseFunction):
         if config["string_template"].strip() == "":
             config["string_template"] = _("Undefined")
         return config["string_template"]
+
+
+def get_compiled_descriptors(graphid):
+    """
+    Returns the CompiledDescriptors of a graph from the cache, compiling them first if they aren't cached
+
+    The cached value is cleared whenever the graph, one of its nodes or one of its function configs is saved or deleted
+
+    """
+
+    key = f"compiled_descriptors_{graphid}"
+    compiled_descriptors = cache.get(key)
+    if compiled_descriptors is None:
+        compiled_descriptors = CompiledDescriptors(graphid)
+        cache.set(key, compiled_descriptors, settings.GRAPH_MODEL_CACHE_TIMEOUT)
+    return compiled_descriptors
+
+
+class CompiledDescriptors(object):
+    """
+    The primary descriptor templates (name, description and map_popup) of a graph, compiled together with
+    the nodegroup and nodes that participate in each template so that the descriptors of a resource can be
+    rendered from a list of its already loaded tiles without querying for the function config or the nodes
+
+    """
+
+    def __init__(self, graphid):
+        self.graphid = str(graphid)
+        self.descriptors = {}
+        configs = list(
+            models.FunctionXGraph.objects.filter(graph_id=graphid, function__functiontype="primarydescriptors").values_list(
+                "config", flat=True
+            )
+        )
+        # descriptors are only defined if a graph has exactly one primary descriptors function
+        self.configured = len(configs) == 1
+        if self.configured:
+            nodegroupids = {}
+            for descriptor, config in configs[0].items():
+                if isinstance(config, dict) and "string_template" in config:
+                    nodegroupid = None
+                    if "nodegroup_id" in config and config["nodegroup_id"] != "" and config["nodegroup_id"] is not None:
+                        try:
+                            nodegroupid = str(uuid.UUID(config["nodegroup_id"]))
+                        except ValueError as e:
+                            logger.warning("{0} invalid nodegroupid participating in descriptor function.".format(e))
+                    self.descriptors[descriptor] = {"string_template": config["string_template"], "nodegroup_id": nodegroupid, "nodes": []}
+                    if nodegroupid is not None:
+                        nodegroupids.setdefault(nodegroupid, []).append(descriptor)
+
+            for node in models.Node.objects.filter(nodegroup_id__in=list(nodegroupids.keys())):
+                for descriptor in nodegroupids[str(node.nodegroup_id)]:
+                    self.descriptors[descriptor]["nodes"].append(node)
+
+    @property
+    def nodegroupids(self):
+        return {descriptor["nodegroup_id"] for descriptor in self.descriptors.values() if descriptor["nodegroup_id"] is not None}
+
+    def get_tiles(self, resourceinstanceid):
+        """
+        Fetches only the tiles of a resource that participate in its descriptors
+
+        """
+
+        return list(models.TileModel.objects.filter(resourceinstance_id=resourceinstanceid, nodegroup_id__in=list(self.nodegroupids)))
+
+    def get_descriptor(self, descriptor, tiles):
+        """
+        Renders a single descriptor of a resource
+
+        Arguments:
+        descriptor -- the name of the descriptor, eg: "name", "description" or "map_popup"
+        tiles -- the tiles of the resource (any tiles not in the descriptor's nodegroup are ignored)
+
+        """
+
+        if not self.configured or descriptor not in self.descriptors:
+            return "undefined"
+
+        datatype_factory = None
+        compiled_descriptor = self.descriptors[descriptor]
+        string_template = compiled_descriptor["string_template"]
+        if compiled_descriptor["nodegroup_id"] is not None:
+            nodegroup_tiles = [tile for tile in tiles if str(tile.nodegroup_id) == compiled_descriptor["nodegroup_id"]]
+            first_tiles = [tile for tile in nodegroup_tiles if tile.sortorder == 0]
+            for tile in first_tiles if len(first_tiles) > 0 else nodegroup_tiles:
+                data = {}
+                if len(list(tile.data.keys())) > 0:
+                    data = tile.data
+                elif tile.provisionaledits is not None and len(list(tile.provisionaledits.keys())) == 1:
+                    userid = list(tile.provisionaledits.keys())[0]
+                    data = tile.provisionaledits[userid]["value"]
+                for node in compiled_descriptor["nodes"]:
+                    if str(node.nodeid) in data:
+                        if not datatype_factory:
+                            datatype_factory = DataTypeFactory()
+                        datatype = datatype_factory.get_instance(node.datatype)
+                        value = datatype.get_display_value(tile, node)
+                        if value is None:
+                            value = ""
+                        string_template = string_template.replace("<%s>" % node.name, str(value))
+        if string_template.strip() == "":
+            string_template = _("Undefined")
+        return string_template
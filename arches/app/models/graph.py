@@ -18,7 +18,6 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import json
 import logging
-import pyprind
 import uuid
 from copy import copy, deepcopy
 from django.core.cache import cache
@@ -26,11 +25,12 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
 from django.db.utils import IntegrityError
 from arches.app.models import models
-from arches.app.models.resource import Resource
+from arches.app.models.resource import Resource, ModelInactiveError
 from arches.app.models.system_settings import settings
 from arches.app.datatypes.datatypes import DataTypeFactory
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 from arches.app.search.search_engine_factory import SearchEngineFactory
+import arches.app.utils.data_management.resources.remover as resource_remover
 from django.utils.translation import ugettext as _
 from pyld.jsonld import compact, JsonLdError
 
@@ -434,19 +434,15 @@ class Graph(models.GraphModel):
                 )
             )
 
-    def delete_instances(self, verbose=False):
+    def delete_instances(self, verbose=False, user={}, batch_size=None):
         """
-        deletes all associated resource instances
+        deletes all associated resource instances, batch_size at a time (defaults to settings.BULK_IMPORT_BATCH_SIZE)
+        the instances of an inactive model can't be deleted, though there's nothing to do if it has none
 
         """
-        if verbose is True:
-            bar = pyprind.ProgBar(Resource.objects.filter(graph_id=self.graphid).count())
-        for resource in Resource.objects.filter(graph_id=self.graphid):
-            resource.delete()
-            if verbose is True:
-                bar.update()
-        if verbose is True:
-            print(bar)
+        if self.isactive is False and models.ResourceInstance.objects.filter(graph_id=self.graphid).exists():
+            raise ModelInactiveError(_("This model is not yet active; unable to delete."))
+        resource_remover.delete_resources(graphid=self.graphid, user=user, batch_size=batch_size, verbose=verbose)
 
     def get_tree(self, root=None):
         """
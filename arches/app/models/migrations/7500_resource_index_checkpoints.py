@@ -0,0 +1,32 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("models", "7128_resource_instance_filter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceIndexCheckpoint",
+            fields=[
+                ("checkpointid", models.UUIDField(default=uuid.uuid1, primary_key=True, serialize=False)),
+                ("rangestart", models.UUIDField()),
+                ("rangeend", models.UUIDField(blank=True, null=True)),
+                ("indexed", models.IntegerField(default=0)),
+                ("completed", models.DateTimeField(auto_now_add=True)),
+                (
+                    "graph",
+                    models.ForeignKey(db_column="graphid", on_delete=django.db.models.deletion.CASCADE, to="models.GraphModel"),
+                ),
+            ],
+            options={
+                "db_table": "resource_index_checkpoints",
+                "managed": True,
+                "unique_together": {("graph", "rangestart")},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+import django.contrib.postgres.fields.jsonb
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("models", "7500_resource_index_checkpoints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="resourceinstance",
+            name="descriptors",
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def populate_restrictions(apps, schema_editor):
+    # the same rules as permission_backend.refresh_restricted_instances, with the models as they are at this migration
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    UserObjectPermission = apps.get_model("guardian", "UserObjectPermission")
+    GroupObjectPermission = apps.get_model("guardian", "GroupObjectPermission")
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    ResourceInstance = apps.get_model("models", "ResourceInstance")
+    ResourceInstanceRestriction = apps.get_model("models", "ResourceInstanceRestriction")
+
+    content_type = ContentType.objects.filter(app_label="models", model="resourceinstance").first()
+    if content_type is None:
+        return
+
+    user_perms = {}
+    group_perms = {}
+    for object_pk, user_id, codename in UserObjectPermission.objects.filter(content_type=content_type).values_list(
+        "object_pk", "user_id", "permission__codename"
+    ):
+        user_perms.setdefault(object_pk, {}).setdefault(user_id, set()).add(codename)
+    for object_pk, group_id, codename in GroupObjectPermission.objects.filter(content_type=content_type).values_list(
+        "object_pk", "group_id", "permission__codename"
+    ):
+        group_perms.setdefault(object_pk, {}).setdefault(group_id, set()).add(codename)
+
+    group_members = {}
+    for group_id, user_id in User.groups.through.objects.values_list("group_id", "user_id"):
+        group_members.setdefault(group_id, set()).add(user_id)
+    users = {
+        user_id: (is_superuser, is_active)
+        for user_id, is_superuser, is_active in User.objects.values_list("id", "is_superuser", "is_active")
+    }
+
+    resourceids = sorted(set(user_perms) | set(group_perms))
+    restrictions = []
+    for start in range(0, len(resourceids), 1000):
+        batch = resourceids[start : start + 1000]
+        for resourceid in ResourceInstance.objects.filter(pk__in=batch).values_list("pk", flat=True):
+            resourceid = str(resourceid)
+            resource_user_perms = user_perms.get(resourceid, {})
+            perms = {user_id: set(codenames) for user_id, codenames in resource_user_perms.items()}
+            for group_id, codenames in group_perms.get(resourceid, {}).items():
+                for user_id in group_members.get(group_id, ()):
+                    perms.setdefault(user_id, set()).update(codenames)
+            for user_id, codenames in perms.items():
+                is_superuser, is_active = users[user_id]
+                if is_superuser or not is_active:
+                    continue
+                if "no_access_to_resourceinstance" in resource_user_perms.get(user_id, ()) or codenames == {
+                    "no_access_to_resourceinstance"
+                }:
+                    restrictions.append(ResourceInstanceRestriction(resourceinstance_id=resourceid, user_id=user_id))
+    ResourceInstanceRestriction.objects.bulk_create(restrictions, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("guardian", "0001_initial"),
+        ("models", "7501_resource_instance_descriptors"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceInstanceRestriction",
+            fields=[
+                ("restrictionid", models.UUIDField(default=uuid.uuid1, primary_key=True, serialize=False)),
+                (
+                    "resourceinstance",
+                    models.ForeignKey(
+                        db_column="resourceinstanceid", on_delete=django.db.models.deletion.CASCADE, to="models.ResourceInstance"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(db_column="userid", on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            options={
+                "db_table": "resource_instance_restrictions",
+                "managed": True,
+                "unique_together": {("resourceinstance", "user")},
+            },
+        ),
+        migrations.RunPython(populate_restrictions, migrations.RunPython.noop),
+    ]
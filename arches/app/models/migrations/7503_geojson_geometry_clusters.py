@@ -0,0 +1,33 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("models", "7502_resource_instance_restrictions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeoJSONGeometryCluster",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("zoom", models.IntegerField()),
+                ("resourceinstanceid", models.UUIDField(blank=True, null=True)),
+                ("tileid", models.UUIDField(blank=True, null=True)),
+                ("total", models.IntegerField(default=1)),
+                ("geom", django.contrib.gis.db.models.fields.GeometryField(srid=3857)),
+                ("extent", django.contrib.gis.db.models.fields.GeometryField(srid=3857)),
+                ("eps", models.FloatField()),
+                ("minpoints", models.IntegerField()),
+                ("node", models.ForeignKey(db_column="nodeid", on_delete=django.db.models.deletion.CASCADE, to="models.Node")),
+            ],
+            options={
+                "db_table": "geojson_geometry_clusters",
+                "managed": True,
+                "index_together": {("node", "zoom")},
+            },
+        ),
+    ]
@@ -0,0 +1,86 @@
+import hashlib
+import json
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def normalize(value):
+    # 1 and 1.0 are equal values but serialize differently
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(key): normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def get_constraint_value(tiledata, provisionaledits, nodeid):
+    if provisionaledits is None:
+        return (tiledata or {}).get(nodeid)
+    for edit in provisionaledits.values():
+        if nodeid in edit["value"]:
+            return edit["value"][nodeid]
+    return ""
+
+
+def populate_constraint_values(apps, schema_editor):
+    # the same hashes as tile_constraints.rebuild_constraint_values, with the models as they are at this migration
+    ConstraintModel = apps.get_model("models", "ConstraintModel")
+    ConstraintXNode = apps.get_model("models", "ConstraintXNode")
+    ConstraintValue = apps.get_model("models", "ConstraintValue")
+    TileModel = apps.get_model("models", "TileModel")
+
+    batch_size = 1000
+    for constraintid, nodegroupid in ConstraintModel.objects.values_list("constraintid", "card__nodegroup_id"):
+        nodeids = sorted(
+            str(nodeid) for nodeid in ConstraintXNode.objects.filter(constraint_id=constraintid).values_list("node_id", flat=True)
+        )
+        tiles = TileModel.objects.filter(nodegroup_id=nodegroupid).values_list("tileid", "resourceinstance_id", "data", "provisionaledits")
+        constraint_values = []
+        for tileid, resourceinstanceid, tiledata, provisionaledits in tiles.iterator(chunk_size=batch_size):
+            values = [get_constraint_value(tiledata, provisionaledits, nodeid) for nodeid in nodeids]
+            valuehash = hashlib.sha1(json.dumps(normalize(values), sort_keys=True).encode("utf-8")).hexdigest()
+            constraint_values.append(
+                ConstraintValue(constraint_id=constraintid, tile_id=tileid, resourceinstance_id=resourceinstanceid, valuehash=valuehash)
+            )
+            if len(constraint_values) >= batch_size:
+                ConstraintValue.objects.bulk_create(constraint_values)
+                constraint_values = []
+        ConstraintValue.objects.bulk_create(constraint_values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("models", "7503_geojson_geometry_clusters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConstraintValue",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid1, primary_key=True, serialize=False)),
+                ("valuehash", models.TextField()),
+                (
+                    "constraint",
+                    models.ForeignKey(db_column="constraintid", on_delete=django.db.models.deletion.CASCADE, to="models.ConstraintModel"),
+                ),
+                (
+                    "resourceinstance",
+                    models.ForeignKey(
+                        db_column="resourceinstanceid", on_delete=django.db.models.deletion.CASCADE, to="models.ResourceInstance"
+                    ),
+                ),
+                ("tile", models.ForeignKey(db_column="tileid", on_delete=django.db.models.deletion.CASCADE, to="models.TileModel")),
+            ],
+            options={
+                "db_table": "constraint_values",
+                "managed": True,
+                "unique_together": {("constraint", "tile")},
+                "index_together": {("constraint", "valuehash")},
+            },
+        ),
+        migrations.RunPython(populate_constraint_values, migrations.RunPython.noop),
+    ]
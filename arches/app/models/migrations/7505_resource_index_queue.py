@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("models", "7504_constraint_values"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceIndexQueue",
+            fields=[
+                ("resourceinstanceid", models.UUIDField(primary_key=True, serialize=False)),
+                ("queued", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "resource_index_queue",
+                "managed": True,
+            },
+        ),
+    ]
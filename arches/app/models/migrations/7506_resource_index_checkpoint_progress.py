@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("models", "7505_resource_index_queue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="resourceindexcheckpoint",
+            name="lastindexedid",
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="resourceindexcheckpoint",
+            name="completed",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -413,7 +413,7 @@ class MobileSurvey(models.MobileSurveyModel):
                             db.compact()
 
     def append_to_instances(self, request, instances, resource_type_id):
-        search_res_json = search.search_results(request)
+        search_res_json = search.search_results(request, stream=False)
         search_res = JSONDeserializer().deserialize(search_res_json.content)
         try:
             for hit in search_res["results"]["hits"]["hits"]:
@@ -480,7 +480,7 @@ class MobileSurvey(models.MobileSurveyModel):
                         urlparams = urllib.parse.parse_qs(parsed.query)
                         for k, v in urlparams.items():
                             request.GET[k] = v[0]
-                        search_res_json = search.search_results(request)
+                        search_res_json = search.search_results(request, stream=False)
                         search_res = JSONDeserializer().deserialize(search_res_json.content)
                         for hit in search_res["results"]["hits"]["hits"]:
                             all_instances[hit["_source"]["resourceinstanceid"]] = hit["_source"]
@@ -19,12 +19,14 @@ from arches.app.utils.module_importer import get_class_from_modulename
 from django.forms.models import model_to_dict
 from django.contrib.gis.db import models
 from django.contrib.postgres.fields import JSONField
+from django.core.cache import cache
 from django.core.files.storage import FileSystemStorage
 from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import get_template, render_to_string
 from django.core.validators import RegexValidator
+from django.db import transaction
 from django.db.models import Q, Max
-from django.db.models.signals import post_delete, pre_save, post_save
+from django.db.models.signals import post_delete, pre_save, post_save, m2m_changed
 from django.dispatch import receiver
 from django.utils.translation import ugettext as _
 from django.contrib.auth.models import User
@@ -90,6 +92,26 @@ class ConstraintXNode(models.Model):
         db_table = "constraints_x_nodes"
 
 
+class ConstraintValue(models.Model):
+    """
+    A hash of the values a tile holds in the nodes of a unique constraint, so that
+    tiles with the same values can be found with an indexed lookup
+
+    """
+
+    id = models.UUIDField(primary_key=True, serialize=False, default=uuid.uuid1)
+    constraint = models.ForeignKey("ConstraintModel", on_delete=models.CASCADE, db_column="constraintid")
+    tile = models.ForeignKey("TileModel", on_delete=models.CASCADE, db_column="tileid")
+    resourceinstance = models.ForeignKey("ResourceInstance", on_delete=models.CASCADE, db_column="resourceinstanceid")
+    valuehash = models.TextField()
+
+    class Meta:
+        managed = True
+        db_table = "constraint_values"
+        unique_together = ("constraint", "tile")
+        index_together = ("constraint", "valuehash")
+
+
 class CardComponent(models.Model):
     componentid = models.UUIDField(primary_key=True, default=uuid.uuid1)
     name = models.TextField(blank=True, null=True)
@@ -774,6 +796,7 @@ class ResourceInstance(models.Model):
     graph = models.ForeignKey(GraphModel, db_column="graphid", on_delete=models.CASCADE)
     legacyid = models.TextField(blank=True, unique=True, null=True)
     createdtime = models.DateTimeField(auto_now_add=True)
+    descriptors = JSONField(blank=True, null=True)  # the persisted name, description and map_popup of the resource
 
     class Meta:
         managed = True
@@ -781,6 +804,60 @@ class ResourceInstance(models.Model):
         permissions = (("no_access_to_resourceinstance", "No Access"),)
 
 
+class ResourceInstanceRestriction(models.Model):
+    """
+    A user that has no access to a resource instance, calculated from the instance's object permissions
+    so that restricted instances can be filtered in sql without reading the permission tables
+
+    """
+
+    restrictionid = models.UUIDField(primary_key=True, default=uuid.uuid1)
+    resourceinstance = models.ForeignKey(ResourceInstance, db_column="resourceinstanceid", on_delete=models.CASCADE)
+    user = models.ForeignKey(User, db_column="userid", on_delete=models.CASCADE)
+
+    class Meta:
+        managed = True
+        db_table = "resource_instance_restrictions"
+        unique_together = ("resourceinstance", "user")
+
+
+class ResourceIndexCheckpoint(models.Model):
+    """
+    Records the progress of indexing a range of resource instance ids (ordered by resourceinstanceid),
+    the last resource indexed in the range and when the range was completely indexed,
+    so that an interrupted reindex of a graph can be resumed
+
+    """
+
+    checkpointid = models.UUIDField(primary_key=True, default=uuid.uuid1)
+    graph = models.ForeignKey(GraphModel, db_column="graphid", on_delete=models.CASCADE)
+    rangestart = models.UUIDField()
+    rangeend = models.UUIDField(blank=True, null=True)  # null for the last (open ended) range of a graph
+    lastindexedid = models.UUIDField(blank=True, null=True)
+    indexed = models.IntegerField(default=0)
+    completed = models.DateTimeField(blank=True, null=True)  # null until the whole range is indexed
+
+    class Meta:
+        managed = True
+        db_table = "resource_index_checkpoints"
+        unique_together = ("graph", "rangestart")
+
+
+class ResourceIndexQueue(models.Model):
+    """
+    A resource instance waiting to be (re)indexed, a resource is only ever queued once
+    however many of its tiles are edited before the queue is processed
+
+    """
+
+    resourceinstanceid = models.UUIDField(primary_key=True)
+    queued = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        managed = True
+        db_table = "resource_index_queue"
+
+
 class SearchComponent(models.Model):
     searchcomponentid = models.UUIDField(primary_key=True, default=uuid.uuid1)  # This field type is a guess.
     name = models.TextField()
@@ -1108,6 +1185,7 @@ class UserProfile(models.Model):
 @receiver(post_save, sender=User)
 def create_permissions_for_new_users(sender, instance, created, **kwargs):
     from arches.app.models.resource import Resource
+    from arches.app.utils.permission_backend import refresh_restricted_instances
 
     if created:
         ct = ContentType.objects.get(app_label="models", model="resourceinstance")
@@ -1116,6 +1194,7 @@ def create_permissions_for_new_users(sender, instance, created, **kwargs):
             resourceInstanceId = uuid.UUID(resourceInstanceId)
         resources = ResourceInstance.objects.filter(pk__in=resourceInstanceIds)
         assign_perm("no_access_to_resourceinstance", instance, resources)
+        refresh_restricted_instances(resourceInstanceIds)
         for resource in resources:
             Resource(resource.resourceinstanceid).index()
 
@@ -1397,3 +1476,139 @@ class GeoJSONGeometry(models.Model):
     class Meta:
         managed = True
         db_table = "geojson_geometries"
+
+
+class GeoJSONGeometryCluster(models.Model):
+    """
+    A feature, or a cluster of features, of a geometry node as it appears in the map tiles of a clustered zoom level
+    Together the rows of a node make up a pyramid of precomputed clusterings, one for each zoom level up to the node's clusterMaxZoom
+
+    """
+
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, db_column="nodeid")
+    zoom = models.IntegerField()
+    resourceinstanceid = models.UUIDField(blank=True, null=True)  # null for clusters
+    tileid = models.UUIDField(blank=True, null=True)  # null for clusters
+    total = models.IntegerField(default=1)
+    geom = models.GeometryField(srid=3857)  # the feature itself, or the centroid of a cluster
+    extent = models.GeometryField(srid=3857)  # the bounding box of the feature or of the cluster's features
+    eps = models.FloatField()  # the clustering distance used
+    minpoints = models.IntegerField()  # the minimum number of points in a cluster used
+
+    class Meta:
+        managed = True
+        db_table = "geojson_geometry_clusters"
+        index_together = ("node", "zoom")
+
+
+@receiver(post_save, sender=FunctionXGraph)
+@receiver(post_delete, sender=FunctionXGraph)
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+def clear_compiled_descriptors(sender, instance, **kwargs):
+    """Removes the cached primary descriptor templates of a graph when one of its nodes or function configs changes"""
+
+    cache.delete(f"compiled_descriptors_{instance.graph_id}")
+
+
+@receiver(post_save, sender=FunctionXGraph)
+@receiver(post_delete, sender=FunctionXGraph)
+def clear_persisted_descriptors(sender, instance, **kwargs):
+    """
+    Clears the descriptors persisted on the resource instances of a graph when its primary descriptors function config changes,
+    until they're persisted again (by saving the resources or with the resources update_descriptors command) they're calculated when read
+
+    """
+
+    if Function.objects.filter(pk=instance.function_id, classname="PrimaryDescriptorsFunction").exists():
+        ResourceInstance.objects.filter(graph_id=instance.graph_id).exclude(descriptors=None).update(descriptors=None)
+
+
+@receiver(post_save, sender=GraphModel)
+@receiver(post_delete, sender=GraphModel)
+def clear_compiled_descriptors_for_graph(sender, instance, **kwargs):
+    """Removes the cached primary descriptor templates of a graph when the graph is saved or deleted"""
+
+    cache.delete(f"compiled_descriptors_{instance.graphid}")
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+@receiver(post_save, sender=CardModel)
+@receiver(post_delete, sender=CardModel)
+@receiver(post_save, sender=FunctionXGraph)
+@receiver(post_delete, sender=FunctionXGraph)
+def clear_graph_metadata(sender, instance, **kwargs):
+    """Invalidates the cached metadata of the graph a node, card or function config belongs to"""
+
+    from arches.app.utils import graph_metadata
+
+    graph_metadata.clear_graph_metadata(instance.graph_id)
+
+
+@receiver(post_save, sender=GraphModel)
+@receiver(post_delete, sender=GraphModel)
+def clear_graph_metadata_for_graph(sender, instance, **kwargs):
+    """Invalidates the cached metadata of a graph"""
+
+    from arches.app.utils import graph_metadata
+
+    graph_metadata.clear_graph_metadata(instance.graphid)
+
+
+@receiver(post_save, sender=NodeGroup)
+@receiver(post_delete, sender=NodeGroup)
+@receiver(post_save, sender=ConstraintModel)
+@receiver(post_delete, sender=ConstraintModel)
+@receiver(post_save, sender=ConstraintXNode)
+@receiver(post_delete, sender=ConstraintXNode)
+@receiver(post_save, sender=CardXNodeXWidget)
+@receiver(post_delete, sender=CardXNodeXWidget)
+def clear_graph_metadata_for_card_or_nodegroup(sender, instance, **kwargs):
+    """Invalidates the cached metadata of the graphs that use a nodegroup, a unique constraint or a widget"""
+
+    from arches.app.utils import graph_metadata
+
+    if sender is NodeGroup:
+        graphids = Node.objects.filter(nodegroup_id=instance.nodegroupid).values_list("graph_id", flat=True).distinct()
+    elif sender is ConstraintModel:
+        graphids = CardModel.objects.filter(pk=instance.card_id).values_list("graph_id", flat=True)
+    else:
+        graphids = Node.objects.filter(pk=instance.node_id).values_list("graph_id", flat=True)
+    for graphid in graphids:
+        graph_metadata.clear_graph_metadata(graphid)
+
+
+@receiver(post_save, sender=ConstraintXNode)
+@receiver(post_delete, sender=ConstraintXNode)
+def rebuild_constraint_values(sender, instance, **kwargs):
+    """Rehashes the values of a unique constraint when the nodes it is made of change"""
+
+    from arches.app.utils.tile_constraints import rebuild_constraint_values
+
+    def rebuild():
+        if ConstraintModel.objects.filter(pk=instance.constraint_id).exists():
+            rebuild_constraint_values(constraints=[instance.constraint_id])
+
+    if kwargs.get("created", None) is None:
+        # a deleted node may be part of the constraint itself being deleted, so wait until that has finished
+        transaction.on_commit(rebuild)
+    else:
+        rebuild()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def refresh_restrictions_for_group_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recalculates the restricted resource instances of users when they join or leave groups that have instance permissions"""
+
+    from arches.app.utils.permission_backend import refresh_restricted_instances
+
+    if action in ("post_add", "post_remove", "post_clear"):
+        group_permissions = GroupObjectPermission.objects.filter(content_type=ContentType.objects.get_for_model(ResourceInstance))
+        if reverse:
+            group_permissions = group_permissions.filter(group_id=instance.pk)
+        elif pk_set is not None:
+            group_permissions = group_permissions.filter(group_id__in=pk_set)
+        resourceids = set(group_permissions.values_list("object_pk", flat=True))
+        if len(resourceids) > 0:
+            refresh_restricted_instances(resourceids)
@@ -36,11 +36,14 @@ from arches.app.search.search_engine_factory import SearchEngineInstance as se
 from arches.app.search.mappings import TERMS_INDEX, RESOURCE_RELATIONS_INDEX, RESOURCES_INDEX
 from arches.app.search.elasticsearch_dsl_builder import Query, Bool, Terms, Nested
 from arches.app.utils import import_class_from_string
+from arches.app.utils import edit_log
 from arches.app.utils.label_based_graph import LabelBasedGraph
 from arches.app.utils.label_based_graph_v2 import LabelBasedGraph as LabelBasedGraphV2
 from guardian.shortcuts import assign_perm, remove_perm
 from guardian.exceptions import NotUserNorGroup
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
+from arches.app.utils import mvt
+from arches.app.utils import tile_constraints
 from arches.app.utils.exceptions import (
     InvalidNodeNameException,
     MultipleNodesFoundException,
@@ -49,12 +52,17 @@ from arches.app.utils.permission_backend import (
     user_is_resource_reviewer,
     get_users_for_object,
     get_restricted_users,
-    get_restricted_instances,
+    get_restricted_users_bulk,
+    get_restricted_instances_among,
+    refresh_restricted_instances,
 )
 from arches.app.datatypes.datatypes import DataTypeFactory
 
 logger = logging.getLogger(__name__)
 
+# the fields of a resource document that hold the values of its tiles, each value is tagged with the nodegroup_id of its tile
+TILE_VALUE_FIELDS = ["strings", "dates", "domains", "geometries", "points", "numbers", "date_ranges", "ids"]
+
 
 class Resource(models.ResourceInstance):
     class Meta:
@@ -69,26 +77,80 @@ class Resource(models.ResourceInstance):
         # end from models.ResourceInstance
         self.tiles = []
 
-    def get_descriptor(self, descriptor):
-        module = importlib.import_module("arches.app.functions.primary_descriptors")
-        PrimaryDescriptorsFunction = getattr(module, "PrimaryDescriptorsFunction")()
-        functionConfig = models.FunctionXGraph.objects.filter(graph_id=self.graph_id, function__functiontype="primarydescriptors")
-        if len(functionConfig) == 1:
-            return PrimaryDescriptorsFunction.get_primary_descriptor_from_nodes(self, functionConfig[0].config[descriptor])
-        else:
-            return "undefined"
+    def get_descriptor(self, descriptor, tiles=None, compiled_descriptors=None):
+        """
+        Returns the value of a descriptor (name, description or map_popup) of the resource
+
+        Keyword Arguments:
+        tiles -- the tiles of the resource, if not supplied only the tiles participating in the descriptor will be fetched from the database
+        compiled_descriptors -- the CompiledDescriptors of the resource's graph, if not supplied they will be fetched from the cache
+
+        """
+
+        if compiled_descriptors is None:
+            module = importlib.import_module("arches.app.functions.primary_descriptors")
+            compiled_descriptors = module.get_compiled_descriptors(self.graph_id)
+        if tiles is None:
+            tiles = compiled_descriptors.get_tiles(self.resourceinstanceid)
+        return compiled_descriptors.get_descriptor(descriptor, tiles)
+
+    def get_descriptors(self, tiles=None, compiled_descriptors=None):
+        """
+        Returns a dictionary of all the descriptors (name, description and map_popup) of the resource
+
+        Keyword Arguments:
+        tiles -- the tiles of the resource, if not supplied only the tiles participating in the descriptors will be fetched from the database
+        compiled_descriptors -- the CompiledDescriptors of the resource's graph, if not supplied they will be fetched from the cache
+
+        """
+
+        if compiled_descriptors is None:
+            module = importlib.import_module("arches.app.functions.primary_descriptors")
+            compiled_descriptors = module.get_compiled_descriptors(self.graph_id)
+        if tiles is None:
+            tiles = compiled_descriptors.get_tiles(self.resourceinstanceid)
+        return {
+            descriptor: self.get_descriptor(descriptor, tiles=tiles, compiled_descriptors=compiled_descriptors)
+            for descriptor in ("name", "description", "map_popup")
+        }
+
+    def save_descriptors(self, tiles=None, compiled_descriptors=None):
+        """
+        Calculates the descriptors of the resource and persists them on the resource instance
+        so that they can be read later without fetching and rendering the resource's tiles
+
+        Keyword Arguments:
+        tiles -- the tiles of the resource, if not supplied only the tiles participating in the descriptors will be fetched from the database
+        compiled_descriptors -- the CompiledDescriptors of the resource's graph, if not supplied they will be fetched from the cache
+
+        """
+
+        self.descriptors = self.get_descriptors(tiles=tiles, compiled_descriptors=compiled_descriptors)
+        models.ResourceInstance.objects.filter(pk=self.resourceinstanceid).update(descriptors=self.descriptors)
+        return self.descriptors
+
+    def get_persisted_descriptor(self, descriptor):
+        """
+        Returns a descriptor from those persisted on the resource instance, if they haven't been persisted
+        they're calculated (but not saved, see the resources update_descriptors command to persist them)
+
+        """
+
+        if not self.descriptors or descriptor not in self.descriptors:
+            self.descriptors = self.get_descriptors()
+        return self.descriptors[descriptor]
 
     @property
     def displaydescription(self):
-        return self.get_descriptor("description")
+        return self.get_persisted_descriptor("description")
 
     @property
     def map_popup(self):
-        return self.get_descriptor("map_popup")
+        return self.get_persisted_descriptor("map_popup")
 
     @property
     def displayname(self):
-        return self.get_descriptor("name")
+        return self.get_persisted_descriptor("name")
 
     def save_edit(self, user={}, note="", edit_type="", transaction_id=None):
         timestamp = datetime.datetime.now()
@@ -104,7 +166,7 @@ class Resource(models.ResourceInstance):
         if transaction_id is not None:
             edit.transactionid = transaction_id
         edit.edittype = edit_type
-        edit.save()
+        edit_log.write(edit)
 
     def save(self, *args, **kwargs):
         """
@@ -124,23 +186,25 @@ class Resource(models.ResourceInstance):
         user = kwargs.pop("user", None)
         index = kwargs.pop("index", True)
         transaction_id = kwargs.pop("transaction_id", None)
-        super(Resource, self).save(*args, **kwargs)
-        for tile in self.tiles:
-            tile.resourceinstance_id = self.resourceinstanceid
-            saved_tile = tile.save(request=request, index=False, transaction_id=transaction_id)
-        if request is None:
-            if user is None:
-                user = {}
-        else:
-            user = request.user
+        with edit_log.EditLogWriter():
+            super(Resource, self).save(*args, **kwargs)
+            for tile in self.tiles:
+                tile.resourceinstance_id = self.resourceinstanceid
+                saved_tile = tile.save(request=request, index=False, transaction_id=transaction_id)
+            self.save_descriptors()
+            if request is None:
+                if user is None:
+                    user = {}
+            else:
+                user = request.user
 
-        try:
-            for perm in ("view_resourceinstance", "change_resourceinstance", "delete_resourceinstance"):
-                assign_perm(perm, user, self)
-        except NotUserNorGroup:
-            pass
+            try:
+                for perm in ("view_resourceinstance", "change_resourceinstance", "delete_resourceinstance"):
+                    assign_perm(perm, user, self)
+            except NotUserNorGroup:
+                pass
 
-        self.save_edit(user=user, edit_type="create", transaction_id=transaction_id)
+            self.save_edit(user=user, edit_type="create", transaction_id=transaction_id)
         if index is True:
             self.index()
 
@@ -184,7 +248,6 @@ class Resource(models.ResourceInstance):
         """
 
         datatype_factory = DataTypeFactory()
-        node_datatypes = {str(nodeid): datatype for nodeid, datatype in models.Node.objects.values_list("nodeid", "datatype")}
         tiles = []
         documents = []
         term_list = []
@@ -197,30 +260,39 @@ class Resource(models.ResourceInstance):
         start = time()
         Resource.objects.bulk_create(resources)
         TileModel.objects.bulk_create(tiles)
+        tile_constraints.index_tiles(tiles)
 
         print(f"Time to bulk create tiles and resources: {datetime.timedelta(seconds=time() - start)}")
 
         start = time()
-        for resource in resources:
-            resource.save_edit(edit_type="create", transaction_id=transaction_id)
+        with edit_log.EditLogWriter():
+            for resource in resources:
+                resource.save_edit(edit_type="create", transaction_id=transaction_id)
 
-        resources[0].tiles[0].save_edit(
-            note=f"Bulk created: {len(tiles)} for {len(resources)} resources.", edit_type="bulk_create", transaction_id=transaction_id
-        )
+            if len(tiles) > 0:
+                tiles[0].save_edit(
+                    note=f"Bulk created: {len(tiles)} for {len(resources)} resources.",
+                    edit_type="bulk_create",
+                    transaction_id=transaction_id,
+                )
 
         print("Time to save resource edits: %s" % datetime.timedelta(seconds=time() - start))
 
-        for resource in resources:
-            start = time()
-            document, terms = resource.get_documents_to_index(
-                fetchTiles=False, datatype_factory=datatype_factory, node_datatypes=node_datatypes
-            )
-
+        for resource, (document, terms) in zip(
+            resources,
+            Resource.get_documents_to_index_bulk(resources, fetchTiles=False, datatype_factory=datatype_factory),
+        ):
+            resource.descriptors = {
+                "name": document["displayname"],
+                "description": document["displaydescription"],
+                "map_popup": document["map_popup"],
+            }
             documents.append(se.create_bulk_item(index=RESOURCES_INDEX, id=document["resourceinstanceid"], data=document))
 
             for term in terms:
                 term_list.append(se.create_bulk_item(index=TERMS_INDEX, id=term["_id"], data=term["_source"]))
 
+        Resource.objects.bulk_update(resources, ["descriptors"], batch_size=settings.BULK_IMPORT_BATCH_SIZE)
         se.bulk_index(documents)
         se.bulk_index(term_list)
 
@@ -231,9 +303,7 @@ class Resource(models.ResourceInstance):
         """
 
         if str(self.graph_id) != str(settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
-            datatype_factory = DataTypeFactory()
-            node_datatypes = {str(nodeid): datatype for nodeid, datatype in models.Node.objects.values_list("nodeid", "datatype")}
-            document, terms = self.get_documents_to_index(datatype_factory=datatype_factory, node_datatypes=node_datatypes)
+            document, terms = self.get_documents_to_index()
             document["root_ontology_class"] = self.get_root_ontology()
             doc = JSONSerializer().serializeToPython(document)
             se.index_data(index=RESOURCES_INDEX, body=doc, id=self.pk)
@@ -245,15 +315,142 @@ class Resource(models.ResourceInstance):
                 doc, doc_id = es_index.get_documents_to_index(self, document["tiles"])
                 es_index.index_document(document=doc, id=doc_id)
 
-    def get_documents_to_index(self, fetchTiles=True, datatype_factory=None, node_datatypes=None):
+    def index_nodegroups(self, nodegroupids):
+        """
+        Updates the values of the tiles of some nodegroups in the resource's document with an update script,
+        rather than rebuilding and resending the whole document, and replaces the terms of those tiles
+        The whole resource is indexed instead (see index) if the nodegroups contribute to the resource's descriptors,
+        if there are custom indexes or if the resource hasn't been indexed yet
+
+        Arguments:
+        nodegroupids -- the ids of the nodegroups whose tiles have been saved or deleted
+
+        """
+
+        if str(self.graph_id) == str(settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
+            return
+        nodegroupids = list({str(nodegroupid) for nodegroupid in nodegroupids})
+        module = importlib.import_module("arches.app.functions.primary_descriptors")
+        compiled_descriptors = module.get_compiled_descriptors(self.graph_id)
+        if len(settings.ELASTICSEARCH_CUSTOM_INDEXES) > 0 or len(set(nodegroupids) & set(compiled_descriptors.nodegroupids)) > 0:
+            return self.index()
+
+        tiles = list(models.TileModel.objects.filter(resourceinstance_id=self.resourceinstanceid, nodegroup_id__in=nodegroupids))
+        document = {field: [] for field in TILE_VALUE_FIELDS}
+        document["tiles"] = tiles
+        document["provisional_resource"] = "false"
+        terms = self._append_tiles_to_document(document, tiles, DataTypeFactory().get_node_datatypes(self.graph_id))
+
+        resource_tiles = models.TileModel.objects.filter(resourceinstance_id=self.resourceinstanceid)
+        if not resource_tiles.exclude(data={}).exists():
+            provisional_resource = "true"
+        elif resource_tiles.filter(provisionaledits__isnull=False).exclude(provisionaledits={}).exists():
+            provisional_resource = "partial"
+        else:
+            provisional_resource = "false"
+
+        script = {
+            "source": """
+                for (String field : params.fields) {
+                    if (ctx._source[field] == null) {
+                        ctx._source[field] = [];
+                    }
+                    ctx._source[field].removeIf(item -> params.nodegroupids.contains(item.nodegroup_id));
+                    ctx._source[field].addAll(params.document[field]);
+                }
+                ctx._source.provisional_resource = params.provisional_resource;
+            """,
+            "lang": "painless",
+            "params": {
+                "fields": TILE_VALUE_FIELDS + ["tiles"],
+                "nodegroupids": nodegroupids,
+                "document": JSONSerializer().serializeToPython(document),
+                "provisional_resource": provisional_resource,
+            },
+        }
+        if se.update_data(index=RESOURCES_INDEX, id=str(self.resourceinstanceid), body={"script": script}) is False:
+            return self.index()
+
+        query = Query(se)
+        bool_query = Bool()
+        bool_query.filter(Terms(field="resourceinstanceid", terms=[str(self.resourceinstanceid)]))
+        bool_query.filter(Terms(field="nodegroupid", terms=nodegroupids))
+        query.add_query(bool_query)
+        query.delete(index=TERMS_INDEX)
+        se.bulk_index([se.create_bulk_item(index=TERMS_INDEX, id=term["_id"], data=term["_source"]) for term in terms])
+
+    def get_documents_to_index(self, fetchTiles=True, datatype_factory=None):
         """
         Gets all the documents nessesary to index a single resource
         returns a tuple of a document and list of terms
 
         Keyword Arguments:
         fetchTiles -- instead of fetching the tiles from the database get them off the model itself
-        datatype_factory -- refernce to the DataTypeFactory instance
-        node_datatypes -- a dictionary of datatypes keyed to node ids
+        datatype_factory -- reference to the DataTypeFactory instance
+
+        """
+
+        return Resource.get_documents_to_index_bulk([self], fetchTiles=fetchTiles, datatype_factory=datatype_factory)[0]
+
+    @staticmethod
+    def get_documents_to_index_bulk(resources, fetchTiles=True, datatype_factory=None):
+        """
+        Gets all the documents nessesary to index a list of resources
+        The tiles, instance permissions and root ontology classes of all the resources
+        are loaded with a handful of set based queries rather than several queries per resource
+        returns a list of (document, terms) tuples in the same order as the resources
+
+        Arguments:
+        resources -- a list of resource models
+
+        Keyword Arguments:
+        fetchTiles -- instead of fetching the tiles from the database get them off the models themselves
+        datatype_factory -- reference to the DataTypeFactory instance
+
+        """
+
+        resources = list(resources)
+        if len(resources) == 0:
+            return []
+        if datatype_factory is None:
+            datatype_factory = DataTypeFactory()
+
+        graphids = {str(resource.graph_id) for resource in resources}
+        root_ontology_classes = {}
+        for graphid, ontologyclass in models.Node.objects.filter(graph_id__in=graphids, istopnode=True).values_list(
+            "graph_id", "ontologyclass"
+        ):
+            root_ontology_classes.setdefault(str(graphid), ontologyclass)
+
+        module = importlib.import_module("arches.app.functions.primary_descriptors")
+        compiled_descriptors = {graphid: module.get_compiled_descriptors(graphid) for graphid in graphids}
+
+        if fetchTiles:
+            resource_tiles = {str(resource.resourceinstanceid): [] for resource in resources}
+            for tile in models.TileModel.objects.filter(resourceinstance_id__in=list(resource_tiles.keys())):
+                resource_tiles[str(tile.resourceinstance_id)].append(tile)
+
+        restrictions = get_restricted_users_bulk(resources)
+
+        ret = []
+        for resource in resources:
+            graphid = str(resource.graph_id)
+            resourceid = str(resource.resourceinstanceid)
+            ret.append(
+                resource._get_document_to_index(
+                    resource_tiles[resourceid] if fetchTiles else resource.tiles,
+                    restrictions[resourceid],
+                    root_ontology_classes.get(graphid),
+                    compiled_descriptors[graphid],
+                    datatype_factory.get_node_datatypes(graphid),
+                )
+            )
+        return ret
+
+    def _get_document_to_index(self, tiles, restrictions, root_ontology_class, compiled_descriptors, node_datatypes):
+        """
+        Builds the document and terms used to index a single resource from data already fetched from the database
+        returns a tuple of a document and list of terms
 
         """
 
@@ -263,53 +460,40 @@ class Resource(models.ResourceInstance):
         document["graph_id"] = str(self.graph_id)
         document["map_popup"] = None
         document["displayname"] = None
-        document["root_ontology_class"] = self.get_root_ontology()
+        document["root_ontology_class"] = root_ontology_class
         document["legacyid"] = self.legacyid
-        document["displayname"] = self.displayname
-        document["displaydescription"] = self.displaydescription
-        document["map_popup"] = self.map_popup
-
-        tiles = list(models.TileModel.objects.filter(resourceinstance=self)) if fetchTiles else self.tiles
+        descriptors = self.get_descriptors(tiles=tiles, compiled_descriptors=compiled_descriptors)
+        document["displayname"] = descriptors["name"]
+        document["displaydescription"] = descriptors["description"]
+        document["map_popup"] = descriptors["map_popup"]
 
-        restrictions = get_restricted_users(self)
         document["tiles"] = tiles
         document["permissions"] = {"users_without_read_perm": restrictions["cannot_read"]}
         document["permissions"]["users_without_edit_perm"] = restrictions["cannot_write"]
         document["permissions"]["users_without_delete_perm"] = restrictions["cannot_delete"]
         document["permissions"]["users_with_no_access"] = restrictions["no_access"]
-        document["strings"] = []
-        document["dates"] = []
-        document["domains"] = []
-        document["geometries"] = []
-        document["points"] = []
-        document["numbers"] = []
-        document["date_ranges"] = []
-        document["ids"] = []
+        for field in TILE_VALUE_FIELDS:
+            document[field] = []
         document["provisional_resource"] = "true" if sum([len(t.data) for t in tiles]) == 0 else "false"
+        terms = self._append_tiles_to_document(document, tiles, node_datatypes)
+        return document, terms
+
+    def _append_tiles_to_document(self, document, tiles, node_datatypes):
+        """
+        Adds the values of a list of tiles to a document, returns the list of terms of the tiles
+        The values are collected by node so that each datatype can append all the values of a node at once
+
+        """
 
         terms = []
+        node_values = {}
 
-        for tile in document["tiles"]:
+        for tile in tiles:
             for nodeid, nodevalue in tile.data.items():
-                datatype = node_datatypes[nodeid]
+                datatype_instance = node_datatypes[nodeid]
                 if nodevalue != "" and nodevalue != [] and nodevalue != {} and nodevalue is not None:
-                    datatype_instance = datatype_factory.get_instance(datatype)
-                    datatype_instance.append_to_document(document, nodevalue, nodeid, tile)
-                    node_terms = datatype_instance.get_search_terms(nodevalue, nodeid)
-                    for index, term in enumerate(node_terms):
-                        terms.append(
-                            {
-                                "_id": str(nodeid) + str(tile.tileid) + str(index),
-                                "_source": {
-                                    "value": term,
-                                    "nodeid": nodeid,
-                                    "nodegroupid": tile.nodegroup_id,
-                                    "tileid": tile.tileid,
-                                    "resourceinstanceid": tile.resourceinstance_id,
-                                    "provisional": False,
-                                },
-                            }
-                        )
+                    node_values.setdefault((nodeid, False), []).append((nodevalue, nodeid, tile))
+                    terms.extend(self._get_terms(datatype_instance, nodevalue, nodeid, tile, False))
 
             if tile.provisionaledits is not None:
                 provisionaledits = tile.provisionaledits
@@ -319,27 +503,31 @@ class Resource(models.ResourceInstance):
                     for user, edit in provisionaledits.items():
                         if edit["status"] == "review":
                             for nodeid, nodevalue in edit["value"].items():
-                                datatype = node_datatypes[nodeid]
+                                datatype_instance = node_datatypes[nodeid]
                                 if nodevalue != "" and nodevalue != [] and nodevalue != {} and nodevalue is not None:
-                                    datatype_instance = datatype_factory.get_instance(datatype)
-                                    datatype_instance.append_to_document(document, nodevalue, nodeid, tile, True)
-                                    node_terms = datatype_instance.get_search_terms(nodevalue, nodeid)
-                                    for index, term in enumerate(node_terms):
-                                        terms.append(
-                                            {
-                                                "_id": str(nodeid) + str(tile.tileid) + str(index),
-                                                "_source": {
-                                                    "value": term,
-                                                    "nodeid": nodeid,
-                                                    "nodegroupid": tile.nodegroup_id,
-                                                    "tileid": tile.tileid,
-                                                    "resourceinstanceid": tile.resourceinstance_id,
-                                                    "provisional": True,
-                                                },
-                                            }
-                                        )
-
-        return document, terms
+                                    node_values.setdefault((nodeid, True), []).append((nodevalue, nodeid, tile))
+                                    terms.extend(self._get_terms(datatype_instance, nodevalue, nodeid, tile, True))
+
+        for (nodeid, provisional), values in node_values.items():
+            node_datatypes[nodeid].append_to_document_many(document, values, provisional)
+
+        return terms
+
+    def _get_terms(self, datatype_instance, nodevalue, nodeid, tile, provisional):
+        return [
+            {
+                "_id": str(nodeid) + str(tile.tileid) + str(index),
+                "_source": {
+                    "value": term,
+                    "nodeid": nodeid,
+                    "nodegroupid": tile.nodegroup_id,
+                    "tileid": tile.tileid,
+                    "resourceinstanceid": tile.resourceinstance_id,
+                    "provisional": provisional,
+                },
+            }
+            for index, term in enumerate(datatype_instance.get_search_terms(nodevalue, nodeid))
+        ]
 
     def delete(self, user={}, index=True, transaction_id=None):
         """
@@ -381,7 +569,9 @@ class Resource(models.ResourceInstance):
                 self.save_edit(edit_type="delete", user=user, note=self.displayname, transaction_id=transaction_id)
             except:
                 pass
+            geometry_bounds = mvt.get_geometry_bounds(resourceinstanceid=self.resourceinstanceid)
             super(Resource, self).delete()
+            mvt.geometries_changed(geometry_bounds)
 
         return permit_deletion
 
@@ -520,7 +710,13 @@ class Resource(models.ResourceInstance):
         ret["total"] = resource_relations["hits"]["total"]
         instanceids = set()
 
-        restricted_instances = get_restricted_instances(user, se) if user is not None else []
+        restricted_instances = set()
+        if user is not None:
+            relation_instanceids = set()
+            for relation in resource_relations["hits"]["hits"]:
+                relation_instanceids.add(relation["_source"]["resourceinstanceidto"])
+                relation_instanceids.add(relation["_source"]["resourceinstanceidfrom"])
+            restricted_instances = get_restricted_instances_among(user, list(relation_instanceids))
         for relation in resource_relations["hits"]["hits"]:
             try:
                 preflabel = get_preflabel_from_valueid(relation["_source"]["relationshiptype"], lang)
@@ -668,6 +864,7 @@ class Resource(models.ResourceInstance):
         for identity in groups + users:
             for perm in ["no_access_to_resourceinstance", "view_resourceinstance", "change_resourceinstance", "delete_resourceinstance"]:
                 remove_perm(perm, identity, self)
+        refresh_restricted_instances([self.resourceinstanceid])
         self.index()
 
     def add_permission_to_all(self, permission):
@@ -675,6 +872,7 @@ class Resource(models.ResourceInstance):
         users = [user for user in User.objects.all() if user.is_superuser is False]
         for identity in groups + users:
             assign_perm(permission, identity, self)
+        refresh_restricted_instances([self.resourceinstanceid])
         self.index()
 
 
@@ -26,7 +26,7 @@ from django.db import IntegrityError
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Max, Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.utils.translation import ugettext as _
@@ -36,6 +36,10 @@ from arches.app.models.resource import EditLog
 from arches.app.models.system_settings import settings
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 from arches.app.utils.permission_backend import user_is_resource_reviewer
+from arches.app.utils import edit_log
+from arches.app.utils import graph_metadata
+from arches.app.utils import index_queue
+from arches.app.utils import tile_constraints
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Query, Bool, Terms
 from arches.app.search.mappings import TERMS_INDEX
@@ -90,6 +94,8 @@ class Tile(models.TileModel):
         # end from models.TileModel
         self.tiles = []
         self.datatype_factory = DataTypeFactory()
+        self.changed_nodeids = None
+        self.is_unchanged = False
 
         if args:
             if isinstance(args[0], dict):
@@ -133,7 +139,7 @@ class Tile(models.TileModel):
             resource_edit.user_username = getattr(user, "username", "")
             if transaction_id is not None:
                 resource_edit.transactionid = transaction_id
-            resource_edit.save()
+            edit_log.write(resource_edit)
 
         timestamp = datetime.datetime.now()
         edit = EditLog()
@@ -160,12 +166,12 @@ class Tile(models.TileModel):
         edit.oldprovisionalvalue = oldprovisionalvalue
         if transaction_id is not None:
             edit.transactionid = transaction_id
-        edit.save()
+        edit_log.write(edit)
 
     def tile_collects_data(self):
         result = True
         if self.tiles is not None and len(self.tiles) > 0:
-            nodes = models.Node.objects.filter(nodegroup=self.nodegroup)
+            nodes = graph_metadata.get_nodes(self.nodegroup_id)
             if len(nodes) == 1 and nodes[0].datatype == "semantic":
                 result = False
         return result
@@ -234,8 +240,8 @@ class Tile(models.TileModel):
     def check_tile_cardinality_violation(self):
         if settings.BYPASS_CARDINALITY_TILE_VALIDATION:
             return
-        if self.nodegroup.cardinality == "1":
-            kwargs = {"nodegroup": self.nodegroup, "resourceinstance_id": self.resourceinstance_id}
+        if graph_metadata.get_nodegroup(self.nodegroup_id).cardinality == "1":
+            kwargs = {"nodegroup_id": self.nodegroup_id, "resourceinstance_id": self.resourceinstance_id}
             try:
                 uuid.UUID(str(self.parenttile_id))
                 kwargs["parenttile_id"] = self.parenttile_id
@@ -246,62 +252,130 @@ class Tile(models.TileModel):
 
             # this should only ever return at most one tile
             if len(existing_tiles) > 0 and uuid.UUID(str(self.tileid)) not in existing_tiles:
-                card = models.CardModel.objects.get(nodegroup=self.nodegroup)
-                message = _("Unable to save a tile to a card with cardinality 1 where a tile has previously been saved.")
-                details = _(
-                    "Details: card: {0}, graph: {1}, resource: {2}, tile: {3}, nodegroup: {4}".format(
-                        card.name, self.resourceinstance.graph.name, self.resourceinstance_id, self.tileid, self.nodegroup_id
-                    )
-                )
-                message += " " + details
-                raise TileCardinalityError(message)
+                raise self._get_cardinality_error()
+
+    def _get_cardinality_error(self):
+        card = graph_metadata.get_card(self.nodegroup_id)
+        message = _("Unable to save a tile to a card with cardinality 1 where a tile has previously been saved.")
+        details = _(
+            "Details: card: {0}, graph: {1}, resource: {2}, tile: {3}, nodegroup: {4}".format(
+                card.name, self.resourceinstance.graph.name, self.resourceinstance_id, self.tileid, self.nodegroup_id
+            )
+        )
+        message += " " + details
+        return TileCardinalityError(message)
 
     def check_for_constraint_violation(self):
         if settings.BYPASS_UNIQUE_CONSTRAINT_TILE_VALIDATION:
             return
-        card = models.CardModel.objects.get(nodegroup=self.nodegroup)
-        constraints = models.ConstraintModel.objects.filter(card=card)
-        if constraints.count() > 0:
-            for constraint in constraints:
-                if constraint.uniquetoallinstances is True:
-                    tiles = models.TileModel.objects.filter(nodegroup=self.nodegroup)
-                else:
-                    tiles = models.TileModel.objects.filter(
-                        Q(resourceinstance_id=self.resourceinstance.resourceinstanceid) & Q(nodegroup=self.nodegroup)
-                    )
+        for constraint, nodeids in tile_constraints.get_constraints(self.nodegroup_id):
+            resourceinstanceid = None if constraint.uniquetoallinstances is True else self.resourceinstance_id
+            tiles = tile_constraints.get_tiles_with_values(
+                constraint, [self.data.get(nodeid) for nodeid in nodeids], resourceinstanceid=resourceinstanceid, exclude_tileid=self.tileid
+            )
+            nodes = [node for node in constraint.nodes.all()]
+            for tile in tiles:
+                self._check_for_duplicate_values(tile, nodes)
+
+    def _check_for_duplicate_values(self, tile, nodes, saved=True):
+        """
+        Raises a TileValidationError if another tile holds the same values as this tile in the nodes of a unique constraint
+
+        Arguments:
+        tile -- the other tile, usually one whose values hashed the same as this tile's
+        nodes -- the nodes of the constraint
+
+        Keyword Arguments:
+        saved -- False if the other tile is being saved along with this one, rather than already saved
+
+        """
+
+        duplicate_values = []
+        for node in nodes:
+            datatype = self.datatype_factory.get_instance(node.datatype)
+            nodeid = str(node.nodeid)
+            tile_data = tile_constraints.get_constraint_value(tile, nodeid) if saved else tile.data.get(nodeid)
+            if not datatype.values_match(tile_data, self.data.get(nodeid)):
+                return
+            duplicate_values.append(datatype.get_display_value(tile, node))
+        if len(duplicate_values) > 0:
+            message = _(
+                "This card violates a unique constraint. \
+                The following value is already saved: "
+            )
+            raise TileValidationError(message + (", ").join(duplicate_values))
+
+    @staticmethod
+    def check_for_constraint_violations(tiles):
+        """
+        Checks a list of tiles that are about to be saved together against the unique constraints of their cards,
+        with one query per constraint rather than per tile, including whether tiles in the list duplicate each other
+
+        """
+
+        if settings.BYPASS_UNIQUE_CONSTRAINT_TILE_VALIDATION:
+            return
+        tiles_by_nodegroup = {}
+        for tile in tiles:
+            tiles_by_nodegroup.setdefault(str(tile.nodegroup_id), []).append(tile)
+
+        for nodegroupid, nodegroup_tiles in tiles_by_nodegroup.items():
+            for constraint, nodeids in tile_constraints.get_constraints(nodegroupid):
                 nodes = [node for node in constraint.nodes.all()]
-                for tile in tiles:
-                    if str(self.tileid) != str(tile.tileid):
-                        match = False
-                        duplicate_values = []
-                        for node in nodes:
-                            datatype = self.datatype_factory.get_instance(node.datatype)
-                            nodeid = str(node.nodeid)
-                            tile_data = ""
-                            if tile.provisionaledits is None:
-                                # If this is not a provisional tile, the data should
-                                # exist, so we check it normally
-                                tile_data = tile.data[nodeid]
-                            else:
-                                # If it is a provisional tile, we need to check the
-                                # provisional edits for clashing values
-                                for edit_id in tile.provisionaledits.keys():
-                                    edit_data = tile.provisionaledits[str(edit_id)]
-                                    if nodeid in edit_data["value"]:
-                                        tile_data = edit_data["value"][nodeid]
-                                        break
-                            if datatype.values_match(tile_data, self.data[nodeid]):
-                                match = True
-                                duplicate_values.append(datatype.get_display_value(tile, node))
-                            else:
-                                match = False
-                                break
-                        if match is True:
-                            message = _(
-                                "This card violates a unique constraint. \
-                                The following value is already saved: "
-                            )
-                            raise TileValidationError(message + (", ").join(duplicate_values))
+                tiles_by_hash = {}
+                for tile in nodegroup_tiles:
+                    valuehash = tile_constraints.get_value_hash([tile.data.get(nodeid) for nodeid in nodeids])
+                    tiles_by_hash.setdefault(valuehash, []).append(tile)
+
+                # the saved values of the tiles being saved are about to be replaced
+                constraint_values = (
+                    models.ConstraintValue.objects.filter(constraint=constraint, valuehash__in=list(tiles_by_hash.keys()))
+                    .exclude(tile_id__in=[tile.tileid for tile in nodegroup_tiles])
+                    .select_related("tile")
+                )
+                for constraint_value in constraint_values:
+                    for tile in tiles_by_hash[constraint_value.valuehash]:
+                        if constraint.uniquetoallinstances or str(constraint_value.resourceinstance_id) == str(tile.resourceinstance_id):
+                            tile._check_for_duplicate_values(constraint_value.tile, nodes)
+
+                for same_hash_tiles in tiles_by_hash.values():
+                    for i, tile in enumerate(same_hash_tiles):
+                        for other_tile in same_hash_tiles[i + 1 :]:
+                            if constraint.uniquetoallinstances or str(other_tile.resourceinstance_id) == str(tile.resourceinstance_id):
+                                tile._check_for_duplicate_values(other_tile, nodes, saved=False)
+
+    @staticmethod
+    def check_tile_cardinality_violations(tiles):
+        """
+        Checks that a list of tiles that are about to be saved together don't add a second tile
+        to a card with cardinality 1, with one query rather than one per tile
+
+        """
+
+        if settings.BYPASS_CARDINALITY_TILE_VALIDATION:
+            return
+        tiles = [tile for tile in tiles if graph_metadata.get_nodegroup(tile.nodegroup_id).cardinality == "1"]
+        if len(tiles) == 0:
+            return
+
+        # (nodegroupid, resourceinstanceid) -> list of (tileid, parenttileid) of saved and to be saved tiles
+        tiles_by_key = {}
+        existing_tiles = models.TileModel.objects.filter(
+            nodegroup_id__in={tile.nodegroup_id for tile in tiles}, resourceinstance_id__in={tile.resourceinstance_id for tile in tiles}
+        ).exclude(tileid__in=[tile.tileid for tile in tiles])
+        for tileid, nodegroupid, resourceinstanceid, parenttileid in existing_tiles.values_list(
+            "tileid", "nodegroup_id", "resourceinstance_id", "parenttile_id"
+        ):
+            tiles_by_key.setdefault((str(nodegroupid), str(resourceinstanceid)), []).append((str(tileid), str(parenttileid)))
+        for tile in tiles:
+            key = (str(tile.nodegroup_id), str(tile.resourceinstance_id))
+            tiles_by_key.setdefault(key, []).append((str(tile.tileid), str(tile.parenttile_id)))
+
+        for tile in tiles:
+            parenttileid = str(tile.parenttile_id) if tile.parenttile_id else None
+            for tileid, other_parenttileid in tiles_by_key[(str(tile.nodegroup_id), str(tile.resourceinstance_id))]:
+                if tileid != str(tile.tileid) and (parenttileid is None or parenttileid == other_parenttileid):
+                    raise tile._get_cardinality_error()
 
     def check_for_missing_nodes(self):
         if settings.BYPASS_REQUIRED_VALUE_TILE_VALIDATION:
@@ -309,12 +383,13 @@ class Tile(models.TileModel):
         missing_nodes = []
         for nodeid, value in self.data.items():
             try:
-                node = models.Node.objects.get(nodeid=nodeid)
+                node = graph_metadata.get_node(nodeid)
                 datatype = self.datatype_factory.get_instance(node.datatype)
                 datatype.clean(self, nodeid)
                 if self.data[nodeid] is None and node.isrequired is True:
-                    if len(node.cardxnodexwidget_set.all()) > 0:
-                        missing_nodes.append(node.cardxnodexwidget_set.all()[0].label)
+                    widget_label = graph_metadata.get_widget_label(nodeid)
+                    if widget_label is not None:
+                        missing_nodes.append(widget_label)
                     else:
                         missing_nodes.append(node.name)
             except Exception:
@@ -341,7 +416,7 @@ class Tile(models.TileModel):
         tile_errors = []
 
         for nodeid, value in self.data.items():
-            node = models.Node.objects.get(nodeid=nodeid)
+            node = graph_metadata.get_node(nodeid)
             datatype = self.datatype_factory.get_instance(node.datatype)
             error = datatype.validate(value, node=node, strict=strict)
             tile_errors += error
@@ -375,7 +450,7 @@ class Tile(models.TileModel):
                 models.UserProfile.objects.create(user=request.user)
         tile_data = self.get_tile_data(userid)
         for nodeid, value in list(tile_data.items()):
-            node = models.Node.objects.get(nodeid=nodeid)
+            node = graph_metadata.get_node(nodeid)
             datatype = self.datatype_factory.get_instance(node.datatype)
             if request is not None:
                 datatype.handle_request(self, request, node)
@@ -383,6 +458,7 @@ class Tile(models.TileModel):
     def save(self, *args, **kwargs):
         request = kwargs.pop("request", None)
         index = kwargs.pop("index", True)
+        flush_index = kwargs.pop("flush_index", index_queue.flush_requested(request))
         user = kwargs.pop("user", None)
         new_resource_created = kwargs.pop("new_resource_created", False)
         log = kwargs.pop("log", True)
@@ -400,88 +476,297 @@ class Tile(models.TileModel):
         except AttributeError:  # no user - probably importing data
             user = None
 
-        with transaction.atomic():
-            for nodeid, value in self.data.items():
-                node = models.Node.objects.get(nodeid=nodeid)
+        with transaction.atomic(), edit_log.EditLogWriter(atomic=True):
+            existing_model = models.TileModel.objects.select_for_update().filter(pk=self.tileid).first()
+            creating_new_tile = existing_model is None
+
+            # only the nodes whose values have changed need the work their datatypes do before a save
+            for nodeid in [nodeid for nodeid in self.get_changed_nodeids(existing_model) if nodeid in self.data]:
+                node = graph_metadata.get_node(nodeid)
                 datatype = self.datatype_factory.get_instance(node.datatype)
                 datatype.pre_tile_save(self, nodeid)
-            self.__preSave(request)
-            self.check_for_missing_nodes()
-            self.check_for_constraint_violation()
-            self.check_tile_cardinality_violation()
-
-            creating_new_tile = models.TileModel.objects.filter(pk=self.tileid).exists() is False
-            edit_type = "tile create" if (creating_new_tile is True) else "tile edit"
+            # functions can read the changed node ids off the tile to limit their work to what has changed
+            self.changed_nodeids = self.get_changed_nodeids(existing_model)
+            self.is_unchanged = (
+                creating_new_tile is False
+                and (user is None or user_is_reviewer is True)
+                and len(self.changed_nodeids) == 0
+                and self.__matches_model(existing_model)
+            )
 
-            if creating_new_tile is False:
-                existing_model = models.TileModel.objects.get(pk=self.tileid)
-            else:
-                self.populate_missing_nodes()
+            if self.is_unchanged is False:
+                self.__preSave(request)
+                self.check_for_missing_nodes()
+                self.check_for_constraint_violation()
+                self.check_tile_cardinality_violation()
 
-            # this section moves the data over from self.data to self.provisionaledits if certain users permissions are in force
-            # then self.data is restored from the previously saved tile data
-            if user is not None and user_is_reviewer is False:
+                edit_type = "tile create" if (creating_new_tile is True) else "tile edit"
                 if creating_new_tile is True:
-                    self.apply_provisional_edit(user, data=self.data, action="create")
-                    newprovisionalvalue = self.data
-                    self.data = {}
+                    self.populate_missing_nodes()
 
+                # this section moves the data over from self.data to self.provisionaledits if certain users permissions are in force
+                # then self.data is restored from the previously saved tile data
+                if user is not None and user_is_reviewer is False:
+                    if creating_new_tile is True:
+                        self.apply_provisional_edit(user, data=self.data, action="create")
+                        newprovisionalvalue = self.data
+                        self.data = {}
+
+                    else:
+                        # the user has previously edited this tile
+                        self.apply_provisional_edit(user, self.data, action="update", existing_model=existing_model)
+                        newprovisionalvalue = self.data
+                        self.data = existing_model.data
+
+                        oldprovisional = self.get_provisional_edit(existing_model, user)
+                        if oldprovisional is not None:
+                            oldprovisionalvalue = oldprovisional["value"]
+
+                    if provisional_edit_log_details is None:
+                        provisional_edit_log_details = {
+                            "user": user,
+                            "provisional_editor": user,
+                            "action": "create tile" if creating_new_tile else "add edit",
+                        }
+
+                if user is not None:
+                    self.validate([])
+
+                super(Tile, self).save(*args, **kwargs)
+                tile_constraints.index_tiles([self])
+                # We have to save the edit log record after calling save so that the
+                # resource's displayname changes are avaliable
+                self.save_resource_descriptors()
+                user = {} if user is None else user
+                self.datatype_post_save_actions(request)
+                self.__postSave(request)
+                if creating_new_tile is True:
+                    self.save_edit(
+                        user=user,
+                        edit_type=edit_type,
+                        old_value={},
+                        new_value=self.data,
+                        newprovisionalvalue=newprovisionalvalue,
+                        provisional_edit_log_details=provisional_edit_log_details,
+                        transaction_id=transaction_id,
+                        new_resource_created=new_resource_created,
+                    )
                 else:
-                    # the user has previously edited this tile
-                    self.apply_provisional_edit(user, self.data, action="update", existing_model=existing_model)
-                    newprovisionalvalue = self.data
-                    self.data = existing_model.data
+                    self.save_edit(
+                        user=user,
+                        edit_type=edit_type,
+                        old_value=existing_model.data,
+                        new_value=self.data,
+                        newprovisionalvalue=newprovisionalvalue,
+                        oldprovisionalvalue=oldprovisionalvalue,
+                        provisional_edit_log_details=provisional_edit_log_details,
+                        transaction_id=transaction_id,
+                    )
 
-                    oldprovisional = self.get_provisional_edit(existing_model, user)
-                    if oldprovisional is not None:
-                        oldprovisionalvalue = oldprovisional["value"]
+            for tile in self.tiles:
+                tile.resourceinstance = self.resourceinstance
+                tile.parenttile = self
+                tile.save(*args, request=request, index=False, **kwargs)
 
-                if provisional_edit_log_details is None:
-                    provisional_edit_log_details = {
-                        "user": user,
-                        "provisional_editor": user,
-                        "action": "create tile" if creating_new_tile else "add edit",
-                    }
+            # the child tiles belong to the same resource so it only needs indexing once, if anything was saved
+            if index and self.has_saved_changes():
+                self.index(flush=flush_index)
 
-            if user is not None:
-                self.validate([])
+    def get_changed_nodeids(self, existing_model=None):
+        """
+        Returns the ids of the nodes whose values in the tile differ from those of the saved tile,
+        every node of the tile if it hasn't been saved yet
 
-            super(Tile, self).save(*args, **kwargs)
-            # We have to save the edit log record after calling save so that the
-            # resource's displayname changes are avaliable
-            user = {} if user is None else user
-            self.datatype_post_save_actions(request)
-            self.__postSave(request)
-            if creating_new_tile is True:
-                self.save_edit(
-                    user=user,
-                    edit_type=edit_type,
-                    old_value={},
-                    new_value=self.data,
-                    newprovisionalvalue=newprovisionalvalue,
-                    provisional_edit_log_details=provisional_edit_log_details,
-                    transaction_id=transaction_id,
-                    new_resource_created=new_resource_created,
-                )
-            else:
-                self.save_edit(
-                    user=user,
-                    edit_type=edit_type,
-                    old_value=existing_model.data,
-                    new_value=self.data,
-                    newprovisionalvalue=newprovisionalvalue,
-                    oldprovisionalvalue=oldprovisionalvalue,
-                    provisional_edit_log_details=provisional_edit_log_details,
-                    transaction_id=transaction_id,
-                )
+        Keyword Arguments:
+        existing_model -- the saved tile (a TileModel), or None if it hasn't been saved
+
+        """
+
+        if existing_model is None:
+            return list(self.data.keys())
+        existing_data = existing_model.data or {}
+        nodeids = set(self.data.keys()) | set(existing_data.keys())
+        return [nodeid for nodeid in nodeids if self.data.get(nodeid) != existing_data.get(nodeid)]
+
+    def __matches_model(self, model):
+        return (
+            self.provisionaledits == model.provisionaledits
+            and self.sortorder == model.sortorder
+            and str(self.parenttile_id or "") == str(model.parenttile_id or "")
+            and str(self.nodegroup_id) == str(model.nodegroup_id)
+            and str(self.resourceinstance_id) == str(model.resourceinstance_id)
+        )
+
+    def has_saved_changes(self):
+        """
+        Returns False if the last save of the tile and its child tiles found nothing to write
+
+        """
+
+        return self.is_unchanged is False or any(tile.has_saved_changes() for tile in self.tiles)
+
+    @staticmethod
+    def bulk_save(tiles, user=None, transaction_id=None, index=True):
+        """
+        Saves a list of tiles (and their child tiles) together with a handful of set based queries rather than
+        several queries per tile, the tiles are validated together, written with bulk inserts and updates,
+        their edit log records are written with one insert and each resource they belong to is indexed once
+        returns the list of saved tiles, parent tiles before their children
 
+        Edits made by users who aren't resource reviewers are provisional and so are saved one tile at a time
+
+        Arguments:
+        tiles -- a list of Tile objects
+
+        Keyword Arguments:
+        user -- the user making the edits
+        transaction_id -- the id of the edit log transaction to record the edits under
+        index -- False to skip indexing the resources the tiles belong to
+
+        """
+
+        saved_tiles = []
+
+        def flatten_tiles(tile, parenttile=None):
+            if parenttile is not None:
+                tile.resourceinstance_id = parenttile.resourceinstance_id
+                tile.parenttile = parenttile
+            saved_tiles.append(tile)
+            for child_tile in tile.tiles:
+                flatten_tiles(child_tile, tile)
+
+        for tile in tiles:
+            flatten_tiles(tile)
+        if len(saved_tiles) == 0:
+            return saved_tiles
+        resourceids = {str(tile.resourceinstance_id) for tile in saved_tiles}
+
+        if user is not None and user_is_resource_reviewer(user) is False:
+            with transaction.atomic(), edit_log.EditLogWriter(atomic=True):
+                for tile in tiles:
+                    tile.save(user=user, transaction_id=transaction_id, index=False)
             if index:
-                self.index()
+                Tile._index_resources(resourceids)
+            return saved_tiles
+
+        resources = {str(resource.resourceinstanceid): resource for resource in Resource.objects.filter(pk__in=resourceids)}
+        missing_resourceids = resourceids - set(resources.keys())
+        if len(missing_resourceids) > 0:
+            raise TileValidationError(_("These resource instances don't exist: {0}").format(", ".join(sorted(missing_resourceids))))
+        for tile in saved_tiles:
+            tile.resourceinstance = resources[str(tile.resourceinstance_id)]
+
+        with transaction.atomic(), edit_log.EditLogWriter(atomic=True):
+            existing_models = {
+                str(tileid): model for tileid, model in models.TileModel.objects.in_bulk([tile.tileid for tile in saved_tiles]).items()
+            }
+            for tile in saved_tiles:
+                # only the nodes whose values have changed need the work their datatypes do before a save
+                existing_model = existing_models.get(str(tile.tileid))
+                for nodeid in [nodeid for nodeid in tile.get_changed_nodeids(existing_model) if nodeid in tile.data]:
+                    node = graph_metadata.get_node(nodeid)
+                    tile.datatype_factory.get_instance(node.datatype).pre_tile_save(tile, nodeid)
+                tile.changed_nodeids = tile.get_changed_nodeids(existing_model)
+                tile.__preSave()
+                tile.check_for_missing_nodes()
+                if str(tile.tileid) not in existing_models:
+                    tile.populate_missing_nodes()
+                if user is not None:
+                    tile.validate([])
+            Tile.check_for_constraint_violations(saved_tiles)
+            Tile.check_tile_cardinality_violations(saved_tiles)
+
+            new_tiles = [tile for tile in saved_tiles if str(tile.tileid) not in existing_models]
+            updated_tiles = [tile for tile in saved_tiles if str(tile.tileid) in existing_models]
+            Tile._set_sortorders([tile for tile in new_tiles if tile.sortorder is None])
+            Tile.objects.bulk_create(new_tiles, batch_size=settings.BULK_IMPORT_BATCH_SIZE)
+            Tile.objects.bulk_update(
+                updated_tiles,
+                ["resourceinstance", "parenttile", "data", "nodegroup", "sortorder", "provisionaledits"],
+                batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+            )
+            tile_constraints.index_tiles(saved_tiles)
+
+            module = importlib.import_module("arches.app.functions.primary_descriptors")
+            nodegroupids_by_resource = {}
+            for tile in saved_tiles:
+                nodegroupids_by_resource.setdefault(str(tile.resourceinstance_id), set()).add(str(tile.nodegroup_id))
+            for resourceid, nodegroupids in nodegroupids_by_resource.items():
+                compiled_descriptors = module.get_compiled_descriptors(resources[resourceid].graph_id)
+                if len(nodegroupids & set(compiled_descriptors.nodegroupids)) > 0:
+                    resources[resourceid].save_descriptors(compiled_descriptors=compiled_descriptors)
+
+            for tile in saved_tiles:
+                tile.__postSave()
+
+            # reading a display name doesn't save the resource's descriptors, and it's only worked out once for each resource
+            displaynames = {resourceid: resource.displayname for resourceid, resource in resources.items()}
+            timestamp = datetime.datetime.now()
+            for tile in saved_tiles:
+                existing_model = existing_models.get(str(tile.tileid))
+                edit = EditLog(
+                    resourceclassid=tile.resourceinstance.graph_id,
+                    resourceinstanceid=tile.resourceinstance_id,
+                    nodegroupid=tile.nodegroup_id,
+                    tileinstanceid=tile.tileid,
+                    userid=getattr(user, "id", ""),
+                    user_email=getattr(user, "email", ""),
+                    user_firstname=getattr(user, "first_name", ""),
+                    user_lastname=getattr(user, "last_name", ""),
+                    user_username=getattr(user, "username", ""),
+                    resourcedisplayname=displaynames[str(tile.resourceinstance_id)],
+                    oldvalue={} if existing_model is None else existing_model.data,
+                    newvalue=tile.data,
+                    timestamp=timestamp,
+                    edittype="tile create" if existing_model is None else "tile edit",
+                )
+                if transaction_id is not None:
+                    edit.transactionid = transaction_id
+                edit_log.write(edit)
 
-            for tile in self.tiles:
-                tile.resourceinstance = self.resourceinstance
-                tile.parenttile = self
-                tile.save(*args, request=request, index=index, **kwargs)
+            datatype_tiles = {}
+            for tile in saved_tiles:
+                for node in graph_metadata.get_nodes(tile.nodegroup_id):
+                    datatype_tiles.setdefault(node.datatype, set()).add(tile)
+            for datatype, tiles_of_datatype in datatype_tiles.items():
+                saved_tiles[0].datatype_factory.get_instance(datatype).after_update_tiles(list(tiles_of_datatype))
+
+        if index:
+            Tile._index_resources(resourceids)
+        return saved_tiles
+
+    @staticmethod
+    def _set_sortorders(tiles):
+        """
+        Sets the sortorder of new tiles to follow the saved tiles of the same card and resource
+
+        """
+
+        if len(tiles) == 0:
+            return
+        sortorders = {}
+        saved_sortorders = (
+            models.TileModel.objects.filter(
+                nodegroup_id__in={tile.nodegroup_id for tile in tiles}, resourceinstance_id__in={tile.resourceinstance_id for tile in tiles}
+            )
+            .values("nodegroup_id", "resourceinstance_id")
+            .annotate(Max("sortorder"))
+        )
+        for saved_sortorder in saved_sortorders:
+            key = (str(saved_sortorder["nodegroup_id"]), str(saved_sortorder["resourceinstance_id"]))
+            sortorders[key] = saved_sortorder["sortorder__max"]
+        for tile in tiles:
+            key = (str(tile.nodegroup_id), str(tile.resourceinstance_id))
+            sortorder_max = sortorders.get(key)
+            tile.sortorder = sortorder_max + 1 if sortorder_max is not None else 0
+            sortorders[key] = tile.sortorder
+
+    @staticmethod
+    def _index_resources(resourceids):
+        if settings.DEFER_RESOURCE_INDEXING:
+            index_queue.queue_resources(resourceids)
+        else:
+            index_queue.index_resources(list(resourceids))
 
     def populate_missing_nodes(self):
         first_node = next(iter(self.data.items()), None)
@@ -494,6 +779,7 @@ class Tile(models.TileModel):
         se = SearchEngineFactory().create()
         request = kwargs.pop("request", None)
         index = kwargs.pop("index", True)
+        flush_index = kwargs.pop("flush_index", index_queue.flush_requested(request))
         transaction_id = kwargs.pop("index", None)
         provisional_edit_log_details = kwargs.pop("provisional_edit_log_details", None)
         for tile in self.tiles:
@@ -523,12 +809,13 @@ class Tile(models.TileModel):
             )
             try:
                 super(Tile, self).delete(*args, **kwargs)
+                self.save_resource_descriptors()
                 for nodeid in self.data.keys():
-                    node = models.Node.objects.get(nodeid=nodeid)
+                    node = graph_metadata.get_node(nodeid)
                     datatype = self.datatype_factory.get_instance(node.datatype)
                     datatype.post_tile_delete(self, nodeid, index=index)
                 if index:
-                    self.index()
+                    self.index(flush=flush_index)
             except IntegrityError as e:
                 logger.error(e)
 
@@ -536,13 +823,39 @@ class Tile(models.TileModel):
             self.apply_provisional_edit(user, data={}, action="delete")
             super(Tile, self).save(*args, **kwargs)
 
-    def index(self):
+    def save_resource_descriptors(self):
+        """
+        Refreshes the descriptors persisted on the tile's resource instance,
+        but only if the tile's nodegroup participates in one of the descriptors of the resource's graph
+
+        """
+
+        graphid = self.resourceinstance.graph_id
+        module = importlib.import_module("arches.app.functions.primary_descriptors")
+        compiled_descriptors = module.get_compiled_descriptors(graphid)
+        if str(self.nodegroup_id) in compiled_descriptors.nodegroupids:
+            resource = Resource(resourceinstanceid=self.resourceinstance_id, graph_id=graphid)
+            resource.save_descriptors(compiled_descriptors=compiled_descriptors)
+
+    def index(self, flush=False):
         """
         Indexes all the nessesary documents related to resources to support the map, search, and reports
+        If settings.DEFER_RESOURCE_INDEXING is True the resource is queued and indexed by a worker instead,
+        if settings.PARTIAL_RESOURCE_INDEX_UPDATES is True only the values of the tile (and its child tiles) are updated
+
+        Keyword Arguments:
+        flush -- True to index the resource straight away even if indexing is deferred, for callers
+            that need to find the resource in search results as soon as the tile is saved
 
         """
 
-        Resource.objects.get(pk=self.resourceinstance_id).index()
+        if settings.DEFER_RESOURCE_INDEXING and not flush:
+            index_queue.queue_resources([self.resourceinstance_id])
+        elif settings.PARTIAL_RESOURCE_INDEX_UPDATES:
+            nodegroupids = [tile.nodegroup_id for tile in self.get_flattened_tiles()]
+            Resource.objects.get(pk=self.resourceinstance_id).index_nodegroups(nodegroupids)
+        else:
+            Resource.objects.get(pk=self.resourceinstance_id).index()
 
     # # flatten out the nested tiles into a single array
     def get_flattened_tiles(self):
@@ -557,8 +870,7 @@ class Tile(models.TileModel):
         return tiles
 
     def after_update_all(self):
-        nodegroup = models.NodeGroup.objects.get(pk=self.nodegroup_id)
-        for node in nodegroup.node_set.all():
+        for node in graph_metadata.get_nodes(self.nodegroup_id):
             datatype = self.datatype_factory.get_instance(node.datatype)
             datatype.after_update_all(tile=self)
         for tile in self.tiles:
@@ -674,17 +986,10 @@ class Tile(models.TileModel):
             logger.warning(e)
 
     def _getFunctionClassInstances(self):
-        ret = []
-        resource = models.ResourceInstance.objects.get(pk=self.resourceinstance_id)
-        functionXgraphs = models.FunctionXGraph.objects.filter(
-            Q(graph_id=resource.graph_id),
-            Q(config__contains={"triggering_nodegroups": [str(self.nodegroup_id)]}) | Q(config__triggering_nodegroups__exact=[]),
-            ~Q(function__classname="PrimaryDescriptorsFunction"),
-        )
-        for functionXgraph in functionXgraphs:
-            func = functionXgraph.function.get_class_module()(functionXgraph.config, self.nodegroup_id)
-            ret.append(func)
-        return ret
+        metadata = graph_metadata.get_nodegroup_metadata(self.nodegroup_id)
+        if metadata is None:
+            metadata = graph_metadata.get_graph_metadata(models.ResourceInstance.objects.get(pk=self.resourceinstance_id).graph_id)
+        return metadata.get_functions(self.nodegroup_id)
 
     def filter_by_perm(self, user, perm):
         if user:
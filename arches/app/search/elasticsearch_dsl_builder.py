@@ -97,6 +97,39 @@ class Query(Dsl):
         else:
             return self.se.search(index=index, body=self.dsl, scroll=self.scroll)
 
+    def search_after_pages(self, index="", size=1000, tiebreaker="resourceinstanceid"):
+        """
+        Yields the results of the query one page at a time, paging through the results with search_after
+        so that only a single page of hits is ever held in memory
+
+        The query's sort (if any) is kept and the tiebreaker field is added to it so every document
+        has a unique position in the sort
+
+        Keyword Arguments:
+        index -- the index to search
+        size -- the number of hits in each page
+        tiebreaker -- a field holding a unique value for each document
+
+        """
+
+        sort = list(self.dsl.get("sort", []))
+        if not any(tiebreaker in sort_field for sort_field in sort):
+            sort.append({tiebreaker: {"order": "asc"}})
+        self.dsl["sort"] = sort
+        try:
+            while True:
+                results = self.search(index=index, start=0, limit=size)
+                if results is None:
+                    break
+                hits = results["hits"]["hits"]
+                if len(hits) > 0:
+                    yield results
+                if len(hits) < size:
+                    break
+                self.dsl["search_after"] = hits[-1]["sort"]
+        finally:
+            self.dsl.pop("search_after", None)
+
     def count(self, index="", **kwargs):
         return self.se.count(index=index, body=self.dsl)
 
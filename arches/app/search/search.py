@@ -23,7 +23,7 @@ import uuid
 import logging
 from datetime import datetime
 from elasticsearch import Elasticsearch, helpers
-from elasticsearch.exceptions import RequestError
+from elasticsearch.exceptions import NotFoundError, RequestError
 from elasticsearch.helpers import BulkIndexError
 from arches.app.models.system_settings import settings
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
@@ -192,6 +192,23 @@ class SearchEngine(object):
                 )
                 raise detail
 
+    def update_data(self, index=None, id=None, body=None, **kwargs):
+        """
+        Updates a document in place with a partial document or a script (passed in the body),
+        returns False if there is no document with the given id
+
+        """
+
+        index = self._add_prefix(index)
+        try:
+            self.es.update(index=index, doc_type="_doc", id=id, body=body, **kwargs)
+        except NotFoundError:
+            return False
+        except Exception as detail:
+            self.logger.warning("%s: WARNING: failed to update document: %s \nException detail: %s\n" % (datetime.now(), id, detail))
+            raise detail
+        return True
+
     def bulk_index(self, data, **kwargs):
         try:
             helpers.bulk(self.es, data, **kwargs)
@@ -22,6 +22,7 @@ import datetime
 import logging
 from io import StringIO
 from io import BytesIO
+from tempfile import TemporaryFile
 from django.contrib.gis.geos import GeometryCollection, GEOSGeometry
 from django.core.files import File
 from django.utils.translation import ugettext as _
@@ -33,6 +34,7 @@ from arches.app.utils.flatten_dict import flatten_dict
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 from arches.app.utils.data_management.resources.exporter import ResourceExporter
 from arches.app.utils.geo_utils import GeoUtils
+from arches.app.utils import graph_metadata
 from arches.app.utils.response import JSONResponse
 import arches.app.utils.zip as zip_utils
 from arches.app.views import search as SearchView
@@ -138,115 +140,147 @@ class SearchResultsExporter(object):
         return headers
 
     def export(self, format, report_link):
+        """
+        Exports the search results a resource instance at a time, so that memory use doesn't grow with the number of results.
+        Csv files are written out to temporary files as the results are read, geojson features are collected as they are
+        created, and only the identifiers of instances are kept for tilexl and html exports. Shapefiles are written
+        by a writer that needs all of the flattened instances of a graph, so those are still collected in memory.
+
+        """
+
         ret = []
-        search_res_json = SearchView.search_results(self.search_request)
-        if search_res_json.status_code == 500:
-            return ret
-        results = JSONDeserializer().deserialize(search_res_json.content)
-        instances = results["results"]["hits"]["hits"]
         output = {}
+        instance_count = 0
+        use_fieldname = self.format in ("shp",)
 
-        for resource_instance in instances:
-            use_fieldname = self.format in ("shp",)
+        for resource_instance in SearchView.search_results_hits(self.search_request):
+            instance_count += 1
             resource_obj = self.flatten_tiles(
                 resource_instance["_source"]["tiles"], self.datatype_factory, compact=self.compact, use_fieldname=use_fieldname
             )
             has_geom = resource_obj.pop("has_geometry")
             skip_resource = self.format in ("shp",) and has_geom is False
             if skip_resource is False:
+                graph_id = resource_instance["_source"]["graph_id"]
+                if format == "geojson" and len(output) > 0 and graph_id not in output:
+                    # only the features of a single graph are returned as geojson
+                    continue
                 try:
-                    output[resource_instance["_source"]["graph_id"]]["output"].append(resource_obj)
-                except KeyError as e:
-                    output[resource_instance["_source"]["graph_id"]] = {"output": []}
-                    output[resource_instance["_source"]["graph_id"]]["output"].append(resource_obj)
-
-        for graph_id, resources in output.items():
-            graph = models.GraphModel.objects.get(pk=graph_id)
+                    graph_output = output[graph_id]
+                except KeyError:
+                    graph_output = output[graph_id] = self.start_graph_output(graph_id, format, report_link)
 
-            if (report_link == "true") and (format != "tilexl"):
-                for resource in resources["output"]:
-                    report_url = reverse("resource_report", kwargs={"resourceid": resource["resourceid"]})
+                if (report_link == "true") and (format != "tilexl"):
+                    report_url = reverse("resource_report", kwargs={"resourceid": resource_obj["resourceid"]})
                     export_namespace = settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT.rstrip("/")
-                    resource["Link"] = f"{export_namespace}{report_url}"
+                    resource_obj["Link"] = f"{export_namespace}{report_url}"
 
-            if format == "geojson":
+                if format == "geojson":
+                    graph_output["features"] += self.get_geojson_features(resource_obj, graph_output["headers"])
+                elif format == "tilecsv":
+                    graph_output["writer"].writerow({k: str(v) for k, v in list(resource_obj.items())})
+                elif format == "shp":
+                    graph_output["output"].append(resource_obj)
+                elif "resourceid" in resource_obj:
+                    graph_output["output"].append({"resourceid": resource_obj["resourceid"]})
 
-                if settings.EXPORT_DATA_FIELDS_IN_CARD_ORDER is True:
-                    headers = self.return_ordered_header(graph_id, "csv")
-                else:
-                    headers = list(graph.node_set.filter(exportable=True).values_list("name", flat=True))
+        for graph_id, graph_output in output.items():
+            graph = graph_output["graph"]
 
-                if (report_link == "true") and ("Link" not in headers):
-                    headers.append("Link")
-                ret = self.to_geojson(resources["output"], headers=headers, name=graph.name)
-                return ret, ""
+            if format == "geojson":
+                return {"type": "FeatureCollection", "features": graph_output["features"]}, ""
 
             if format == "tilecsv":
-
-                if settings.EXPORT_DATA_FIELDS_IN_CARD_ORDER is True:
-                    headers = self.return_ordered_header(graph_id, "csv")
-                else:
-                    headers = list(graph.node_set.filter(exportable=True).values_list("name", flat=True))
-
-                headers.append("resourceid")
-                if (report_link == "true") and ("Link" not in headers):
-                    headers.append("Link")
-                ret.append(self.to_csv(resources["output"], headers=headers, name=graph.name))
+                ret.append({"name": f"{graph.name}.csv", "outputfile": graph_output["outputfile"]})
 
             if format == "shp":
-
-                if settings.EXPORT_DATA_FIELDS_IN_CARD_ORDER is True:
-                    headers = self.return_ordered_header(graph_id, "shp")
-                else:
-                    headers = graph.node_set.filter(exportable=True).values("fieldname", "datatype", "name")[::1]
-
-                headers.append({"fieldname": "resourceid", "datatype": "str"})
-
-                missing_field_names = []
-                for header in headers:
-                    if not header["fieldname"]:
-                        missing_field_names.append(header["name"])
-                        header.pop("name")
-                if len(missing_field_names) > 0:
-                    message = _("Shapefile are fieldnames required for the following nodes: {0}".format(", ".join(missing_field_names)))
-                    logger.error(message)
-                    raise (Exception(message))
-
-                if (report_link == "true") and ({"fieldname": "Link", "datatype": "str"} not in headers):
-                    headers.append({"fieldname": "Link", "datatype": "str"})
-                else:
-                    pass
-                ret += self.to_shp(resources["output"], headers=headers, name=graph.name)
+                ret += self.to_shp(graph_output["output"], headers=graph_output["headers"], name=graph.name)
 
             if format == "tilexl":
-                headers = graph.node_set.filter(exportable=True).values("fieldname", "datatype", "name")[::1]
-                headers = graph.node_set.filter(exportable=True).values("fieldname", "datatype")[::1]
-                headers.append({"fieldname": "resourceid", "datatype": "str"})
-                ret += self.to_tilexl(resources["output"])
+                ret += self.to_tilexl(graph_output["output"])
 
             if format == "html":
-                ret += self.to_html(resources["output"], name=graph.name, graph_id=str(graph.pk))
+                ret += self.to_html(graph_output["output"], name=graph.name, graph_id=str(graph.pk))
 
         full_path = self.search_request.get_full_path()
         search_request_path = self.search_request.path if full_path is None else full_path
         search_export_info = models.SearchExportHistory(
-            user=self.search_request.user, numberofinstances=len(instances), url=search_request_path
+            user=self.search_request.user, numberofinstances=instance_count, url=search_request_path
         )
         search_export_info.save()
 
         return ret, search_export_info
 
+    def start_graph_output(self, graph_id, format, report_link):
+        """
+        Returns a dictionary to collect the exported instances of a graph in, along with the headers of the export
+        and for csv exports the temporary file the instances are written to
+
+        """
+
+        graph = models.GraphModel.objects.get(pk=graph_id)
+        graph_output = {"graph": graph, "output": []}
+
+        if format in ("geojson", "tilecsv"):
+            if settings.EXPORT_DATA_FIELDS_IN_CARD_ORDER is True:
+                headers = self.return_ordered_header(graph_id, "csv")
+            else:
+                headers = list(graph.node_set.filter(exportable=True).values_list("name", flat=True))
+
+            if format == "geojson":
+                graph_output["features"] = []
+            else:
+                headers.append("resourceid")
+            if (report_link == "true") and ("Link" not in headers):
+                headers.append("Link")
+
+            if format == "tilecsv":
+                dest = TemporaryFile(mode="w+", newline="", encoding="utf-8")
+                csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=headers)
+                csvwriter.writeheader()
+                graph_output["outputfile"] = dest
+                graph_output["writer"] = csvwriter
+
+        elif format == "shp":
+            if settings.EXPORT_DATA_FIELDS_IN_CARD_ORDER is True:
+                headers = self.return_ordered_header(graph_id, "shp")
+            else:
+                headers = graph.node_set.filter(exportable=True).values("fieldname", "datatype", "name")[::1]
+
+            headers.append({"fieldname": "resourceid", "datatype": "str"})
+
+            missing_field_names = []
+            for header in headers:
+                if not header["fieldname"]:
+                    missing_field_names.append(header["name"])
+                    header.pop("name")
+            if len(missing_field_names) > 0:
+                message = _("Shapefile are fieldnames required for the following nodes: {0}".format(", ".join(missing_field_names)))
+                logger.error(message)
+                raise (Exception(message))
+
+            if (report_link == "true") and ({"fieldname": "Link", "datatype": "str"} not in headers):
+                headers.append({"fieldname": "Link", "datatype": "str"})
+
+        else:
+            headers = graph.node_set.filter(exportable=True).values("fieldname", "datatype")[::1]
+            headers.append({"fieldname": "resourceid", "datatype": "str"})
+
+        graph_output["headers"] = headers
+        return graph_output
+
     def write_export_zipfile(self, files_for_export, export_info):
         """
         Writes a list of file like objects out to a zip file
         """
-        zip_stream = zip_utils.create_zip_file(files_for_export, "outputfile")
         today = datetime.datetime.now().isoformat()
         name = f"{settings.APP_NAME}_{today}.zip"
         search_history_obj = models.SearchExportHistory.objects.get(pk=export_info.searchexportid)
-        f = BytesIO(zip_stream)
-        download = File(f)
-        search_history_obj.downloadfile.save(name, download)
+        with TemporaryFile() as f:
+            zip_utils.write_zip_file(files_for_export, f, "outputfile")
+            zip_utils.close_files(files_for_export, "outputfile")
+            download = File(f)
+            search_history_obj.downloadfile.save(name, download)
         return search_history_obj.searchexportid
 
     def get_node(self, nodeid):
@@ -254,7 +288,7 @@ class SearchResultsExporter(object):
         try:
             return self.node_lookup[nodeid]
         except KeyError as e:
-            self.node_lookup[nodeid] = models.Node.objects.get(pk=nodeid)
+            self.node_lookup[nodeid] = graph_metadata.get_node(nodeid)
             return self.node_lookup[nodeid]
 
     def get_feature_collections(self, tile, node, feature_collections, fieldname, datatype):
@@ -303,7 +337,7 @@ class SearchResultsExporter(object):
             for nodeid, value in tile["data"].items():
                 node = self.get_node(nodeid)
                 if node.exportable:
-                    datatype = datatype_factory.get_instance(node.datatype)
+                    datatype = datatype_factory.get_node_datatypes(node.graph_id)[nodeid]
                     node_value = datatype.get_display_value(tile, node)
                     label = node.fieldname if use_fieldname is True else node.name
 
@@ -321,7 +355,7 @@ class SearchResultsExporter(object):
 
             if not compact:  # add on the cardinality and card_names to the tile for use later on
                 tile["data"] = data
-                card = models.CardModel.objects.get(nodegroup=tile["nodegroup_id"])
+                card = graph_metadata.get_card(tile["nodegroup_id"])
                 tile["card_name"] = card.name
                 tile["cardinality"] = node.nodegroup.cardinality
                 tile[card.name] = tile["data"]
@@ -369,28 +403,28 @@ class SearchResultsExporter(object):
         return geometry_fields
 
     def to_geojson(self, instances, headers, name):  # a part of the code exists in datatypes.py, l.567
-        if len(instances) > 0:
-            geometry_fields = self.get_geometry_fieldnames(instances[0])
-
         features = []
-        for geometry_field in geometry_fields:
-            for instance in instances:
-                properties = {}
-                for header in headers:
-                    if header != geometry_field:
-                        try:
-                            properties[header] = instance[header]
-                        except KeyError:
-                            properties[header] = None
-                for key, value in instance.items():
-                    if key == geometry_field:
-                        geometry = GEOSGeometry(value, srid=4326)
-                        for geom in geometry:
-                            feature = {}
-                            feature["geometry"] = JSONDeserializer().deserialize(GEOSGeometry(geom, srid=4326).json)
-                            feature["type"] = "Feature"
-                            feature["properties"] = properties
-                            features.append(feature)
+        for instance in instances:
+            features += self.get_geojson_features(instance, headers)
 
         feature_collection = {"type": "FeatureCollection", "features": features}
         return feature_collection
+
+    def get_geojson_features(self, instance, headers):
+        features = []
+        for geometry_field in self.get_geometry_fieldnames(instance):
+            properties = {}
+            for header in headers:
+                if header != geometry_field:
+                    try:
+                        properties[header] = instance[header]
+                    except KeyError:
+                        properties[header] = None
+            geometry = GEOSGeometry(instance[geometry_field], srid=4326)
+            for geom in geometry:
+                feature = {}
+                feature["geometry"] = JSONDeserializer().deserialize(GEOSGeometry(geom, srid=4326).json)
+                feature["type"] = "Feature"
+                feature["properties"] = properties
+                features.append(feature)
+        return features
@@ -125,6 +125,30 @@ def import_business_data(
     )
 
 
+@shared_task
+def index_queued_resources():
+    from arches.app.models.system_settings import settings
+    from arches.app.utils import index_queue
+    from django.core.cache import cache
+
+    settings.update_from_db()
+
+    indexed = index_queue.process_queue()
+    cache.delete(index_queue.SCHEDULED_CACHE_KEY)
+    # resources queued while the queue was being processed may not have scheduled a task of their own
+    if models.ResourceIndexQueue.objects.exists():
+        index_queue.schedule_queue_processing()
+    return indexed
+
+
+@shared_task
+def refresh_geometry_clusters(nodeid, bounds_list=None):
+    from arches.app.utils import mvt
+
+    mvt.refresh_clusters(models.Node.objects.get(pk=nodeid), bounds_list)
+    mvt.clear_cached_clusters(nodeid)
+
+
 @shared_task
 def package_load_complete(*args, **kwargs):
     valid_resource_paths = kwargs.get("valid_resource_paths")
@@ -0,0 +1,296 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import logging
+import threading
+from io import StringIO
+from psycopg2.extras import Json
+from django.db import connection, transaction
+from django.forms.models import model_to_dict
+from arches.app.datatypes.base import BaseDataType
+from arches.app.datatypes.datatypes import DataTypeFactory, ResourceInstanceDataType
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.search.mappings import RESOURCES_INDEX, TERMS_INDEX, RESOURCE_RELATIONS_INDEX
+from arches.app.utils import edit_log, graph_metadata, mvt, tile_constraints
+
+# the tables that resources are copied into
+COPY_TABLES = ["resource_instances", "tiles", "resource_x_resource", "geojson_geometries"]
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class CopyLoader(object):
+    """
+    Collects the geometry nodes of the resources saved with copy_resources within it and refreshes their map clusters
+    and cached map tiles once, when the outermost loader exits, rather than after every batch of resources
+
+    With defer_indexes the indexes of the tables resources are copied into (other than the indexes of primary keys
+    and unique constraints) are dropped when the loader is entered and rebuilt when it exits, which is much faster
+    than updating them for every row copied when loading millions of resources. A loader that defers indexes
+    must not be opened within a transaction. The indexes are rebuilt however the loader exits, if the process is
+    killed before it does the definitions of the dropped indexes are in the log to recreate them with. The tables
+    have no triggers, so there are none to defer
+
+    A loader opened in a worker process with refresh_geometries=False only collects the geometry nodes, for the worker
+    to return them to a loader in its parent (the worker doesn't inherit its parent's loaders, see reset)
+
+    usage:
+    .. code-block:: python
+
+        with CopyLoader(defer_indexes=True):
+            for resources in batches:
+                copy_resources(resources)
+
+    Keyword Arguments:
+    defer_indexes -- True to drop the indexes of the tables resources are copied into until the loader exits
+    refresh_geometries -- False to only collect the geometry nodes in geometry_nodeids, without refreshing them
+
+    """
+
+    def __init__(self, defer_indexes=False, refresh_geometries=True):
+        self.defer_indexes = defer_indexes
+        self.refresh_geometries = refresh_geometries
+        self.indexes = []
+        self.geometry_nodeids = set()
+        self.outer = None
+
+    def __enter__(self):
+        if self.defer_indexes:
+            self.indexes = drop_indexes(COPY_TABLES)
+        self.outer = getattr(_local, "loader", None)
+        _local.loader = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.loader = self.outer
+        if len(self.indexes) > 0:
+            logger.info("Rebuilding {0} indexes".format(len(self.indexes)))
+            rebuild_indexes(self.indexes)
+        if self.outer is not None:
+            self.outer.geometry_nodeids |= self.geometry_nodeids
+        elif self.refresh_geometries:
+            for nodeid in self.geometry_nodeids:
+                mvt.refresh_clusters(graph_metadata.get_node(nodeid))
+                mvt.clear_cached_tiles(nodeid)
+        return False
+
+
+def reset():
+    """
+    Forgets the loaders open in the current thread, a forked process starts with none of its parent's loaders open
+    so that the geometries it copies aren't collected by a loader that only exits in its parent
+
+    """
+
+    _local.loader = None
+
+
+def copy_resources(resources, transaction_id=None, index=True, datatype_factory=None):
+    """
+    Saves a list of new resources with their tiles, the relations of their resource instance nodes and their geometries,
+    writing the rows with COPY statements rather than INSERTs, the resources are saved in a single transaction
+
+    Datatypes' pre_tile_save is called for each tile before it's copied, other than for resource instance nodes
+    whose relations are built in memory (see ResourceInstanceDataType.get_relations) and copied with the tiles
+
+    Arguments:
+    resources -- a list of unsaved resources, none of which may exist yet
+
+    Keyword Arguments:
+    transaction_id -- the id of the load, recorded in the edit log
+    index -- False to save the resources without indexing them
+    datatype_factory -- the DataTypeFactory to look up the datatypes of the resources' nodes with
+
+    """
+
+    from arches.app.models.resource import Resource
+    from arches.app.search.search_engine_factory import SearchEngineInstance as se
+
+    if len(resources) == 0:
+        return
+    datatype_factory = DataTypeFactory() if datatype_factory is None else datatype_factory
+    tiles = []
+    for resource in resources:
+        resource.tiles = resource.get_flattened_tiles()
+        for tile in resource.tiles:
+            tile.resourceinstance_id = resource.resourceinstanceid
+        tiles.extend(resource.tiles)
+    relations, geometry_tileids, geometry_nodeids = _prepare_tiles(resources, datatype_factory)
+    resourceids = [str(resource.resourceinstanceid) for resource in resources]
+
+    documents = []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            copy_models(cursor, models.ResourceInstance, resources)
+            copy_models(cursor, models.TileModel, tiles)
+            copy_models(cursor, models.ResourceXResource, relations)
+            if len(geometry_tileids) > 0:
+                mvt.insert_geometries(cursor, geometry_tileids)
+        tile_constraints.index_tiles(tiles)
+
+        with edit_log.EditLogWriter(atomic=True):
+            for resource in resources:
+                resource.save_edit(edit_type="create", transaction_id=transaction_id)
+
+        if index:
+            documents = list(Resource.get_documents_to_index_bulk(resources, fetchTiles=False, datatype_factory=datatype_factory))
+            for resource, (document, terms) in zip(resources, documents):
+                resource.descriptors = {
+                    "name": document["displayname"],
+                    "description": document["displaydescription"],
+                    "map_popup": document["map_popup"],
+                }
+        else:
+            for resource in resources:
+                resource.descriptors = resource.get_descriptors(tiles=resource.tiles)
+        Resource.objects.bulk_update(resources, ["descriptors"], batch_size=settings.BULK_IMPORT_BATCH_SIZE)
+
+        loader = getattr(_local, "loader", None)
+        if loader is not None:
+            loader.geometry_nodeids |= geometry_nodeids
+        elif len(geometry_nodeids) > 0:
+            mvt.geometries_changed(mvt.get_geometry_bounds(resourceinstanceids=resourceids))
+
+    if index:
+        with se.BulkIndexer(batch_size=settings.BULK_IMPORT_BATCH_SIZE) as indexer:
+            for document, terms in documents:
+                indexer.add(index=RESOURCES_INDEX, id=document["resourceinstanceid"], data=document)
+                for term in terms:
+                    indexer.add(index=TERMS_INDEX, id=term["_id"], data=term["_source"])
+            for relation in relations:
+                indexer.add(index=RESOURCE_RELATIONS_INDEX, id=relation.resourcexid, data=model_to_dict(relation))
+
+
+def copy_models(cursor, model, instances):
+    """
+    Writes model instances to the model's table with a COPY statement, none of the instances may exist yet
+
+    Arguments:
+    cursor -- the database cursor to copy with
+    model -- the model class of the table
+    instances -- a list of instances of the model (or of a proxy of it)
+
+    """
+
+    if len(instances) == 0:
+        return
+    fields = model._meta.concrete_fields
+    rows = StringIO()
+    for instance in instances:
+        rows.write(",".join(_to_csv(field.get_db_prep_save(field.pre_save(instance, True), connection)) for field in fields))
+        rows.write("\n")
+    rows.seek(0)
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    cursor.copy_expert(f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)", rows)
+
+
+def drop_indexes(tables):
+    """
+    Drops the indexes of a list of tables, other than the indexes of primary keys and unique constraints, in a single
+    transaction, returns a list of (name, definition) tuples of the dropped indexes to rebuild them with (see rebuild_indexes)
+
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = ANY(%s)
+            AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = format('%%I.%%I', schemaname, indexname)::regclass)
+            """,
+            [list(tables)],
+        )
+        indexes = cursor.fetchall()
+        for name, definition in indexes:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(name)};")
+            logger.warning(f"Dropped index {name}, if it isn't rebuilt recreate it with: {definition};")
+    return indexes
+
+
+def rebuild_indexes(indexes):
+    """
+    Recreates indexes dropped with drop_indexes in a single transaction, skipping any that already exist
+
+    Arguments:
+    indexes -- a list of (name, definition) tuples
+
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, definition in indexes:
+            cursor.execute(definition.replace("INDEX", "INDEX IF NOT EXISTS", 1))
+
+
+def _prepare_tiles(resources, datatype_factory):
+    # calls pre_tile_save for the datatypes that implement it and builds the relations of resource instance nodes,
+    # returns the relations, the ids of the tiles with geometries and the ids of the geometry nodes with values
+    relation_values = []
+    geometry_tileids = set()
+    geometry_nodeids = set()
+    geometry_nodes = {}
+    for resource in resources:
+        graphid = str(resource.graph_id)
+        node_datatypes = datatype_factory.get_node_datatypes(graphid)
+        if graphid not in geometry_nodes:
+            metadata = graph_metadata.get_graph_metadata(graphid)
+            geometry_nodes[graphid] = {nodeid for nodeid, node in metadata.nodes.items() if node.datatype == "geojson-feature-collection"}
+        for tile in resource.tiles:
+            for nodeid, value in tile.data.items():
+                datatype = node_datatypes.get(nodeid)
+                if datatype is None:
+                    continue
+                if isinstance(datatype, ResourceInstanceDataType):
+                    if value not in (None, "", []):
+                        relation_values.append((tile, nodeid, datatype))
+                elif type(datatype).pre_tile_save is not BaseDataType.pre_tile_save:
+                    datatype.pre_tile_save(tile, nodeid)
+                if nodeid in geometry_nodes[graphid] and tile.data[nodeid]:
+                    geometry_tileids.add(str(tile.tileid))
+                    geometry_nodeids.add(nodeid)
+
+    graphids = {str(resource.resourceinstanceid): resource.graph_id for resource in resources}
+    related_resourceids = {
+        str(related_resource["resourceId"])
+        for tile, nodeid, datatype in relation_values
+        for related_resource in datatype.get_id_list(tile.data[nodeid])
+    }
+    related_resourceids.difference_update(graphids)
+    for resourceid, graphid in models.ResourceInstance.objects.filter(pk__in=related_resourceids).values_list("pk", "graph_id"):
+        graphids[str(resourceid)] = graphid
+
+    relations = []
+    for tile, nodeid, datatype in relation_values:
+        relations.extend(datatype.get_relations(tile, nodeid, graphids))
+    return relations, list(geometry_tileids), geometry_nodeids
+
+
+def _to_csv(value):
+    # a quoted csv field, or an unquoted empty field for null
+    if value is None:
+        return ""
+    if isinstance(value, Json):
+        value = value.dumps(value.adapted)
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
@@ -37,7 +37,7 @@ from arches.app.models.models import GraphModel
 from arches.app.models.system_settings import settings
 from django.core.exceptions import ValidationError
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
-from .format import Writer
+from .format import Writer, ExportFile
 from .format import Reader
 from .format import ResourceImportReporter
 
@@ -47,37 +47,62 @@ class ArchesFileWriter(Writer):
         super(ArchesFileWriter, self).__init__(**kwargs)
 
     def write_resources(self, graph_id=None, resourceinstanceids=None, **kwargs):
-        super(ArchesFileWriter, self).write_resources(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
-
-        json_for_export = []
-        resources = []
-        relations = []
-        export = {}
-        export["business_data"] = {}
+        """
+        Writes the resources to a file one resource at a time, see Writer.iter_resource_tiles
 
-        for resourceinstanceid, tiles in self.resourceinstances.items():
-            resourceinstanceid = uuid.UUID(str(resourceinstanceid))
-            resource = {}
-            resource["tiles"] = tiles
-            resource["resourceinstance"] = ResourceInstance.objects.get(resourceinstanceid=resourceinstanceid)
-            resources.append(resource)
+        """
 
-        export["business_data"]["resources"] = resources
+        indent = kwargs.get("indent", None)
+        dest = ExportFile()
+        # the resources are written into the same layout json.dump would give the whole export
+        if indent is None:
+            newline, separator = "", ", "
+        else:
+            newline, separator = "\n", ",\n"
+            indent = " " * indent if isinstance(indent, int) else indent
+
+        resource_count = 0
+        for resourceinstanceid, tiles in self.iter_resource_tiles(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs):
+            if resource_count == 0:
+                dest.write("{" + newline + self._indent('"business_data": {', indent, 1) + newline)
+                dest.write(self._indent('"resources": [', indent, 2) + newline)
+            else:
+                dest.write(separator)
+            resource = {"tiles": tiles, "resourceinstance": tiles[0].resourceinstance}
+            resource = JSONDeserializer().deserialize(JSONSerializer().serialize(JSONSerializer().serializeToPython(resource)))
+            dest.write(self._indent(json.dumps(resource, indent=indent), indent, 3))
+            resource_count += 1
+
+        if resource_count == 0:
+            json.dump({"business_data": {"resources": []}}, dest, indent=indent)
+        else:
+            dest.write(newline + self._indent("]", indent, 2) + newline + self._indent("}", indent, 1) + newline + "}")
 
         if str(self.graph_id) != settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID:
             json_name = os.path.join("{0}.{1}".format(self.file_name, "json"))
         else:
             json_name = os.path.join("{0}".format(os.path.basename(settings.SYSTEM_SETTINGS_LOCAL_PATH)))
 
-        dest = StringIO()
-        export = JSONDeserializer().deserialize(JSONSerializer().serialize(JSONSerializer().serializeToPython(export)))
-        json.dump(export, dest, indent=kwargs.get("indent", None))
-        json_for_export.append({"name": json_name, "outputfile": dest})
+        return [{"name": json_name, "outputfile": dest}]
 
-        return json_for_export
+    def _indent(self, text, indent, level):
+        if indent is None:
+            return text
+        return "\n".join(indent * level + line for line in text.split("\n"))
 
 
 class ArchesFileReader(Reader):
+    def __init__(self):
+        super(ArchesFileReader, self).__init__()
+        # graph id -> whether the graph exists, so that each graph is only looked up once by a reader
+        self.graph_cache = {}
+
+    def graph_exists(self, graphid):
+        graphid = str(graphid)
+        if graphid not in self.graph_cache:
+            self.graph_cache[graphid] = GraphModel.objects.filter(graphid=graphid).exists()
+        return self.graph_cache[graphid]
+
     def pre_import(self, tile, graph_id):
         for function in self.get_function_class_instances(tile, graph_id):
             try:
@@ -130,11 +155,14 @@ class ArchesFileReader(Reader):
             tile["data"] = new_data
         return tiles
 
-    def import_business_data_without_mapping(self, business_data, reporter, overwrite="append", prevent_indexing=False):
+    def import_business_data_without_mapping(
+        self, business_data, reporter, overwrite="append", prevent_indexing=False, transaction_id=None, bulk=False
+    ):
         errors = []
+        resources = []
         for resource in business_data["resources"]:
             if resource["resourceinstance"] is not None:
-                if GraphModel.objects.filter(graphid=str(resource["resourceinstance"]["graph_id"])).count() > 0:
+                if self.graph_exists(resource["resourceinstance"]["graph_id"]):
                     resourceinstanceid = uuid.UUID(str(resource["resourceinstance"]["resourceinstanceid"]))
                     defaults = {
                         "graph_id": uuid.UUID(str(resource["resourceinstance"]["graph_id"])),
@@ -142,7 +170,7 @@ class ArchesFileReader(Reader):
                     }
                     new_values = {"resourceinstanceid": resourceinstanceid, "createdtime": datetime.datetime.now()}
                     new_values.update(defaults)
-                    if overwrite == "overwrite":
+                    if overwrite == "overwrite" or bulk:
                         resourceinstance = Resource(**new_values)
                     else:
                         try:
@@ -166,7 +194,7 @@ class ArchesFileReader(Reader):
                             }
                             new_values = {"tileid": uuid.UUID(str(src_tile["tileid"]))}
                             new_values.update(defaults)
-                            if overwrite == "overwrite":
+                            if overwrite == "overwrite" or bulk:
                                 tile = Tile(**new_values)
                             else:
                                 try:
@@ -188,8 +216,15 @@ class ArchesFileReader(Reader):
                         for tile in [k for k in resource["tiles"] if k["parenttile_id"] is None]:
                             update_or_create_tile(tile)
 
-                    resourceinstance.save(index=(not prevent_indexing))
-                    reporter.update_resources_saved()
+                    if bulk:
+                        resources.append(resourceinstance)
+                    else:
+                        resourceinstance.save(index=(not prevent_indexing), transaction_id=transaction_id)
+                        reporter.update_resources_saved()
+
+        if len(resources) > 0:
+            self.bulk_save(resources, transaction_id=transaction_id, prevent_indexing=prevent_indexing)
+            reporter.update_resources_saved(len(resources))
 
     def get_blank_tile(self, sourcetilegroup, blanktilecache, tiles, resourceinstanceid):
         if len(sourcetilegroup[0]["data"]) > 0:
@@ -209,12 +244,49 @@ class ArchesFileReader(Reader):
             blank_tile = None
         return blank_tile
 
-    def import_business_data(self, business_data, mapping=None, overwrite="append", prevent_indexing=False, transaction_id=None):
-        reporter = ResourceImportReporter(business_data)
+    def import_business_data(
+        self,
+        business_data,
+        mapping=None,
+        overwrite="append",
+        prevent_indexing=False,
+        transaction_id=None,
+        bulk=False,
+        reporter=None,
+        copy=False,
+    ):
+        """
+        Imports the resources of a business data dict ({"resources": [...]})
+
+        Keyword Arguments:
+        mapping -- a mapping (the contents of a .mapping file) used to map the nodes of the resources to the nodes of another graph
+        overwrite -- "overwrite" to replace resources with the same id, or "append" to add tiles to them
+        prevent_indexing -- True to save the resources without indexing them
+        transaction_id -- the id of the import, recorded in the edit log
+        bulk -- True to save the resources with Resource.bulk_save, the resources must not exist yet
+        reporter -- a ResourceImportReporter to record the counts of saved resources and tiles in,
+            if passed in the caller reports the results
+        copy -- True to save the resources in bulk with COPY statements (see copy_loader), the resources must not exist yet
+
+        """
+
+        self.copy = copy
+        bulk = bulk or copy
+        report_results = reporter is None
+        if reporter is None:
+            reporter = ResourceImportReporter(business_data)
         try:
             if mapping is None or mapping == "":
-                self.import_business_data_without_mapping(business_data, reporter, overwrite=overwrite, prevent_indexing=prevent_indexing)
+                self.import_business_data_without_mapping(
+                    business_data,
+                    reporter,
+                    overwrite=overwrite,
+                    prevent_indexing=prevent_indexing,
+                    transaction_id=transaction_id,
+                    bulk=bulk,
+                )
             else:
+                resources = []
                 blanktilecache = {}
                 target_nodegroup_cardinalities = {}
                 for nodegroup in JSONSerializer().serializeToPython(NodeGroup.objects.all()):
@@ -352,14 +424,22 @@ class ArchesFileReader(Reader):
                         createdtime=datetime.datetime.now(),
                     )
                     newresourceinstance.tiles = populated_tiles
-                    newresourceinstance.save(index=(not prevent_indexing), transaction_id=transaction_id)
-                    reporter.update_resources_saved()
+                    if bulk:
+                        resources.append(newresourceinstance)
+                    else:
+                        newresourceinstance.save(index=(not prevent_indexing), transaction_id=transaction_id)
+                        reporter.update_resources_saved()
+
+                if len(resources) > 0:
+                    self.bulk_save(resources, transaction_id=transaction_id, prevent_indexing=prevent_indexing)
+                    reporter.update_resources_saved(len(resources))
 
         except (KeyError, TypeError) as e:
             print(e)
 
         finally:
-            reporter.report_results()
+            if report_results:
+                reporter.report_results()
 
     def import_all(self):
         errors = []
@@ -10,7 +10,7 @@ import logging
 from time import time
 from copy import deepcopy
 from io import StringIO
-from .format import Writer
+from .format import Writer, ExportFile
 from .format import Reader
 from elasticsearch import TransportError
 from arches.app.models.tile import Tile
@@ -117,12 +117,14 @@ class CsvWriter(Writer):
         return value
 
     def write_resources(self, graph_id=None, resourceinstanceids=None, **kwargs):
+        """
+        Writes the resources to csv files one resource at a time, see Writer.iter_resource_tiles
+
+        """
+
         # use the graph id from the mapping file, not the one passed in to the method
         graph_id = self.resource_export_configs[0]["resource_model_id"]
-        super(CsvWriter, self).write_resources(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
 
-        csv_records = []
-        other_group_records = []
         mapping = {}
         concept_export_value_lookup = {}
         for resource_export_config in self.resource_export_configs:
@@ -132,106 +134,81 @@ class CsvWriter(Writer):
                 if "concept_export_value" in node:
                     concept_export_value_lookup[node["arches_nodeid"]] = node["concept_export_value"]
         csv_header = ["ResourceID"] + list(mapping.values())
-        csvs_for_export = []
-
-        for resourceinstanceid, tiles in self.resourceinstances.items():
-            csv_record = {}
-            csv_record["ResourceID"] = resourceinstanceid
-            csv_record["populated_node_groups"] = []
-
-            try:
-                parents = [p for p in tiles if p.parenttile_id is None]
-                children = [c for c in tiles if c.parenttile_id is not None]
-                tiles = parents + sorted(children, key=lambda k: k.parenttile_id)
-            except Exception as e:
-                logger.exception(e)
-
-            for tile in tiles:
-                other_group_record = {}
-                other_group_record["ResourceID"] = resourceinstanceid
-                if tile.data != {}:
-                    for k in list(tile.data.keys()):
-                        if tile.data[k] != "" and k in mapping and tile.data[k] is not None:
-                            if mapping[k] not in csv_record and tile.nodegroup_id not in csv_record["populated_node_groups"]:
-                                concept_export_value_type = None
-                                if k in concept_export_value_lookup:
-                                    concept_export_value_type = concept_export_value_lookup[k]
-                                if tile.data[k] is not None:
-                                    value = self.transform_value_for_export(
-                                        self.node_datatypes[k], tile.data[k], concept_export_value_type, k
-                                    )
-                                    csv_record[mapping[k]] = value
-                                del tile.data[k]
-                            else:
-                                concept_export_value_type = None
-                                if k in concept_export_value_lookup:
-                                    concept_export_value_type = concept_export_value_lookup[k]
-                                value = self.transform_value_for_export(
-                                    self.node_datatypes[k],
-                                    tile.data[k],
-                                    concept_export_value_type,
-                                    k,
-                                )
-                                other_group_record[mapping[k]] = value
-                        else:
-                            del tile.data[k]
-
-                    csv_record["populated_node_groups"].append(tile.nodegroup_id)
 
-                if other_group_record != {"ResourceID": resourceinstanceid}:
-                    other_group_records.append(other_group_record)
+        dest = ExportFile()
+        csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
+        csvwriter.writeheader()
+        if self.single_file is not True:
+            group_dest = ExportFile()
+            group_csvwriter = csv.DictWriter(group_dest, delimiter=",", fieldnames=csv_header)
+            group_csvwriter.writeheader()
+        else:
+            # the records of each resource are written together, as the resources are read in order of their ids
+            group_csvwriter = csvwriter
 
-            if csv_record != {"ResourceID": resourceinstanceid}:
-                csv_records.append(csv_record)
+        for resourceinstanceid, tiles in self.iter_resource_tiles(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs):
+            csv_record, other_group_records = self.get_resource_records(resourceinstanceid, tiles, mapping, concept_export_value_lookup)
+            csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
+            for other_group_record in other_group_records:
+                group_csvwriter.writerow({k: str(v) for k, v in list(other_group_record.items())})
 
         csv_name = os.path.join("{0}.{1}".format(self.file_name, "csv"))
-
+        csvs_for_export = [{"name": csv_name, "outputfile": dest}]
         if self.single_file is not True:
-            dest = StringIO()
-            csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-            csvwriter.writeheader()
-            csvs_for_export.append({"name": csv_name, "outputfile": dest})
-            for csv_record in csv_records:
-                if "populated_node_groups" in csv_record:
-                    del csv_record["populated_node_groups"]
-                csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
-
-            dest = StringIO()
-            csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-            csvwriter.writeheader()
-            csvs_for_export.append(
-                {
-                    "name": csv_name.split(".")[0] + "_groups." + csv_name.split(".")[1],
-                    "outputfile": dest,
-                }
-            )
-            for csv_record in other_group_records:
-                if "populated_node_groups" in csv_record:
-                    del csv_record["populated_node_groups"]
-                csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
-        elif self.single_file == True:
-            all_records = csv_records + other_group_records
-            all_records = sorted(all_records, key=lambda k: k["ResourceID"])
-            dest = StringIO()
-            csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-            csvwriter.writeheader()
-            csvs_for_export.append({"name": csv_name, "outputfile": dest})
-            for csv_record in all_records:
-                if "populated_node_groups" in csv_record:
-                    del csv_record["populated_node_groups"]
-                csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
+            csvs_for_export.append({"name": csv_name.split(".")[0] + "_groups." + csv_name.split(".")[1], "outputfile": group_dest})
 
         if self.graph_id is not None:
             csvs_for_export = csvs_for_export + self.write_resource_relations(file_name=self.file_name)
 
         return csvs_for_export
 
+    def get_resource_records(self, resourceinstanceid, tiles, mapping, concept_export_value_lookup):
+        """
+        Returns the csv record of a resource and a list of records for the values of
+        any additional tiles of nodegroups that already have values in the resource's record
+
+        """
+
+        csv_record = {}
+        csv_record["ResourceID"] = resourceinstanceid
+        populated_node_groups = []
+        other_group_records = []
+
+        try:
+            parents = [p for p in tiles if p.parenttile_id is None]
+            children = [c for c in tiles if c.parenttile_id is not None]
+            tiles = parents + sorted(children, key=lambda k: k.parenttile_id)
+        except Exception as e:
+            logger.exception(e)
+
+        for tile in tiles:
+            other_group_record = {}
+            other_group_record["ResourceID"] = resourceinstanceid
+            if tile.data != {}:
+                for k in list(tile.data.keys()):
+                    if tile.data[k] != "" and k in mapping and tile.data[k] is not None:
+                        concept_export_value_type = concept_export_value_lookup.get(k, None)
+                        value = self.transform_value_for_export(self.node_datatypes[k], tile.data[k], concept_export_value_type, k)
+                        if mapping[k] not in csv_record and tile.nodegroup_id not in populated_node_groups:
+                            csv_record[mapping[k]] = value
+                            del tile.data[k]
+                        else:
+                            other_group_record[mapping[k]] = value
+                    else:
+                        del tile.data[k]
+
+                populated_node_groups.append(tile.nodegroup_id)
+
+            if other_group_record != {"ResourceID": resourceinstanceid}:
+                other_group_records.append(other_group_record)
+
+        return csv_record, other_group_records
+
     def write_resource_relations(self, file_name):
-        resourceids = list(self.resourceinstances.keys())
         relations_file = []
 
         if self.graph_id != settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID:
-            dest = StringIO()
+            dest = ExportFile()
             csv_header = [
                 "resourcexid",
                 "resourceinstanceidfrom",
@@ -250,10 +227,11 @@ class CsvWriter(Writer):
             csv_name = os.path.join("{0}.{1}".format(file_name, "relations"))
             relations_file.append({"name": csv_name, "outputfile": dest})
 
+            resourceids = self.tiles.order_by().values("resourceinstance_id")
             relations = ResourceXResource.objects.filter(
                 Q(resourceinstanceidfrom__in=resourceids) | Q(resourceinstanceidto__in=resourceids), tileid__isnull=True
             ).values(*csv_header)
-            for relation in relations:
+            for relation in relations.iterator(chunk_size=settings.BULK_IMPORT_BATCH_SIZE):
                 relation["datestarted"] = relation["datestarted"] if relation["datestarted"] is not None else ""
                 relation["dateended"] = relation["dateended"] if relation["dateended"] is not None else ""
                 relation["notes"] = relation["notes"] if relation["notes"] is not None else ""
@@ -409,7 +387,7 @@ class CsvReader(Reader):
             if bulk:
                 resources.append(newresourceinstance)
                 if len(resources) >= settings.BULK_IMPORT_BATCH_SIZE:
-                    Resource.bulk_save(resources=resources, transaction_id=transaction_id)
+                    self.bulk_save(resources, transaction_id=transaction_id, prevent_indexing=prevent_indexing)
                     del resources[:]  # clear out the array
             else:
                 try:
@@ -463,9 +441,13 @@ class CsvReader(Reader):
         create_collections=False,
         prevent_indexing=False,
         transaction_id=None,
+        copy=False,
     ):
         # errors = businessDataValidator(self.business_data)
         celery_worker_running = task_management.check_if_celery_available()
+        # copying is a way of bulk saving
+        self.copy = copy
+        bulk = bulk or copy
 
         print("Starting import of business data")
         self.start = time()
@@ -1127,7 +1109,7 @@ class CsvReader(Reader):
 
                 if bulk:
                     print("Time to create resource and tile objects: %s" % datetime.timedelta(seconds=time() - self.start))
-                    Resource.bulk_save(resources=resources, transaction_id=transaction_id)
+                    self.bulk_save(resources, transaction_id=transaction_id, prevent_indexing=prevent_indexing)
                 save_count = save_count + 1
                 print(_("Total resources saved: {save_count}").format(**locals()))
 
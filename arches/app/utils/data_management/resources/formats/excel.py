@@ -26,6 +26,7 @@ class ExcelWriter(TileCsvWriter):
             ws = wb.create_sheet(title=csv_file_name)
             for row in csv.reader(csv_file["outputfile"].getvalue().split("\r\n")):
                 ws.append(row)
+            csv_file["outputfile"].close()
         # delete default blank first sheet in workbook
         del wb["Sheet"]
 
@@ -1,13 +1,16 @@
+import io
 import os
 import uuid
 import shutil
 import datetime
+from tempfile import TemporaryFile
 from arches.app.models.concept import Concept
 from arches.app.models import models
 from arches.app.models.models import ResourceXResource
 from arches.app.models.resource import Resource
 from arches.app.models.system_settings import settings
 from arches.app.utils.betterJSONSerializer import JSONSerializer
+from arches.app.utils.data_management.resources import copy_loader
 from arches.app.utils.permission_backend import get_nodegroups_by_perm
 from arches.app.datatypes.datatypes import DataTypeFactory
 from django.contrib.gis.geos import GEOSGeometry
@@ -56,6 +59,19 @@ class ResourceImportReporter:
         self.relations_saved += count
         print(_("{0} of {1} relations saved".format(self.relations_saved, self.relations)))
 
+    def merge(self, reporter):
+        """
+        Adds the counts of another reporter, for example one used by an import worker process, to this reporter
+
+        """
+
+        self.resources += reporter.resources
+        self.total_tiles += reporter.total_tiles
+        self.resources_saved += reporter.resources_saved
+        self.tiles_saved += reporter.tiles_saved
+        self.relations += reporter.relations
+        self.relations_saved += reporter.relations_saved
+
     def report_results(self):
         if self.resources > 0:
             result = "Resources for Import: {0}, Resources Saved: {1}, Tiles for Import: {2}, Tiles Saved: {3}, Relations for Import: {4}, Relations Saved: {5}"
@@ -70,6 +86,28 @@ class Reader(object):
     def __init__(self):
         self.errors = []
         self.datatype_factory = DataTypeFactory()
+        # True to save resources in bulk with COPY statements (see copy_loader) rather than with Resource.bulk_save
+        self.copy = False
+
+    def bulk_save(self, resources, transaction_id=None, prevent_indexing=False):
+        """
+        Saves a list of new resources in bulk, with COPY statements if the reader's copy attribute is True
+
+        Arguments:
+        resources -- a list of unsaved resources
+
+        Keyword Arguments:
+        transaction_id -- the id of the import, recorded in the edit log
+        prevent_indexing -- True to save the resources without indexing them, only when copying
+
+        """
+
+        if self.copy:
+            copy_loader.copy_resources(
+                resources, transaction_id=transaction_id, index=(not prevent_indexing), datatype_factory=self.datatype_factory
+            )
+        else:
+            Resource.bulk_save(resources=resources, transaction_id=transaction_id)
 
     def validate_datatypes(self, record):
         pass
@@ -216,6 +254,28 @@ class Reader(object):
                     f.write(timestamp + " " + e + str(error))
 
 
+class ExportFile(io.TextIOWrapper):
+    """
+    A temporary text file that an export is written to, so that exports are never held in memory whole
+
+    getvalue returns the whole export (like StringIO.getvalue) for callers that need it in memory.
+    Whoever writes the export out (to a response, a zip file or a file on disk) closes the file once it's done,
+    either with close or by using it as a context manager, which removes the temporary file
+
+    """
+
+    def __init__(self):
+        super(ExportFile, self).__init__(TemporaryFile(), encoding="utf-8", newline="")
+
+    def getvalue(self):
+        self.flush()
+        position = self.tell()
+        self.seek(0)
+        value = self.read()
+        self.seek(position)
+        return value
+
+
 class Writer(object):
     def __init__(self, **kwargs):
         self.resourceinstances = {}
@@ -230,7 +290,7 @@ class Writer(object):
         """
         Returns a list of dictionaries with the following format:
 
-        {'name':file name, 'outputfile': a SringIO buffer of resource instance data in the specified format}
+        {'name':file name, 'outputfile': a file like object (a StringIO buffer or an ExportFile) of resource instance data in the specified format}
 
         """
 
@@ -246,14 +306,10 @@ class Writer(object):
 
         pass
 
-    def get_tiles(self, graph_id=None, resourceinstanceids=None, **kwargs):
+    def get_tile_queryset(self, graph_id=None, resourceinstanceids=None, **kwargs):
         """
-        Returns a dictionary of tiles keyed by their resourceinstanceid
-
-        {
-            'resourcs instance UUID': [tile list],
-            ...
-        }
+        Returns a queryset of the tiles to export (limited to the nodegroups the user, if given, can read)
+        and sets the graph and file name of the export
 
         """
 
@@ -269,15 +325,15 @@ class Writer(object):
             filters = {"resourceinstance__graph_id": graph_id}
             if user:
                 filters["nodegroup_id__in"] = permitted_nodegroups
-            self.tiles = models.TileModel.objects.filter(**filters)
+            tiles = models.TileModel.objects.filter(**filters)
             self.graph_id = graph_id
         else:
             filters = {"resourceinstance_id__in": resourceinstanceids}
             if user:
                 filters["nodegroup_id__in"] = permitted_nodegroups
-            self.tiles = models.TileModel.objects.filter(**filters)
+            tiles = models.TileModel.objects.filter(**filters)
             try:
-                self.graph_id = self.tiles[0].resourceinstance.graph_id
+                self.graph_id = tiles[0].resourceinstance.graph_id
             except:
                 self.graph_id = models.ResourceInstance.objects.get(resourceinstanceid=resourceinstanceids[0]).graph_id
 
@@ -286,6 +342,21 @@ class Writer(object):
         self.file_prefix = self.graph_model.name.replace(" ", "_")
         self.file_name = "{0}_{1}".format(self.file_prefix, iso_date)
 
+        return tiles
+
+    def get_tiles(self, graph_id=None, resourceinstanceids=None, **kwargs):
+        """
+        Returns a dictionary of tiles keyed by their resourceinstanceid
+
+        {
+            'resourcs instance UUID': [tile list],
+            ...
+        }
+
+        """
+
+        self.tiles = self.get_tile_queryset(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+
         for tile in self.tiles:
             try:
                 self.resourceinstances[tile.resourceinstance_id].append(tile)
@@ -294,3 +365,28 @@ class Writer(object):
                 self.resourceinstances[tile.resourceinstance_id].append(tile)
 
         return self.resourceinstances
+
+    def iter_resource_tiles(self, graph_id=None, resourceinstanceids=None, **kwargs):
+        """
+        Yields a (resourceinstanceid, tile list) tuple for each resource to export, one resource at a time
+
+        The tiles are read in resource order through a server side cursor,
+        so only the tiles of a single resource are ever held in memory
+        The resource instance and nodegroup of each tile are loaded along with the tile
+
+        """
+
+        self.tiles = self.get_tile_queryset(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+        tiles = self.tiles.select_related("resourceinstance", "nodegroup").order_by("resourceinstance_id")
+
+        resourceinstanceid = None
+        resource_tiles = []
+        for tile in tiles.iterator(chunk_size=settings.BULK_IMPORT_BATCH_SIZE):
+            if tile.resourceinstance_id != resourceinstanceid:
+                if len(resource_tiles) > 0:
+                    yield resourceinstanceid, resource_tiles
+                resourceinstanceid = tile.resourceinstance_id
+                resource_tiles = []
+            resource_tiles.append(tile)
+        if len(resource_tiles) > 0:
+            yield resourceinstanceid, resource_tiles
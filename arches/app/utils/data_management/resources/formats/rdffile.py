@@ -7,7 +7,7 @@ import datetime
 import logging
 from io import StringIO
 from django.urls import reverse
-from .format import Writer, Reader
+from .format import Writer, Reader, ExportFile
 from arches.app.models import models
 from arches.app.models.resource import Resource
 from arches.app.models.graph import Graph as GraphProxy
@@ -59,6 +59,7 @@ class RdfWriter(Writer):
     def __init__(self, **kwargs):
         self.format = kwargs.pop("format", "xml")
         self.logger = logging.getLogger(__name__)
+        self.graph_cache = {}
         super(RdfWriter, self).__init__(**kwargs)
 
     def write_resources(self, graph_id=None, resourceinstanceids=None, **kwargs):
@@ -71,7 +72,14 @@ class RdfWriter(Writer):
         full_file_name = os.path.join("{0}.{1}".format(self.file_name, "rdf"))
         return [{"name": full_file_name, "outputfile": dest}]
 
-    def get_rdf_graph(self):
+    def get_rdf_graph(self, resourceinstances=None):
+        """
+        Returns an rdf graph of a dictionary of tile lists keyed by resource instance id, defaults to the tiles loaded by get_tiles
+
+        """
+
+        if resourceinstances is None:
+            resourceinstances = self.resourceinstances
         archesproject = Namespace(settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT)
         graph_uri = URIRef(archesproject[reverse("graph", args=[self.graph_id]).lstrip("/")])
         self.logger.debug("Using `{0}` for Arches URI namespace".format(settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT))
@@ -79,7 +87,7 @@ class RdfWriter(Writer):
 
         g = Graph()
         g.bind("archesproject", archesproject, False)
-        graph_cache = {}
+        graph_cache = self.graph_cache
 
         def get_nodegroup_edges_by_collector_node(node):
             edges = []
@@ -188,7 +196,7 @@ class RdfWriter(Writer):
                 # both are single, 1 * 1
                 graph += rng_dt.to_rdf(pkg, edge)
 
-        for resourceinstanceid, tiles in self.resourceinstances.items():
+        for resourceinstanceid, tiles in resourceinstances.items():
             graph_info = get_graph_parts(self.graph_id)
 
             # add the edges for the group of nodes that include the root (this group of nodes has no nodegroup)
@@ -229,15 +237,23 @@ class JsonLdWriter(RdfWriter):
     def build_json(self, graph_id=None, resourceinstanceids=None, **kwargs):
         # Build the JSON separately serializing it, so we can use internally
         super(RdfWriter, self).write_resources(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
-        g = self.get_rdf_graph()
+
+        assert len(resourceinstanceids) == 1  # currently, this should be limited to a single top resource
+
+        return self.frame_json(self.get_rdf_graph(), resourceinstanceids[0])
+
+    def frame_json(self, g, resourceinstanceid):
+        """
+        Returns the json-ld document of a resource from an rdf graph of the resource
+
+        """
+
         value = g.serialize(format="nquads").decode("utf-8")
 
         js = from_rdf(value, {"format": "application/nquads", "useNativeTypes": True})
 
-        assert len(resourceinstanceids) == 1  # currently, this should be limited to a single top resource
-
         archesproject = Namespace(settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT)
-        resource_inst_uri = archesproject[reverse("resources", args=[resourceinstanceids[0]]).lstrip("/")]
+        resource_inst_uri = archesproject[reverse("resources", args=[resourceinstanceid]).lstrip("/")]
 
         context = self.graph_model.jsonldcontext
         framing = {"@omitDefault": True, "@omitGraph": False, "@id": str(resource_inst_uri)}
@@ -266,10 +282,22 @@ class JsonLdWriter(RdfWriter):
         return js
 
     def write_resources(self, graph_id=None, resourceinstanceids=None, **kwargs):
-        js = self.build_json(graph_id, resourceinstanceids, **kwargs)
-        out = json.dumps(js, indent=kwargs.get("indent", None), sort_keys=True)
-        dest = StringIO(out)
-        full_file_name = os.path.join("{0}.{1}".format(self.file_name, "jsonld"))
+        """
+        Writes a single resource as a json-ld document, or several resources (or a graph's resources)
+        as json lines, one json-ld document per line, written one resource at a time (see Writer.iter_resource_tiles)
+
+        """
+
+        dest = ExportFile()
+        if resourceinstanceids is not None and len(resourceinstanceids) == 1:
+            js = self.build_json(graph_id, resourceinstanceids, **kwargs)
+            json.dump(js, dest, indent=kwargs.get("indent", None), sort_keys=True)
+            full_file_name = os.path.join("{0}.{1}".format(self.file_name, "jsonld"))
+        else:
+            for resourceinstanceid, tiles in self.iter_resource_tiles(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs):
+                js = self.frame_json(self.get_rdf_graph({resourceinstanceid: tiles}), str(resourceinstanceid))
+                dest.write(json.dumps(js, sort_keys=True) + "\n")
+            full_file_name = os.path.join("{0}.{1}".format(self.file_name, "jsonl"))
         return [{"name": full_file_name, "outputfile": dest}]
 
 
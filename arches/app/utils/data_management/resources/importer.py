@@ -7,6 +7,7 @@ import importlib
 import datetime
 import logging
 from io import StringIO
+from contextlib import nullcontext
 from time import time
 from copy import deepcopy
 from optparse import make_option
@@ -20,26 +21,194 @@ import django
 # during a resource load that uses multiprocessing.
 # see https://stackoverflow.com/a/49461944/3873885
 django.setup()
-from django.db import connection, connections
+from django.db import connection, connections, transaction
 from django.contrib.gis.gdal import DataSource
+from django.forms.models import model_to_dict
 from arches.app.datatypes.datatypes import DataTypeFactory
-from arches.app.models.models import DDataType, ResourceXResource, ResourceInstance
+from arches.app.models.models import DDataType, EditLog, Node, ResourceXResource, ResourceInstance
 from arches.app.models.system_settings import settings
+from arches.app.search.mappings import RESOURCE_RELATIONS_INDEX
+from arches.app.search.search_engine_factory import SearchEngineInstance as se
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
+from arches.app.utils import edit_log
+from arches.app.utils.edit_log import EditLogWriter
 from arches.setup import unzip_file
 from .formats.csvfile import CsvReader
 from .formats.archesfile import ArchesFileReader
+from .formats.format import ResourceImportReporter
+from . import copy_loader
+from .copy_loader import CopyLoader
 import ctypes
 
 
-def import_one_resource(line, prevent_indexing=False):
-    """this single resource import function must be outside of the BusinessDataImporter
-    class in order for it to be called with multiprocessing"""
+def read_jsonl_chunks(path, chunk_size):
+    """
+    Reads a jsonl file lazily, yields tuples of the line number of the first line of a chunk and the chunk's (non blank) lines
+
+    Arguments:
+    path -- the path of the jsonl file
+    chunk_size -- the number of lines in each chunk
+
+    """
+
+    with open(path, "r", encoding="utf-8") as openf:
+        first_line = 1
+        lines = []
+        for line_number, line in enumerate(openf, 1):
+            if line.strip() == "":
+                continue
+            if len(lines) == 0:
+                first_line = line_number
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                yield first_line, lines
+                lines = []
+        if len(lines) > 0:
+            yield first_line, lines
+
+
+def update_relation_graphids(batch_size=None, index=True):
+    """
+    Fills in the graph ids of the resources of relations that were unavailable when the relations were saved
+    (the related resource hadn't been loaded yet for example), returns the number of relations updated
+
+    The relations are updated with an UPDATE ... FROM statement joined to the resource instances, a batch at a time
+    so that huge tables aren't locked in a single transaction, relations whose resources still don't exist are left as they are
+
+    Keyword Arguments:
+    batch_size -- the number of relations to check at a time, defaults to settings.BULK_IMPORT_BATCH_SIZE
+    index -- False to update the relations without reindexing them
+
+    """
+
+    batch_size = settings.BULK_IMPORT_BATCH_SIZE if batch_size is None else batch_size
+    last_resourcexid = None
+    count = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    WITH batch AS (
+                        SELECT x.resourcexid, r_from.graphid AS from_graphid, r_to.graphid AS to_graphid
+                        FROM resource_x_resource x
+                            LEFT JOIN resource_instances r_from ON r_from.resourceinstanceid = x.resourceinstanceidfrom
+                            LEFT JOIN resource_instances r_to ON r_to.resourceinstanceid = x.resourceinstanceidto
+                        WHERE (x.resourceinstanceto_graphid IS NULL OR x.resourceinstancefrom_graphid IS NULL)
+                            AND (%(last)s::uuid IS NULL OR x.resourcexid > %(last)s::uuid)
+                        ORDER BY x.resourcexid
+                        LIMIT %(batch_size)s
+                    ), updated AS (
+                        UPDATE resource_x_resource x
+                        SET resourceinstancefrom_graphid = COALESCE(x.resourceinstancefrom_graphid, batch.from_graphid),
+                            resourceinstanceto_graphid = COALESCE(x.resourceinstanceto_graphid, batch.to_graphid),
+                            modified = now()
+                        FROM batch
+                        WHERE x.resourcexid = batch.resourcexid
+                            AND ((x.resourceinstancefrom_graphid IS NULL AND batch.from_graphid IS NOT NULL)
+                            OR (x.resourceinstanceto_graphid IS NULL AND batch.to_graphid IS NOT NULL))
+                        RETURNING x.resourcexid
+                    )
+                    SELECT (SELECT resourcexid FROM batch ORDER BY resourcexid DESC LIMIT 1), ARRAY(SELECT resourcexid FROM updated)
+                    """,
+                    {"last": last_resourcexid, "batch_size": batch_size},
+                )
+                last_resourcexid, updated = cursor.fetchone()
+        if last_resourcexid is None:
+            break
+        count += len(updated)
+        if index and len(updated) > 0:
+            with se.BulkIndexer(batch_size=batch_size) as indexer:
+                for relation in ResourceXResource.objects.filter(pk__in=updated):
+                    indexer.add(index=RESOURCE_RELATIONS_INDEX, id=relation.resourcexid, data=model_to_dict(relation))
+    return count
+
+
+def get_imported_datatypes(transaction_id):
+    """
+    Returns the set of the datatypes of the nodes of the graphs of the resources saved in an import
+
+    Arguments:
+    transaction_id -- the transaction id the import's edits were logged with
+
+    """
+
+    graphids = EditLog.objects.filter(transactionid=transaction_id).values_list("resourceclassid", flat=True).distinct()
+    return set(Node.objects.filter(graph_id__in=[graphid for graphid in graphids if graphid]).values_list("datatype", flat=True).distinct())
+
+
+def import_jsonl_chunk(reader, chunk, overwrite="append", prevent_indexing=False, transaction_id=None, bulk=False, copy=False):
+    """
+    Imports a chunk of a jsonl file in a single transaction, if any of its resources can't be imported none of them are
+    and the error is added to reader.errors, returns a ResourceImportReporter with the counts of the chunk's resources and tiles
+
+    Arguments:
+    reader -- the ArchesFileReader to import the resources with
+    chunk -- a tuple of the line number of the chunk's first line and the chunk's lines (see read_jsonl_chunks)
+
+    Keyword Arguments:
+    overwrite -- "overwrite" to replace resources with the same id, or "append" to add tiles to them
+    prevent_indexing -- True to save the resources without indexing them
+    transaction_id -- the id of the import, recorded in the edit log
+    bulk -- True to save the resources with Resource.bulk_save, the resources must not exist yet
+    copy -- True to save the resources in bulk with COPY statements (see copy_loader), the resources must not exist yet
+
+    """
+
+    first_line, lines = chunk
+    reporter = ResourceImportReporter({"resources": lines})
+    try:
+        with transaction.atomic(), EditLogWriter(atomic=True):
+            reader.import_business_data(
+                {"resources": [JSONDeserializer().deserialize(line) for line in lines]},
+                overwrite=overwrite,
+                prevent_indexing=prevent_indexing,
+                transaction_id=transaction_id,
+                bulk=bulk,
+                reporter=reporter,
+                copy=copy,
+            )
+    except Exception as e:
+        reporter.resources_saved = 0
+        reporter.tiles_saved = 0
+        reader.errors.append(
+            {"type": "ERROR", "message": "Lines {0} to {1} were not imported: {2}".format(first_line, first_line + len(lines) - 1, e)}
+        )
+    return reporter
+
+
+_import_worker = {}
+
+
+def _init_import_worker(options):
+    """
+    Initializes a jsonl import worker process with its own database connection and a reader
+    that is kept (with the graphs it has looked up) for every chunk the worker imports, the worker
+    doesn't inherit its parent's edit log writers or copy loaders, which only exit in the parent
+
+    """
 
     connections.close_all()
-    reader = ArchesFileReader()
-    archesresource = JSONDeserializer().deserialize(line)
-    reader.import_business_data({"resources": [archesresource]}, prevent_indexing=prevent_indexing)
+    edit_log.reset()
+    copy_loader.reset()
+    _import_worker["reader"] = ArchesFileReader()
+    _import_worker["options"] = options
+
+
+def _import_jsonl_chunk(chunk):
+    """
+    Imports a chunk of a jsonl file in a worker process, the chunk's edit log records are written before it returns,
+    returns a tuple of the worker's process id, the chunk's ResourceImportReporter, the errors that occurred and
+    the ids of the geometry nodes of the resources copied (for the parent's CopyLoader to refresh, see copy_loader)
+
+    """
+
+    reader = _import_worker["reader"]
+    with EditLogWriter(), CopyLoader(refresh_geometries=False) as loader:
+        reporter = import_jsonl_chunk(reader, chunk, **_import_worker["options"])
+    errors = reader.errors
+    reader.errors = []
+    return os.getpid(), reporter, errors, loader.geometry_nodeids
 
 
 class BusinessDataImporter(object):
@@ -163,84 +332,114 @@ class BusinessDataImporter(object):
         use_multiprocessing=False,
         prevent_indexing=False,
         transaction_id=None,
+        copy=False,
+        defer_db_indexes=False,
     ):
         reader = None
         start = time()
         cursor = connection.cursor()
 
         try:
-            if file_format is None:
-                file_format = self.file_format
-            if business_data is None:
-                business_data = self.business_data
-            if mapping is None:
-                mapping = self.mapping
-            if file_format == "json":
-                reader = ArchesFileReader()
-                reader.import_business_data(
-                    business_data, mapping=mapping, overwrite=overwrite, prevent_indexing=prevent_indexing, transaction_id=transaction_id
-                )
-            elif file_format == "jsonl":
-                with open(self.file[0], "rU") as openf:
-                    lines = openf.readlines()
-                    if use_multiprocessing is True:
-                        pool = Pool(cpu_count())
-                        pool.map(import_one_resource, lines, prevent_indexing=prevent_indexing)
-                        connections.close_all()
-                        reader = ArchesFileReader()
-                    else:
-                        reader = ArchesFileReader()
-                        for line in lines:
-                            archesresource = JSONDeserializer().deserialize(line)
-                            reader.import_business_data(
-                                {"resources": [archesresource]},
-                                overwrite=overwrite,
-                                prevent_indexing=prevent_indexing,
-                                transaction_id=transaction_id,
-                            )
-            elif file_format == "csv" or file_format == "shp" or file_format == "zip":
-                if mapping is not None:
-                    reader = CsvReader()
+            # a CopyLoader refreshes the map clusters of the copied geometries once all the resources are loaded
+            loader = CopyLoader(defer_indexes=defer_db_indexes) if copy else nullcontext()
+            with EditLogWriter(), loader:
+                if file_format is None:
+                    file_format = self.file_format
+                if business_data is None:
+                    business_data = self.business_data
+                if mapping is None:
+                    mapping = self.mapping
+                if file_format == "json":
+                    reader = ArchesFileReader()
                     reader.import_business_data(
-                        business_data=business_data,
+                        business_data,
                         mapping=mapping,
                         overwrite=overwrite,
-                        bulk=bulk,
-                        create_concepts=create_concepts,
-                        create_collections=create_collections,
                         prevent_indexing=prevent_indexing,
                         transaction_id=transaction_id,
+                        copy=copy,
                     )
-                else:
-                    print("*" * 80)
-                    print(
-                        f"ERROR: No mapping file detected for {self.file[0]}. Please indicate one \
-                        with the '-c' paramater or place one in the same directory as your business data."
-                    )
-                    print("*" * 80)
+                elif file_format == "jsonl":
+                    reader = ArchesFileReader()
+                    reporter = ResourceImportReporter({})
+                    options = {
+                        "overwrite": overwrite,
+                        "prevent_indexing": prevent_indexing,
+                        "transaction_id": transaction_id,
+                        "bulk": bulk,
+                        "copy": copy,
+                    }
+                    chunks = read_jsonl_chunks(self.file[0], settings.BULK_IMPORT_BATCH_SIZE)
+                    if use_multiprocessing is True:
+                        # connections can't be shared with forked processes, each worker opens its own
+                        connections.close_all()
+                        worker_counts = {}
+                        # imap_unordered reads the chunks from the file as the workers take them
+                        pool = Pool(cpu_count(), initializer=_init_import_worker, initargs=(options,))
+                        try:
+                            for pid, chunk_reporter, errors, geometry_nodeids in pool.imap_unordered(_import_jsonl_chunk, chunks):
+                                reporter.merge(chunk_reporter)
+                                reader.errors += errors
+                                if copy:
+                                    loader.geometry_nodeids |= geometry_nodeids
+                                worker_counts[pid] = worker_counts.get(pid, 0) + chunk_reporter.resources_saved
+                        except BaseException:
+                            pool.terminate()
+                            raise
+                        else:
+                            # let the workers exit rather than terminating them
+                            pool.close()
+                        finally:
+                            pool.join()
+                        for pid, count in worker_counts.items():
+                            print("Worker {0}: Resources Saved: {1}".format(pid, count))
+                    else:
+                        for chunk in chunks:
+                            reporter.merge(import_jsonl_chunk(reader, chunk, **options))
+                    reporter.report_results()
+                elif file_format == "csv" or file_format == "shp" or file_format == "zip":
+                    if mapping is not None:
+                        reader = CsvReader()
+                        reader.import_business_data(
+                            business_data=business_data,
+                            mapping=mapping,
+                            overwrite=overwrite,
+                            bulk=bulk,
+                            create_concepts=create_concepts,
+                            create_collections=create_collections,
+                            prevent_indexing=prevent_indexing,
+                            transaction_id=transaction_id,
+                            copy=copy,
+                        )
+                    else:
+                        print("*" * 80)
+                        print(
+                            f"ERROR: No mapping file detected for {self.file[0]}. Please indicate one \
+                            with the '-c' paramater or place one in the same directory as your business data."
+                        )
+                        print("*" * 80)
 
-            elapsed = time() - start
-            print("Time to import_business_data = {0}".format(datetime.timedelta(seconds=elapsed)))
+                elapsed = time() - start
+                print("Time to import_business_data = {0}".format(datetime.timedelta(seconds=elapsed)))
 
-            if reader is not None:
-                reader.report_errors()
+                if reader is not None:
+                    reader.report_errors()
 
         finally:
             # cleans up the ResourceXResource table, adding any graph_id values that were unavailable during package/csv load
-            for res_x_res in ResourceXResource.objects.filter(resourceinstanceto_graphid__isnull=True):
-                # wrapping in a try allows for graceful handling of corrupted data
-                try:
-                    res_x_res.resourceinstanceto_graphid = res_x_res.resourceinstanceidto.graph
-                except:
-                    pass
-
-                res_x_res.save()
+            update_relation_graphids(index=(not prevent_indexing))
 
+            # only the datatypes of the graphs that were imported into need refreshing, if the import was logged
+            imported_datatypes = get_imported_datatypes(transaction_id) if transaction_id is not None else None
             datatype_factory = DataTypeFactory()
             datatypes = DDataType.objects.all()
             for datatype in datatypes:
+                if imported_datatypes is not None and datatype.datatype not in imported_datatypes:
+                    continue
                 try:
                     datatype_instance = datatype_factory.get_instance(datatype.datatype)
+                    if not datatype_instance.requires_after_update_all():
+                        continue
                     datatype_instance.after_update_all()
                 except BrokenPipeError as e:
                     logger = logging.getLogger(__name__)
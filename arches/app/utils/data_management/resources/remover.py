@@ -1,9 +1,12 @@
+import datetime
+import pyprind
 from arches.app.models import models
 from arches.app.models.resource import Resource
 from arches.app.models.system_settings import settings
 from arches.app.search.search_engine_factory import SearchEngineFactory
-from arches.app.search.elasticsearch_dsl_builder import Query
+from arches.app.search.elasticsearch_dsl_builder import Query, Bool, Ids, Terms
 from arches.app.search.mappings import TERMS_INDEX, RESOURCE_RELATIONS_INDEX, RESOURCES_INDEX
+from arches.app.utils import edit_log, import_class_from_string, index_queue, mvt
 from django.db.models import Q
 from django.db import connection, transaction
 from django.core.exceptions import ObjectDoesNotExist
@@ -40,3 +43,141 @@ def clear_resources():
     cursor = connection.cursor()
     cursor.execute("TRUNCATE public.resource_x_resource CASCADE;")
     print(models.ResourceXResource.objects.count(), "resource relationships remaining")
+
+
+def delete_resources(resourceids=None, graphid=None, user={}, transaction_id=None, batch_size=None, verbose=False):
+    """
+    Deletes resources in batches, along with their tiles, relations, geometries and indexed documents,
+    using a handful of set based statements per batch rather than deleting each resource on its own
+
+    Each batch is deleted in its own transaction and is recorded with a single "bulk_delete" edit log entry
+    holding the ids of the deleted resources (in oldvalue).
+    References to the deleted resources held in the tiles of other resources are removed and those resources are reindexed.
+    Returns the number of resources deleted
+
+    Keyword Arguments:
+    resourceids -- a list of the ids of the resources to delete
+    graphid -- delete all the resources of this graph (used if resourceids is None)
+    user -- the user to associate the edit log entries with
+    transaction_id -- the transaction id to record in the edit log entries
+    batch_size -- the number of resources to delete at a time, defaults to settings.BULK_IMPORT_BATCH_SIZE
+    verbose -- True to show a progress bar
+
+    """
+
+    batch_size = settings.BULK_IMPORT_BATCH_SIZE if batch_size is None else batch_size
+    resources = models.ResourceInstance.objects.exclude(pk=settings.RESOURCE_INSTANCE_ID)
+    if resourceids is not None:
+        resources = resources.filter(pk__in=resourceids)
+    elif graphid is not None:
+        resources = resources.filter(graph_id=graphid)
+    resourceids = [str(resourceid) for resourceid in resources.order_by("pk").values_list("pk", flat=True)]
+
+    if verbose is True:
+        bar = pyprind.ProgBar(len(resourceids))
+    count = 0
+    for start in range(0, len(resourceids), batch_size):
+        batch = resourceids[start : start + batch_size]
+        with transaction.atomic():
+            deleted, relationids, referencing_resourceids = _delete_resource_batch(batch, user, transaction_id)
+        _delete_resource_documents(deleted, relationids)
+        if len(referencing_resourceids) > 0:
+            index_queue.index_resources(referencing_resourceids, batch_size=batch_size)
+        count += len(deleted)
+        if verbose is True:
+            bar.update(len(batch))
+    if verbose is True:
+        print(bar)
+    return count
+
+
+def _delete_resource_batch(resourceids, user, transaction_id):
+    geometry_bounds = mvt.get_geometry_bounds(resourceinstanceids=resourceids)
+    referencing_resourceids = _remove_references(resourceids)
+
+    # files are deleted with the orm so that the stored files are removed too
+    models.File.objects.filter(tile__resourceinstance_id__in=resourceids).delete()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM resource_x_resource
+            WHERE resourceinstanceidfrom = ANY(%(resourceids)s::uuid[]) OR resourceinstanceidto = ANY(%(resourceids)s::uuid[])
+            RETURNING resourcexid
+            """,
+            {"resourceids": resourceids},
+        )
+        relationids = [str(row[0]) for row in cursor.fetchall()]
+        for table in ["geojson_geometries", "constraint_values", "resource_instance_restrictions", "resource_index_queue", "tiles"]:
+            cursor.execute(f"DELETE FROM {table} WHERE resourceinstanceid = ANY(%(resourceids)s::uuid[])", {"resourceids": resourceids})
+        cursor.execute(
+            "DELETE FROM resource_instances WHERE resourceinstanceid = ANY(%(resourceids)s::uuid[]) RETURNING resourceinstanceid, graphid",
+            {"resourceids": resourceids},
+        )
+        deleted = cursor.fetchall()
+
+    if len(deleted) > 0:
+        graphids = {str(graphid) for resourceid, graphid in deleted}
+        edit = models.EditLog()
+        edit.resourceclassid = graphids.pop() if len(graphids) == 1 else None
+        edit.userid = getattr(user, "id", "")
+        edit.user_email = getattr(user, "email", "")
+        edit.user_firstname = getattr(user, "first_name", "")
+        edit.user_lastname = getattr(user, "last_name", "")
+        edit.note = f"Bulk deleted: {len(deleted)} resources"
+        edit.oldvalue = {"resourceinstanceids": [str(resourceid) for resourceid, graphid in deleted]}
+        edit.timestamp = datetime.datetime.now()
+        if transaction_id is not None:
+            edit.transactionid = transaction_id
+        edit.edittype = "bulk_delete"
+        edit_log.write(edit)
+
+    mvt.geometries_changed(geometry_bounds)
+    return [str(resourceid) for resourceid, graphid in deleted], relationids, referencing_resourceids - set(resourceids)
+
+
+def _remove_references(resourceids):
+    # removes the references to the deleted resources from the resource-instance nodes of other resources' tiles
+    # and returns the ids of the resources whose tiles were updated
+    deleted = set(resourceids)
+    tiles = {}
+    relations = (
+        models.ResourceXResource.objects.filter(resourceinstanceidto__in=resourceids, tileid__isnull=False, nodeid__isnull=False)
+        .exclude(resourceinstanceidfrom__in=resourceids)
+        .select_related("tileid")
+    )
+    for relation in relations:
+        tile = tiles.setdefault(relation.tileid_id, relation.tileid)
+        data = tile.data.get(str(relation.nodeid_id))
+        if data is None:
+            continue
+        if type(data) != list:
+            data = [data]
+        tile.data[str(relation.nodeid_id)] = [item for item in data if item.get("resourceId") not in deleted]
+    models.TileModel.objects.bulk_update(list(tiles.values()), ["data"], batch_size=settings.BULK_IMPORT_BATCH_SIZE)
+    return {str(tile.resourceinstance_id) for tile in tiles.values()}
+
+
+def _delete_resource_documents(resourceids, relationids):
+    if len(resourceids) == 0:
+        return
+    se = SearchEngineFactory().create()
+
+    query = Query(se)
+    bool_query = Bool()
+    bool_query.filter(Terms(field="resourceinstanceid", terms=resourceids))
+    query.add_query(bool_query)
+    query.delete(index=TERMS_INDEX)
+
+    if len(relationids) > 0:
+        query = Query(se)
+        query.add_query(Ids(ids=relationids))
+        query.delete(index=RESOURCE_RELATIONS_INDEX)
+
+    query = Query(se)
+    query.add_query(Ids(ids=resourceids))
+    query.delete(index=RESOURCES_INDEX)
+
+    for index in settings.ELASTICSEARCH_CUSTOM_INDEXES:
+        es_index = import_class_from_string(index["module"])(index["name"])
+        es_index.delete_resources(resources=[models.ResourceInstance(pk=resourceid) for resourceid in resourceids])
@@ -0,0 +1,131 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import threading
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+
+_local = threading.local()
+
+
+class EditLogWriter(object):
+    """
+    Buffers the edit log records written (with write) within it and inserts them in bulk, in the order they were written
+
+    Writers can be nested, the records are inserted when the outermost writer exits, when a nested writer exits
+    with batch_size records waiting, or whenever batch_size records are waiting if no nested writer is open.
+    Records are only ever inserted while the transaction of the writer that's exiting (or of the outermost writer)
+    is still open, so a transaction that's rolled back takes the records it produced with it
+
+    The buffer is kept per thread and is emptied in processes forked from the one it was filled in,
+    as those records are the parent process's to insert
+
+    usage:
+    .. code-block:: python
+
+        with transaction.atomic(), EditLogWriter(atomic=True):
+            ...
+
+    Keyword Arguments:
+    batch_size -- the number of records to buffer before inserting them, defaults to settings.BULK_IMPORT_BATCH_SIZE
+    atomic -- True to drop the records written within the writer if it exits with an exception,
+        for writers opened inside a transaction that the exception rolls back
+
+    """
+
+    def __init__(self, batch_size=None, atomic=False):
+        self.batch_size = settings.BULK_IMPORT_BATCH_SIZE if batch_size is None else batch_size
+        self.atomic = atomic
+        self.start = 0
+
+    def __enter__(self):
+        if not getattr(_local, "writers", None):
+            _local.writers = []
+            _local.buffer = []
+            _local.written = 0
+        self.start = _local.written + len(_local.buffer)
+        _local.writers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self not in getattr(_local, "writers", []):
+            # the writer was opened in the process this one was forked from
+            return False
+        _local.writers.pop()
+        if exc_type is not None and self.atomic:
+            del _local.buffer[max(self.start - _local.written, 0) :]
+        if len(_local.writers) == 0:
+            buffer = _local.buffer
+            _local.buffer = []
+            _local.written = 0
+            _insert(buffer, self.batch_size)
+        elif exc_type is None and len(_local.buffer) >= self.batch_size:
+            _insert_buffer(self.batch_size)
+        return False
+
+
+def write(edit):
+    """
+    Saves an edit log record, or buffers it if an EditLogWriter is open
+
+    Arguments:
+    edit -- an unsaved EditLog
+
+    """
+
+    writers = getattr(_local, "writers", None)
+    if not writers:
+        edit.save()
+        return
+    _local.buffer.append(edit)
+    _insert_if_full()
+
+
+def _insert_if_full():
+    # records can only be inserted early if no nested (atomic) writer could still need to drop them
+    writers = _local.writers
+    if len(writers) == 1 and len(_local.buffer) >= writers[0].batch_size:
+        _insert_buffer(writers[0].batch_size)
+
+
+def _insert_buffer(batch_size):
+    _local.written += len(_local.buffer)
+    buffer = _local.buffer
+    _local.buffer = []
+    _insert(buffer, batch_size)
+
+
+def _insert(edits, batch_size):
+    if len(edits) > 0:
+        models.EditLog.objects.bulk_create(edits, batch_size=batch_size)
+
+
+def reset():
+    """
+    Forgets the writers open in the current thread and the records they've buffered, a forked process
+    starts with no writers open and none of its parent's buffered records
+
+    """
+
+    global _local
+    _local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset)
@@ -0,0 +1,210 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import uuid
+from django.core.cache import cache
+from arches.app.models import models
+
+# graphid -> (version, GraphMetadata), held by each process
+_registry = {}
+
+# nodeid or nodegroupid -> graphid
+_graphids = {}
+
+
+class GraphMetadata(object):
+    """
+    The nodes, nodegroups, cards, unique constraints, widget labels and functions of a graph, loaded with a handful of queries
+
+    The model instances held here are shared by every caller in the process and must not be modified
+
+    """
+
+    def __init__(self, graphid):
+        self.graphid = str(graphid)
+        self.nodes = {}
+        self.nodes_by_nodegroup = {}
+        for node in models.Node.objects.filter(graph_id=graphid).select_related("nodegroup"):
+            self.nodes[str(node.nodeid)] = node
+            if node.nodegroup_id is not None:
+                self.nodes_by_nodegroup.setdefault(str(node.nodegroup_id), []).append(node)
+        self.nodegroups = {nodegroupid: nodes[0].nodegroup for nodegroupid, nodes in self.nodes_by_nodegroup.items()}
+        self.cards = {str(card.nodegroup_id): card for card in models.CardModel.objects.filter(graph_id=graphid)}
+
+        self.constraints = {}
+        for constraint in models.ConstraintModel.objects.filter(card__graph_id=graphid).select_related("card").prefetch_related("nodes"):
+            nodeids = sorted(str(node.nodeid) for node in constraint.nodes.all())
+            self.constraints.setdefault(str(constraint.card.nodegroup_id), []).append((constraint, nodeids))
+
+        self.widget_labels = {}
+        for nodeid, label in models.CardXNodeXWidget.objects.filter(node__graph_id=graphid).values_list("node_id", "label"):
+            self.widget_labels.setdefault(str(nodeid), label)
+
+        self._functions = None
+        self._function_configs = None
+
+        # the datatype instances of the nodes keyed by node id, see DataTypeFactory.get_node_datatypes
+        self.node_datatypes = None
+
+    def get_functions(self, nodegroupid):
+        """
+        Returns the instantiated functions (other than the primary descriptors function) of the graph
+        that are triggered by saving or deleting a tile of a nodegroup
+
+        """
+
+        nodegroupid = str(nodegroupid)
+        if self._functions is None:
+            self._functions = {}
+            self._function_configs = list(
+                models.FunctionXGraph.objects.filter(graph_id=self.graphid)
+                .exclude(function__classname="PrimaryDescriptorsFunction")
+                .select_related("function")
+            )
+        if nodegroupid not in self._functions:
+            functions = []
+            for function_x_graph in self._function_configs:
+                triggering_nodegroups = (function_x_graph.config or {}).get("triggering_nodegroups", None)
+                if triggering_nodegroups == [] or (triggering_nodegroups is not None and nodegroupid in triggering_nodegroups):
+                    functions.append(function_x_graph.function.get_class_module()(function_x_graph.config, nodegroupid))
+            self._functions[nodegroupid] = functions
+        return self._functions[nodegroupid]
+
+
+def get_graph_metadata(graphid):
+    """
+    Returns the GraphMetadata of a graph, reloading it if the graph has changed since it was loaded by this process
+
+    """
+
+    graphid = str(graphid)
+    version = _get_version(graphid)
+    try:
+        loaded_version, metadata = _registry[graphid]
+        if loaded_version == version:
+            return metadata
+    except KeyError:
+        pass
+
+    metadata = GraphMetadata(graphid)
+    _registry[graphid] = (version, metadata)
+    for nodeid in metadata.nodes:
+        _graphids[nodeid] = graphid
+    for nodegroupid in metadata.nodegroups:
+        _graphids[nodegroupid] = graphid
+    return metadata
+
+
+def get_node(nodeid):
+    """
+    Returns a node, raises Node.DoesNotExist if there is no such node
+
+    """
+
+    nodeid = str(nodeid)
+    graphid = _graphids.get(nodeid)
+    if graphid is None:
+        graphid = models.Node.objects.filter(pk=nodeid).values_list("graph_id", flat=True).first()
+        if graphid is None:
+            raise models.Node.DoesNotExist(f"Node {nodeid} does not exist")
+
+    metadata = get_graph_metadata(graphid)
+    if nodeid not in metadata.nodes:
+        # the node may have been deleted and replaced since the graph was loaded
+        _graphids.pop(nodeid, None)
+        graphid = models.Node.objects.filter(pk=nodeid).values_list("graph_id", flat=True).first()
+        metadata = get_graph_metadata(graphid) if graphid is not None else None
+        if metadata is None or nodeid not in metadata.nodes:
+            raise models.Node.DoesNotExist(f"Node {nodeid} does not exist")
+    return metadata.nodes[nodeid]
+
+
+def get_nodegroup_metadata(nodegroupid):
+    """
+    Returns the GraphMetadata of the graph a nodegroup belongs to, or None if the nodegroup has no nodes
+
+    """
+
+    nodegroupid = str(nodegroupid)
+    graphid = _graphids.get(nodegroupid)
+    if graphid is None:
+        graphid = models.Node.objects.filter(nodegroup_id=nodegroupid).values_list("graph_id", flat=True).first()
+        if graphid is None:
+            return None
+    return get_graph_metadata(graphid)
+
+
+def get_nodegroup(nodegroupid):
+    metadata = get_nodegroup_metadata(nodegroupid)
+    if metadata is None or str(nodegroupid) not in metadata.nodegroups:
+        # a nodegroup without any nodes doesn't belong to a graph
+        return models.NodeGroup.objects.get(pk=nodegroupid)
+    return metadata.nodegroups[str(nodegroupid)]
+
+
+def get_nodes(nodegroupid):
+    metadata = get_nodegroup_metadata(nodegroupid)
+    return [] if metadata is None else metadata.nodes_by_nodegroup.get(str(nodegroupid), [])
+
+
+def get_card(nodegroupid):
+    metadata = get_nodegroup_metadata(nodegroupid)
+    if metadata is None or str(nodegroupid) not in metadata.cards:
+        return models.CardModel.objects.get(nodegroup_id=nodegroupid)
+    return metadata.cards[str(nodegroupid)]
+
+
+def get_constraints(nodegroupid):
+    """
+    Returns a list of (constraint, nodeids) tuples of the unique constraints of the card of a nodegroup,
+    where nodeids is the sorted list of the ids of the nodes the constraint is made of
+
+    """
+
+    metadata = get_nodegroup_metadata(nodegroupid)
+    return [] if metadata is None else metadata.constraints.get(str(nodegroupid), [])
+
+
+def get_widget_label(nodeid):
+    """
+    Returns the label of the widget of a node, or None if the node isn't in a card
+
+    """
+
+    node = get_node(nodeid)
+    return get_graph_metadata(node.graph_id).widget_labels.get(str(nodeid))
+
+
+def clear_graph_metadata(graphid):
+    """
+    Invalidates the metadata of a graph held by every process
+
+    """
+
+    if graphid is not None:
+        cache.set(f"graph_metadata_version_{graphid}", str(uuid.uuid4()), None)
+
+
+def _get_version(graphid):
+    key = f"graph_metadata_version_{graphid}"
+    version = cache.get(key)
+    if version is None:
+        version = str(uuid.uuid4())
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
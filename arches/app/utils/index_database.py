@@ -1,11 +1,15 @@
+import os
 import pyprind
-from django.db import connection
+from multiprocessing import Pool, cpu_count
+from time import time
+from django.db import connection, connections
 from django.db.models import Q
 from arches.app.models import models
 from arches.app.models.models import Value
 from arches.app.models.resource import Resource
 from arches.app.models.system_settings import settings
 from arches.app.search.search_engine_factory import SearchEngineInstance as se
+from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Query, Term
 from arches.app.search.base_index import get_index
 from arches.app.search.mappings import TERMS_INDEX, CONCEPTS_INDEX, RESOURCE_RELATIONS_INDEX, RESOURCES_INDEX
@@ -13,8 +17,11 @@ from arches.app.datatypes.datatypes import DataTypeFactory
 from arches.app.utils import import_class_from_string
 from datetime import datetime
 
+# the number of fixed ranges of resourceinstanceid the resources of a graph are partitioned into to be indexed in parallel
+RESOURCE_INDEX_RANGES = 256
 
-def index_db(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False):
+
+def index_db(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False, processes=1, resume=False):
     """
     Deletes any existing indicies from elasticsearch and then indexes all
     concepts and resources from the database
@@ -23,16 +30,18 @@ def index_db(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet
     clear_index -- set to True to remove all the resources and concepts from the index before the reindexing operation
     batch_size -- the number of records to index as a group, the larger the number to more memory required
     quiet -- Silences the status bar output during certain operations, use in celery operations for example
+    processes -- the number of worker processes used to index resources (see index_resources_by_type)
+    resume -- set to True to resume an interrupted resource reindex (see index_resources_by_type)
 
     """
 
     index_concepts(clear_index=clear_index, batch_size=batch_size)
-    index_resources(clear_index=clear_index, batch_size=batch_size, quiet=quiet)
+    index_resources(clear_index=clear_index, batch_size=batch_size, quiet=quiet, processes=processes, resume=resume)
     index_custom_indexes(clear_index=clear_index, batch_size=batch_size, quiet=quiet)
     index_resource_relations(clear_index=clear_index, batch_size=batch_size)
 
 
-def index_resources(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False):
+def index_resources(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False, processes=1, resume=False):
     """
     Indexes all resources from the database
 
@@ -40,10 +49,12 @@ def index_resources(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE
     clear_index -- set to True to remove all the resources from the index before the reindexing operation
     batch_size -- the number of records to index as a group, the larger the number to more memory required
     quiet -- Silences the status bar output during certain operations, use in celery operations for example
+    processes -- the number of worker processes used to index resources (see index_resources_by_type)
+    resume -- set to True to resume an interrupted resource reindex (see index_resources_by_type)
 
     """
 
-    if clear_index:
+    if clear_index and not resume:
         q = Query(se=se)
         q.delete(index=TERMS_INDEX)
 
@@ -52,10 +63,12 @@ def index_resources(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE
         .exclude(graphid=settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID)
         .values_list("graphid", flat=True)
     )
-    index_resources_by_type(resource_types, clear_index=clear_index, batch_size=batch_size, quiet=quiet)
+    index_resources_by_type(resource_types, clear_index=clear_index, batch_size=batch_size, quiet=quiet, processes=processes, resume=resume)
 
 
-def index_resources_by_type(resource_types, clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False):
+def index_resources_by_type(
+    resource_types, clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False, processes=1, resume=False
+):
     """
     Indexes all resources of a given type(s)
 
@@ -66,15 +79,23 @@ def index_resources_by_type(resource_types, clear_index=True, batch_size=setting
     clear_index -- set to True to remove all the resources of the types passed in from the index before the reindexing operation
     batch_size -- the number of records to index as a group, the larger the number to more memory required
     quiet -- Silences the status bar output during certain operations, use in celery operations for example
+    processes -- the number of worker processes to index with, if greater than 1 (or if resuming) the resources are
+        partitioned into ranges of resourceinstanceid and indexed in parallel (see index_resources_by_type_in_parallel)
+    resume -- set to True to skip the ranges of resources that were completely indexed by a previous, interrupted run
 
     """
 
-    status = ""
-    datatype_factory = DataTypeFactory()
-    node_datatypes = {str(nodeid): datatype for nodeid, datatype in models.Node.objects.values_list("nodeid", "datatype")}
     if isinstance(resource_types, str):
         resource_types = [resource_types]
 
+    if (processes is not None and int(processes) > 1) or resume:
+        return index_resources_by_type_in_parallel(
+            resource_types, clear_index=clear_index, batch_size=batch_size, quiet=quiet, processes=processes, resume=resume
+        )
+
+    status = ""
+    datatype_factory = DataTypeFactory()
+
     for resource_type in resource_types:
         start = datetime.now()
         resources = Resource.objects.filter(graph_id=str(resource_type))
@@ -91,15 +112,15 @@ def index_resources_by_type(resource_types, clear_index=True, batch_size=setting
             with se.BulkIndexer(batch_size=batch_size, refresh=True) as term_indexer:
                 if quiet is False:
                     bar = pyprind.ProgBar(len(resources), bar_char="█") if len(resources) > 1 else None
+                resource_batch = []
                 for resource in resources:
                     if quiet is False and bar is not None:
                         bar.update(item_id=resource)
-                    document, terms = resource.get_documents_to_index(
-                        fetchTiles=True, datatype_factory=datatype_factory, node_datatypes=node_datatypes
-                    )
-                    doc_indexer.add(index=RESOURCES_INDEX, id=document["resourceinstanceid"], data=document)
-                    for term in terms:
-                        term_indexer.add(index=TERMS_INDEX, id=term["_id"], data=term["_source"])
+                    resource_batch.append(resource)
+                    if len(resource_batch) >= batch_size:
+                        index_resource_batch(resource_batch, doc_indexer, term_indexer, datatype_factory)
+                        resource_batch = []
+                index_resource_batch(resource_batch, doc_indexer, term_indexer, datatype_factory)
 
         result_summary = {"database": len(resources), "indexed": se.count(index=RESOURCES_INDEX, body=q.dsl)}
         status = "Passed" if result_summary["database"] == result_summary["indexed"] else "Failed"
@@ -111,6 +132,224 @@ def index_resources_by_type(resource_types, clear_index=True, batch_size=setting
     return status
 
 
+def index_resources_by_type_in_parallel(
+    resource_types, clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False, processes=None, resume=False
+):
+    """
+    Indexes all resources of a given type(s) using a pool of worker processes
+
+    The resources of each type are partitioned into fixed ranges of resourceinstanceid (see get_resource_ranges)
+    and each range is indexed by a worker with its own connection to the database and to Elasticsearch.
+    The progress of each range is recorded in the resource_index_checkpoints table so that an interrupted run can be resumed.
+
+    Arguments:
+    resource_types -- array of graph ids that represent resource types
+
+    Keyword Arguments:
+    clear_index -- set to True to remove all the resources of the types passed in from the index before the reindexing operation,
+        ignored when resuming
+    batch_size -- the number of records to index as a group
+    quiet -- Silences the status bar output during certain operations, use in celery operations for example
+    processes -- the number of worker processes to index with, defaults to the number of cpus,
+        with a single process the ranges are indexed in this process
+    resume -- set to True to skip the ranges of resources that were completely indexed by a previous, interrupted run
+        and to continue the others from the last resource indexed
+
+    """
+
+    status = ""
+    processes = cpu_count() if processes is None else int(processes)
+    if isinstance(resource_types, str):
+        resource_types = [resource_types]
+
+    for resource_type in resource_types:
+        start = datetime.now()
+        resource_type = str(resource_type)
+        graph_name = models.GraphModel.objects.get(graphid=resource_type).name
+        print("Indexing resource type '{0}' using {1} processes".format(graph_name, processes))
+
+        q = Query(se=se)
+        term = Term(field="graph_id", term=resource_type)
+        q.add_query(term)
+
+        checkpoints = models.ResourceIndexCheckpoint.objects.filter(graph_id=resource_type)
+        if resume is False:
+            checkpoints.delete()
+            if clear_index:
+                q.delete(index=RESOURCES_INDEX, refresh=True)
+
+        completed_ranges = {
+            str(rangestart) for rangestart in checkpoints.filter(completed__isnull=False).values_list("rangestart", flat=True)
+        }
+        ranges = get_resource_ranges()
+        tasks = [(resource_type, rangestart, rangeend, batch_size) for rangestart, rangeend in ranges if rangestart not in completed_ranges]
+        if len(tasks) < len(ranges):
+            print("Resuming: skipping {0} of {1} ranges that were already indexed".format(len(ranges) - len(tasks), len(ranges)))
+
+        worker_stats = {}
+        bar = pyprind.ProgBar(len(tasks), bar_char="█") if quiet is False and len(tasks) > 1 else None
+        if processes > 1 and len(tasks) > 1:
+            # connections can't be shared with forked processes, each worker opens its own
+            connections.close_all()
+            pool = Pool(min(processes, len(tasks)), initializer=_init_index_worker)
+            results = pool.imap_unordered(_index_resource_range, tasks)
+        else:
+            pool = None
+            datatype_factory = DataTypeFactory()
+            results = (_time_resource_range(task, se, datatype_factory) for task in tasks)
+        try:
+            for pid, indexed, seconds in results:
+                stats = worker_stats.setdefault(pid, {"indexed": 0, "seconds": 0})
+                stats["indexed"] += indexed
+                stats["seconds"] += seconds
+                if bar is not None:
+                    bar.update()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        se.refresh(index=RESOURCES_INDEX)
+        se.refresh(index=TERMS_INDEX)
+        for pid, stats in worker_stats.items():
+            print(
+                "Worker {0}: Indexed: {1}, Took: {2:.1f} seconds, Rate: {3:.1f} resources/second".format(
+                    pid, stats["indexed"], stats["seconds"], stats["indexed"] / stats["seconds"] if stats["seconds"] else 0
+                )
+            )
+
+        result_summary = {
+            "database": Resource.objects.filter(graph_id=resource_type).count(),
+            "indexed": se.count(index=RESOURCES_INDEX, body=q.dsl),
+        }
+        status = "Passed" if result_summary["database"] == result_summary["indexed"] else "Failed"
+        if status == "Passed":
+            checkpoints.delete()
+        print(
+            "Status: {0}, Resource Type: {1}, In Database: {2}, Indexed: {3}, Took: {4} seconds".format(
+                status, graph_name, result_summary["database"], result_summary["indexed"], (datetime.now() - start).seconds
+            )
+        )
+    return status
+
+
+def index_resource_batch(resources, doc_indexer, term_indexer, datatype_factory):
+    """
+    Builds the documents for a batch of resources with set based queries and adds them to the given bulk indexers
+
+    Arguments:
+    resources -- a list of resources to index
+    doc_indexer -- the BulkIndexer used for resource documents
+    term_indexer -- the BulkIndexer used for terms
+    datatype_factory -- reference to the DataTypeFactory instance
+
+    """
+
+    for document, terms in Resource.get_documents_to_index_bulk(resources, fetchTiles=True, datatype_factory=datatype_factory):
+        doc_indexer.add(index=RESOURCES_INDEX, id=document["resourceinstanceid"], data=document)
+        for term in terms:
+            term_indexer.add(index=TERMS_INDEX, id=term["_id"], data=term["_source"])
+
+
+def get_resource_ranges():
+    """
+    Partitions the resource instance id space into RESOURCE_INDEX_RANGES fixed ranges (by the leading byte of the id),
+    returns a list of (rangestart, rangeend) tuples, rangestart is inclusive, rangeend is exclusive and None for the last range
+
+    The ranges don't depend on the resources in the database or on the batch size, so the checkpoints of an interrupted
+    run still match the ranges when it's resumed
+
+    """
+
+    range_starts = [
+        "{0:02x}000000-0000-0000-0000-000000000000".format(i * 256 // RESOURCE_INDEX_RANGES) for i in range(RESOURCE_INDEX_RANGES)
+    ]
+    return list(zip(range_starts, range_starts[1:] + [None]))
+
+
+def index_resource_range(
+    graphid, rangestart, rangeend, batch_size=settings.BULK_IMPORT_BATCH_SIZE, search_engine=None, datatype_factory=None
+):
+    """
+    Indexes the resources of a graph in a range of resourceinstanceid a batch at a time, in order of resourceinstanceid,
+    recording the last resource indexed in the range's checkpoint after each batch and marking the range as complete at the end,
+    a range that was partly indexed continues from the last resource recorded, returns the number of resources indexed
+
+    Arguments:
+    graphid -- the graph id of the resources to index
+    rangestart -- the first resourceinstanceid of the range (inclusive)
+    rangeend -- the end of the range (exclusive), None for no end
+
+    Keyword Arguments:
+    batch_size -- the number of resources to read and index at a time
+    search_engine -- the search engine connection to index with, defaults to SearchEngineInstance
+    datatype_factory -- reference to the DataTypeFactory instance
+
+    """
+
+    search_engine = se if search_engine is None else search_engine
+    datatype_factory = DataTypeFactory() if datatype_factory is None else datatype_factory
+    checkpoint, created = models.ResourceIndexCheckpoint.objects.get_or_create(
+        graph_id=graphid, rangestart=rangestart, defaults={"rangeend": rangeend}
+    )
+    resources = Resource.objects.filter(graph_id=graphid, resourceinstanceid__gte=rangestart).order_by("resourceinstanceid")
+    if rangeend is not None:
+        resources = resources.filter(resourceinstanceid__lt=rangeend)
+
+    indexed = 0
+    while True:
+        if checkpoint.lastindexedid is not None:
+            batch = list(resources.filter(resourceinstanceid__gt=checkpoint.lastindexedid)[:batch_size])
+        else:
+            batch = list(resources[:batch_size])
+        if len(batch) == 0:
+            break
+        with search_engine.BulkIndexer(batch_size=batch_size) as doc_indexer:
+            with search_engine.BulkIndexer(batch_size=batch_size) as term_indexer:
+                index_resource_batch(batch, doc_indexer, term_indexer, datatype_factory)
+        checkpoint.lastindexedid = batch[-1].resourceinstanceid
+        checkpoint.indexed += len(batch)
+        checkpoint.save()
+        indexed += len(batch)
+
+    checkpoint.completed = datetime.now()
+    checkpoint.save()
+    return indexed
+
+
+_index_worker = {}
+
+
+def _init_index_worker():
+    """
+    Initializes an indexing worker process with its own database and search engine connections
+
+    """
+
+    connections.close_all()
+    _index_worker["se"] = SearchEngineFactory().create()
+    _index_worker["datatype_factory"] = DataTypeFactory()
+
+
+def _index_resource_range(task):
+    """
+    Indexes a single range of resources in a worker process
+
+    """
+
+    return _time_resource_range(task, _index_worker["se"], _index_worker["datatype_factory"])
+
+
+def _time_resource_range(task, search_engine, datatype_factory):
+    # returns a tuple of the process id, the number of resources indexed and the time taken in seconds
+    graphid, rangestart, rangeend, batch_size = task
+    start = time()
+    indexed = index_resource_range(
+        graphid, rangestart, rangeend, batch_size=batch_size, search_engine=search_engine, datatype_factory=datatype_factory
+    )
+    return os.getpid(), indexed, time() - start
+
+
 def index_custom_indexes(index_name=None, clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, quiet=False):
     """
     Indexes any custom indexes, optionally by name
@@ -0,0 +1,164 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+from django.core.cache import cache
+from django.db import connection, transaction
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.search.mappings import TERMS_INDEX, RESOURCES_INDEX
+from arches.app.utils import import_class_from_string
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_CACHE_KEY = "resource_index_queue_scheduled"
+
+
+def queue_resources(resourceids):
+    """
+    Adds resources to the index queue, resources that are already waiting in the queue aren't added again
+
+    Once the current transaction is committed a celery task is scheduled to process the queue after
+    settings.RESOURCE_INDEX_QUEUE_DELAY seconds, unless one is already scheduled, so that all the edits
+    made to a resource within that time are indexed together
+
+    Arguments:
+    resourceids -- a list of resource instance ids
+
+    """
+
+    resourceids = list({str(resourceid) for resourceid in resourceids})
+    queued = [models.ResourceIndexQueue(resourceinstanceid=resourceid) for resourceid in resourceids]
+    models.ResourceIndexQueue.objects.bulk_create(queued, ignore_conflicts=True)
+    transaction.on_commit(lambda: schedule_queue_processing(resourceids=resourceids))
+
+
+def schedule_queue_processing(resourceids=None):
+    """
+    Schedules a celery task to process the index queue if one isn't scheduled already,
+    if the task can't be sent to the broker the given resources are indexed straight away
+
+    Keyword Arguments:
+    resourceids -- the resources to index if the task can't be scheduled, so that a request only ever indexes
+        the resources it queued itself rather than everything waiting in the queue, defaults to the whole queue
+
+    """
+
+    from arches.app.tasks import index_queued_resources
+
+    # the flag expires in case a worker dies before it can clear it
+    if cache.add(SCHEDULED_CACHE_KEY, True, settings.RESOURCE_INDEX_QUEUE_DELAY + 600):
+        try:
+            index_queued_resources.apply_async(countdown=settings.RESOURCE_INDEX_QUEUE_DELAY)
+        except Exception as e:
+            logger.warning("Unable to schedule the processing of the resource index queue, indexing the queued resources now")
+            logger.exception(e)
+            cache.delete(SCHEDULED_CACHE_KEY)
+            process_queue(resourceids=resourceids)
+
+
+def process_queue(resourceids=None, batch_size=None):
+    """
+    Indexes the queued resources in batches with bulk requests to Elasticsearch, returns the number of resources indexed
+
+    Each batch is removed from the queue in the same transaction it's indexed in, so a batch that fails to index
+    stays in the queue, and rows locked by another worker are skipped so that several workers can process the queue at once
+
+    Keyword Arguments:
+    resourceids -- only index these resources (if they're queued), defaults to indexing every queued resource
+    batch_size -- the number of resources to index at a time, defaults to settings.BULK_IMPORT_BATCH_SIZE
+
+    """
+
+    batch_size = settings.BULK_IMPORT_BATCH_SIZE if batch_size is None else batch_size
+    if resourceids is not None:
+        resourceids = [str(resourceid) for resourceid in resourceids]
+
+    count = 0
+    while True:
+        with transaction.atomic():
+            claimed = _claim_queued_resources(batch_size, resourceids)
+            if len(claimed) == 0:
+                break
+            index_resources(claimed, batch_size=batch_size)
+        count += len(claimed)
+    return count
+
+
+def index_resources(resourceids, batch_size=None):
+    """
+    Indexes a list of resources with bulk requests to Elasticsearch,
+    ids of resources that no longer exist (or belong to the system settings graph) are ignored
+
+    Arguments:
+    resourceids -- a list of resource instance ids
+
+    Keyword Arguments:
+    batch_size -- the number of documents to send to Elasticsearch in each request, defaults to settings.BULK_IMPORT_BATCH_SIZE
+
+    """
+
+    from arches.app.models.resource import Resource
+    from arches.app.search.search_engine_factory import SearchEngineInstance as se
+
+    batch_size = settings.BULK_IMPORT_BATCH_SIZE if batch_size is None else batch_size
+    resources = list(Resource.objects.filter(pk__in=resourceids).exclude(graph_id=settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID))
+    custom_indexes = [import_class_from_string(index["module"])(index["name"]) for index in settings.ELASTICSEARCH_CUSTOM_INDEXES]
+
+    with se.BulkIndexer(batch_size=batch_size) as doc_indexer:
+        with se.BulkIndexer(batch_size=batch_size) as term_indexer:
+            for resource, (document, terms) in zip(resources, Resource.get_documents_to_index_bulk(resources)):
+                doc_indexer.add(index=RESOURCES_INDEX, id=document["resourceinstanceid"], data=document)
+                for term in terms:
+                    term_indexer.add(index=TERMS_INDEX, id=term["_id"], data=term["_source"])
+                for es_index in custom_indexes:
+                    doc, doc_id = es_index.get_documents_to_index(resource, document["tiles"])
+                    es_index.index_document(document=doc, id=doc_id)
+
+
+def flush_requested(request):
+    """
+    Returns True if a request asks for the resources it edits to be indexed straight away (with flush_index=true)
+    rather than being queued
+
+    """
+
+    try:
+        return request.GET.get("flush_index", request.POST.get("flush_index", "false")).lower() == "true"
+    except AttributeError:
+        return False
+
+
+def _claim_queued_resources(batch_size, resourceids=None):
+    resourceid_filter = "" if resourceids is None else "WHERE resourceinstanceid = ANY(%(resourceids)s::uuid[])"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            DELETE FROM resource_index_queue
+            WHERE resourceinstanceid IN (
+                SELECT resourceinstanceid FROM resource_index_queue
+                {resourceid_filter}
+                ORDER BY queued
+                LIMIT %(batch_size)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING resourceinstanceid
+            """,
+            {"resourceids": resourceids, "batch_size": batch_size},
+        )
+        return [str(row[0]) for row in cursor.fetchall()]
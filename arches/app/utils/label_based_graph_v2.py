@@ -227,7 +227,7 @@ class LabelBasedGraph(object):
         if datatype_factory.datatypes[node.datatype].defaultwidget is None:
             display_value = NON_DATA_COLLECTING_NODE
         elif tile.data:
-            datatype = datatype_factory.get_instance(node.datatype)
+            datatype = datatype_factory.get_node_datatypes(node.graph_id)[str(node.nodeid)]
 
             # `get_display_value` varies between datatypes,
             # so let's handle errors here instead of nullguarding all models
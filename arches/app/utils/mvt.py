@@ -0,0 +1,605 @@
+import math
+import uuid
+import logging
+from django.core.cache import cache
+from django.db import connection, transaction
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.utils.permission_backend import get_restricted_instances_fingerprint
+
+EARTHCIRCUM = 40075016.6856
+PIXELSPERTILE = 256
+MAX_LATITUDE = 85.0511287798
+
+logger = logging.getLogger(__name__)
+
+
+def get_tile(node, zoom, x, y, user):
+    """
+    Returns the mapbox vector tile of the features of a geometry node that a user has access to
+
+    Tiles are cached under the node, the zoom, x and y of the tile together with a fingerprint of the
+    instances the user is restricted from, so users with the same restrictions share the same cached tiles
+
+    Arguments:
+    node -- the geometry node (a Node model) the tile is for
+    zoom, x, y -- the address of the tile
+    user -- the user requesting the tile
+
+    """
+
+    zoom, x, y = int(zoom), int(x), int(y)
+    fingerprint = get_restricted_instances_fingerprint(user)
+    cache_key = get_tile_cache_key(node, zoom, x, y, fingerprint=fingerprint)
+    tile = cache.get(cache_key)
+    if tile is None:
+        tile = render_tile(node, zoom, x, y, restricted_user=None if fingerprint is None else user)
+        cache.set(cache_key, tile, settings.TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def seed_tiles(node, max_zoom, user=None):
+    """
+    Renders and caches the tiles of a geometry node that contain any of the node's features from zoom level 0 up to max_zoom
+    returns the number of tiles cached
+
+    Arguments:
+    node -- the geometry node (a Node model) to cache the tiles of
+    max_zoom -- the highest zoom level to cache
+
+    Keyword Arguments:
+    user -- the tiles are cached for users with the same restrictions as this user,
+        if not supplied they are cached for users without any restrictions
+
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+            FROM (SELECT ST_Extent(ST_Transform(geom, 4326)) AS extent FROM geojson_geometries WHERE nodeid = %s) AS e;""",
+            [node.nodeid],
+        )
+        bounds = cursor.fetchone()
+    if bounds[0] is None:
+        return 0
+
+    fingerprint = None if user is None else get_restricted_instances_fingerprint(user)
+    count = 0
+    for zoom in range(0, max_zoom + 1):
+        minx, miny, maxx, maxy = get_tile_range(bounds, zoom)
+        for x in range(minx, maxx + 1):
+            for y in range(miny, maxy + 1):
+                tile = render_tile(node, zoom, x, y, restricted_user=None if fingerprint is None else user)
+                cache.set(get_tile_cache_key(node, zoom, x, y, fingerprint=fingerprint), tile, settings.TILE_CACHE_TIMEOUT)
+                count += 1
+    return count
+
+
+def render_tile(node, zoom, x, y, restricted_user=None):
+    """
+    Renders the mapbox vector tile of the features of a geometry node, clustering the features at low zoom levels
+
+    Keyword Arguments:
+    restricted_user -- if supplied the features of instances this user has no access to are left out of the tile
+
+    """
+
+    restriction_filter = ""
+    restriction_params = []
+    if restricted_user is not None:
+        restriction_filter = """and NOT EXISTS (
+            SELECT 1 FROM resource_instance_restrictions r WHERE r.resourceinstanceid = g.resourceinstanceid and r.userid = %s
+        )"""
+        restriction_params = [restricted_user.id]
+
+    nodeid = str(node.nodeid)
+    config = node.config
+    if zoom <= int(config["clusterMaxZoom"]) and (restricted_user is None or not _has_restricted_geometries(node, restricted_user)):
+        # users that aren't restricted from any of the node's features see every feature
+        # so their tiles can be cut from the precomputed clusters
+        return render_tile_from_clusters(node, zoom, x, y)
+
+    with connection.cursor() as cursor:
+        if zoom <= int(config["clusterMaxZoom"]):
+            # only the features near the tile are clustered, those within the tile's buffer and the clustering distance of it
+            distance, min_points = get_cluster_parameters(node, zoom)
+            tile_width = 2 * math.pi * 6378137 / (1 << zoom)
+            restriction_filter += " and g.geom && ST_Expand(TileBBox(%s, %s, %s, 3857), %s)"
+            restriction_params += [zoom, x, y, tile_width * 256 / 4096 + distance]
+            cursor.execute(
+                """WITH clusters(tileid, resourceinstanceid, nodeid, geom, cid)
+                AS (
+                    SELECT m.*,
+                    ST_ClusterDBSCAN(geom, eps := %s, minpoints := %s) over () AS cid
+                    FROM (
+                        SELECT tileid,
+                            resourceinstanceid,
+                            nodeid,
+                            geom
+                        FROM geojson_geometries g
+                        WHERE nodeid = %s {0}
+                    ) m
+                )
+
+                SELECT ST_AsMVT(
+                    tile,
+                     %s,
+                    4096,
+                    'geom',
+                    'id'
+                ) FROM (
+                    SELECT resourceinstanceid::text,
+                        row_number() over () as id,
+                        1 as total,
+                        ST_AsMVTGeom(
+                            geom,
+                            TileBBox(%s, %s, %s, 3857)
+                        ) AS geom,
+                        '' AS extent
+                    FROM clusters
+                    WHERE cid is NULL
+                    UNION
+                    SELECT NULL as resourceinstanceid,
+                        row_number() over () as id,
+                        count(*) as total,
+                        ST_AsMVTGeom(
+                            ST_Centroid(
+                                ST_Collect(geom)
+                            ),
+                            TileBBox(%s, %s, %s, 3857)
+                        ) AS geom,
+                        ST_AsGeoJSON(
+                            ST_Extent(geom)
+                        ) AS extent
+                    FROM clusters
+                    WHERE cid IS NOT NULL
+                    GROUP BY cid
+                ) as tile;""".format(
+                    restriction_filter
+                ),
+                [distance, min_points, nodeid] + restriction_params + [nodeid, zoom, x, y, zoom, x, y],
+            )
+        else:
+            cursor.execute(
+                """SELECT ST_AsMVT(tile, %s, 4096, 'geom', 'id') FROM (SELECT tileid,
+                    id,
+                    resourceinstanceid,
+                    nodeid,
+                    ST_AsMVTGeom(
+                        geom,
+                        TileBBox(%s, %s, %s, 3857)
+                    ) AS geom,
+                    1 AS total
+                FROM geojson_geometries g
+                WHERE nodeid = %s {0}) AS tile;""".format(
+                    restriction_filter
+                ),
+                [nodeid, zoom, x, y, nodeid] + restriction_params,
+            )
+        return bytes(cursor.fetchone()[0])
+
+
+def render_tile_from_clusters(node, zoom, x, y):
+    """
+    Renders the mapbox vector tile of a clustered zoom level of a geometry node from the node's
+    precomputed cluster pyramid, building the zoom level of the pyramid first if need be
+
+    """
+
+    ensure_clusters(node, zoom)
+    tile_width = 2 * math.pi * 6378137 / (1 << zoom)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT ST_AsMVT(tile, %s, 4096, 'geom', 'id') FROM (
+                SELECT resourceinstanceid::text,
+                    row_number() over () as id,
+                    total,
+                    ST_AsMVTGeom(
+                        geom,
+                        TileBBox(%s, %s, %s, 3857)
+                    ) AS geom,
+                    CASE WHEN resourceinstanceid IS NULL THEN ST_AsGeoJSON(extent) ELSE '' END AS extent
+                FROM geojson_geometry_clusters
+                WHERE nodeid = %s and zoom = %s and geom && ST_Expand(TileBBox(%s, %s, %s, 3857), %s)
+            ) as tile;""",
+            # features within the 256 pixel buffer ST_AsMVTGeom keeps around a tile are included too
+            [str(node.nodeid), zoom, x, y, str(node.nodeid), zoom, zoom, x, y, tile_width * 256 / 4096],
+        )
+        return bytes(cursor.fetchone()[0])
+
+
+def _has_restricted_geometries(node, user):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT EXISTS (
+                SELECT 1 FROM geojson_geometries g
+                    JOIN resource_instance_restrictions r ON r.resourceinstanceid = g.resourceinstanceid
+                WHERE g.nodeid = %s and r.userid = %s
+            );""",
+            [str(node.nodeid), user.id],
+        )
+        return cursor.fetchone()[0]
+
+
+def get_cluster_parameters(node, zoom):
+    """
+    Returns the distance (in meters) and minimum number of points used to cluster the features of a geometry node at a zoom level
+
+    """
+
+    arc = EARTHCIRCUM / ((1 << zoom) * PIXELSPERTILE)
+    distance = arc * float(node.config["clusterDistance"])
+    distance = settings.CLUSTER_DISTANCE_MAX if distance > settings.CLUSTER_DISTANCE_MAX else distance
+    return distance, int(node.config["clusterMinPoints"])
+
+
+def ensure_clusters(node, zoom):
+    """
+    Builds a zoom level of the cluster pyramid of a geometry node if it hasn't been built,
+    or was built with clustering parameters that no longer match the node's config
+
+    """
+
+    distance, min_points = get_cluster_parameters(node, zoom)
+    if not _clusters_are_current(node, zoom, distance, min_points):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", [f"geojson_geometry_clusters_{node.nodeid}_{zoom}"])
+            # another process may have built the clusters while we waited for the lock
+            if not _clusters_are_current(node, zoom, distance, min_points):
+                _cluster_geometries(node, zoom)
+
+
+def refresh_clusters(node, bounds_list=None):
+    """
+    Brings the cluster pyramid of a geometry node up to date after the node's geometries have changed
+
+    Only the clusters and features near the changed geometries are recalculated. The area reclustered at each zoom level
+    starts as the changed bounds grown by the clustering distance, and is grown to take in every cluster it touches
+    (plus the clustering distance again) until it no longer grows, so that no feature left outside it could have been
+    clustered with a feature inside it. Zoom levels that haven't been built are left to be built when first requested.
+
+    Arguments:
+    node -- the geometry node (a Node model)
+
+    Keyword Arguments:
+    bounds_list -- a list of (minx, miny, maxx, maxy) tuples in longitude and latitude of the geometries that changed,
+        if None the whole pyramid is rebuilt
+
+    """
+
+    if node.config is None:
+        return
+    # each zoom level is refreshed in a transaction of its own so that only one is locked at a time
+    for zoom in range(0, int(node.config["clusterMaxZoom"]) + 1):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", [f"geojson_geometry_clusters_{node.nodeid}_{zoom}"])
+            distance, min_points = get_cluster_parameters(node, zoom)
+            if bounds_list is None:
+                _cluster_geometries(node, zoom)
+            elif _clusters_are_current(node, zoom, distance, min_points):
+                region = _get_reclustering_region(node, zoom, distance, bounds_list)
+                _cluster_geometries(node, zoom, region=region)
+
+
+def _clusters_are_current(node, zoom, distance, min_points):
+    existing = models.GeoJSONGeometryCluster.objects.filter(node_id=node.nodeid, zoom=zoom).values_list("eps", "minpoints").first()
+    return existing is not None and abs(existing[0] - distance) < 0.000001 and existing[1] == min_points
+
+
+def _get_reclustering_region(node, zoom, distance, bounds_list):
+    minx, miny, maxx, maxy = None, None, None, None
+    for bounds in bounds_list:
+        bounds_minx, bounds_miny = _to_web_mercator(bounds[0], bounds[1])
+        bounds_maxx, bounds_maxy = _to_web_mercator(bounds[2], bounds[3])
+        minx = bounds_minx if minx is None else min(minx, bounds_minx)
+        miny = bounds_miny if miny is None else min(miny, bounds_miny)
+        maxx = bounds_maxx if maxx is None else max(maxx, bounds_maxx)
+        maxy = bounds_maxy if maxy is None else max(maxy, bounds_maxy)
+    region = (minx - distance, miny - distance, maxx + distance, maxy + distance)
+
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                """SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (
+                    SELECT ST_Extent(extent) AS e FROM geojson_geometry_clusters
+                    WHERE nodeid = %s and zoom = %s and extent && ST_MakeEnvelope(%s, %s, %s, %s, 3857)
+                ) AS clusters;""",
+                [str(node.nodeid), zoom] + list(region),
+            )
+            extent = cursor.fetchone()
+            if extent[0] is None:
+                return region
+            grown_region = (
+                min(region[0], extent[0] - distance),
+                min(region[1], extent[1] - distance),
+                max(region[2], extent[2] + distance),
+                max(region[3], extent[3] + distance),
+            )
+            if grown_region == region:
+                return region
+            region = grown_region
+
+
+def _cluster_geometries(node, zoom, region=None):
+    """
+    Replaces the clusters of a zoom level of a geometry node, either all of them or only those within a region
+
+    Keyword Arguments:
+    region -- a (minx, miny, maxx, maxy) tuple in web mercator
+
+    """
+
+    distance, min_points = get_cluster_parameters(node, zoom)
+    nodeid = str(node.nodeid)
+    region_filter = ""
+    region_params = []
+    if region is not None:
+        region_filter = "and {0} && ST_MakeEnvelope(%s, %s, %s, %s, 3857)"
+        region_params = list(region)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM geojson_geometry_clusters WHERE nodeid = %s and zoom = %s {0};".format(region_filter.format("extent")),
+            [nodeid, zoom] + region_params,
+        )
+        cursor.execute(
+            """WITH clusters(tileid, resourceinstanceid, geom, cid)
+            AS (
+                SELECT tileid,
+                    resourceinstanceid,
+                    geom,
+                    ST_ClusterDBSCAN(geom, eps := %s, minpoints := %s) over () AS cid
+                FROM geojson_geometries
+                WHERE nodeid = %s {0}
+            )
+
+            INSERT INTO geojson_geometry_clusters(nodeid, zoom, resourceinstanceid, tileid, total, geom, extent, eps, minpoints)
+            SELECT %s, %s, resourceinstanceid, tileid, 1, geom, ST_Envelope(geom), %s, %s
+            FROM clusters
+            WHERE cid IS NULL
+            UNION ALL
+            SELECT %s, %s, NULL, NULL, count(*), ST_Centroid(ST_Collect(geom)), ST_SetSRID(ST_Extent(geom)::geometry, 3857), %s, %s
+            FROM clusters
+            WHERE cid IS NOT NULL
+            GROUP BY cid;""".format(
+                region_filter.format("geom")
+            ),
+            [distance, min_points, nodeid] + region_params + [nodeid, zoom, distance, min_points, nodeid, zoom, distance, min_points],
+        )
+
+
+def _to_web_mercator(lon, lat):
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    x = lon * EARTHCIRCUM / 360.0
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * EARTHCIRCUM / (2 * math.pi)
+    return x, y
+
+
+def get_geometry_bounds(tileid=None, resourceinstanceid=None, resourceinstanceids=None, tileids=None):
+    """
+    Returns the bounds (minx, miny, maxx, maxy) in longitude and latitude of the geometries of a tile, a list of tiles,
+    a resource instance or a list of resource instances, as a dict of lists of bounds keyed by the id of the geometry node
+
+    """
+
+    if resourceinstanceids is not None:
+        condition, value = "resourceinstanceid = ANY(%s::uuid[])", [str(resourceinstanceid) for resourceinstanceid in resourceinstanceids]
+    elif tileids is not None:
+        condition, value = "tileid = ANY(%s::uuid[])", [str(tileid) for tileid in tileids]
+    elif tileid is not None:
+        condition, value = "tileid = %s", str(tileid)
+    else:
+        condition, value = "resourceinstanceid = %s", str(resourceinstanceid)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT nodeid, ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent) FROM (
+                SELECT nodeid, ST_Extent(ST_Transform(geom, 4326)) AS extent FROM geojson_geometries WHERE {0} GROUP BY nodeid
+            ) AS e;""".format(
+                condition
+            ),
+            [value],
+        )
+        return {str(row[0]): [tuple(row[1:])] for row in cursor.fetchall()}
+
+
+def insert_geometries(cursor, tileids):
+    """
+    Inserts the geometries of the geometry nodes of a list of saved tiles into geojson_geometries,
+    the tiles mustn't have rows in geojson_geometries yet
+
+    """
+
+    cursor.execute(
+        """
+        INSERT INTO geojson_geometries(tileid, resourceinstanceid, nodeid, geom)
+        SELECT t.tileid,
+            t.resourceinstanceid,
+            n.nodeid,
+            ST_Force2D(
+                ST_Transform(
+                    ST_SetSRID(st_geomfromgeojson((json_array_elements(t.tiledata::json->n.nodeid::text->'features')->'geometry')::text), 4326),
+                    3857
+                )
+            ) AS geom
+        FROM tiles t
+            JOIN nodes n ON t.nodegroupid = n.nodegroupid
+        WHERE n.datatype = 'geojson-feature-collection' AND t.tileid = ANY(%s::uuid[]);
+        """,
+        [tileids],
+    )
+
+
+def refresh_geometries(tileids):
+    """
+    Rebuilds the rows of geojson_geometries of a list of saved tiles from their data, rather than refreshing every tile's,
+    returns the bounds of the tiles' previous and new geometries keyed by geometry node (see geometries_changed)
+
+    """
+
+    tileids = [str(tileid) for tileid in tileids]
+    bounds_by_node = get_geometry_bounds(tileids=tileids)
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM geojson_geometries WHERE tileid = ANY(%s::uuid[]);", [tileids])
+        insert_geometries(cursor, tileids)
+    for nodeid, bounds_list in get_geometry_bounds(tileids=tileids).items():
+        bounds_by_node.setdefault(nodeid, []).extend(bounds_list)
+    return bounds_by_node
+
+
+def geometries_changed(bounds_by_node):
+    """
+    Once the current transaction has been committed, clears the cached tiles of geometry nodes whose geometries
+    have changed within it and schedules their cluster pyramids to be updated within the changed bounds
+    (see schedule_cluster_refresh)
+
+    Arguments:
+    bounds_by_node -- a dict of lists of (minx, miny, maxx, maxy) tuples in longitude and latitude keyed by the id
+        of the geometry node, covering both the previous and the new geometries
+
+    """
+
+    for nodeid, bounds_list in bounds_by_node.items():
+        if len(bounds_list) > 0:
+            transaction.on_commit(lambda nodeid=nodeid, bounds_list=bounds_list: schedule_cluster_refresh(nodeid, bounds_list))
+
+
+def schedule_cluster_refresh(nodeid, bounds_list):
+    """
+    Clears the cached tiles of a geometry node within a list of bounds and schedules a celery task to refresh
+    the node's cluster pyramid within them, if the task can't be sent to a broker the pyramid is refreshed straight away
+
+    Arguments:
+    nodeid -- the id of the geometry node
+    bounds_list -- a list of (minx, miny, maxx, maxy) tuples in longitude and latitude
+
+    """
+
+    from arches.app.tasks import refresh_geometry_clusters
+
+    clear_cached_tiles(nodeid, bounds_list)
+    if settings.CELERY_BROKER_URL != "":
+        try:
+            refresh_geometry_clusters.apply_async((str(nodeid), [list(bounds) for bounds in bounds_list]))
+            return
+        except Exception as e:
+            logger.warning("Unable to schedule the refresh of the map clusters of node %s, refreshing them now", nodeid)
+            logger.exception(e)
+    refresh_clusters(models.Node.objects.get(pk=nodeid), bounds_list)
+    clear_cached_clusters(nodeid)
+
+
+def get_tile_cache_key(node, zoom, x, y, fingerprint=None, generations=None):
+    """
+    Returns the key a tile is cached under for users with the restrictions of a fingerprint
+    (see permission_backend.get_restricted_instances_fingerprint)
+
+    The key includes a generation of the node's tiles, which is replaced to invalidate all of them at once,
+    and for clustered zoom levels a generation of the node's clusters, which is replaced whenever any of the node's
+    geometries change because a change anywhere can move a cluster into or out of a tile, or for other zoom levels
+    a generation of the tile itself, which is removed to invalidate the tile for every fingerprint (see clear_cached_tiles)
+
+    Keyword Arguments:
+    fingerprint -- the fingerprint of the restrictions of the users the tile is for, None for users without restrictions
+    generations -- the generation of the node's tiles and of its clusters, looked up if not supplied
+
+    """
+
+    generation, cluster_generation = _get_generations(node.nodeid) if generations is None else generations
+    fingerprint = "" if fingerprint is None else fingerprint
+    if zoom <= int(node.config["clusterMaxZoom"]):
+        return f"mvt_{node.nodeid}_{generation}_{cluster_generation}_{fingerprint}_{zoom}_{x}_{y}"
+    tile_generation = _get_generation(_get_tile_generation_key(node.nodeid, zoom, x, y), settings.TILE_CACHE_TIMEOUT)
+    return f"mvt_{node.nodeid}_{generation}_{tile_generation}_{fingerprint}_{zoom}_{x}_{y}"
+
+
+def clear_cached_tiles(nodeid, bounds_list=None):
+    """
+    Invalidates the cached tiles of a geometry node that intersect any of a list of bounding boxes, for users with any restrictions
+
+    If the bounding boxes cover too many tiles (settings.TILE_CACHE_INVALIDATION_TILE_LIMIT) or no bounding boxes are
+    given then all the node's cached tiles are invalidated
+
+    Arguments:
+    nodeid -- the id of the geometry node
+
+    Keyword Arguments:
+    bounds_list -- a list of (minx, miny, maxx, maxy) tuples in longitude and latitude
+
+    """
+
+    node = models.Node.objects.get(pk=nodeid)
+    _replace_generation(f"mvt_cluster_generation_{nodeid}")
+    if bounds_list is None or node.config is None:
+        _replace_generation(f"mvt_generation_{nodeid}")
+        return
+
+    keys = set()
+    for zoom in range(int(node.config["clusterMaxZoom"]) + 1, settings.TILE_CACHE_INVALIDATION_MAX_ZOOM + 1):
+        for bounds in bounds_list:
+            minx, miny, maxx, maxy = get_tile_range(bounds, zoom)
+            if len(keys) + (maxx - minx + 1) * (maxy - miny + 1) > settings.TILE_CACHE_INVALIDATION_TILE_LIMIT:
+                _replace_generation(f"mvt_generation_{nodeid}")
+                return
+            for x in range(minx, maxx + 1):
+                for y in range(miny, maxy + 1):
+                    keys.add(_get_tile_generation_key(nodeid, zoom, x, y))
+    # the tiles cached under the removed generations can no longer be looked up and expire from the cache
+    cache.delete_many(list(keys))
+
+
+def get_tile_range(bounds, zoom):
+    """
+    Returns the range of tile x and y coordinates (minx, miny, maxx, maxy) at a zoom level that
+    intersect a bounding box given in longitude and latitude
+
+    """
+
+    minlon, minlat, maxlon, maxlat = bounds
+    minx, maxy = _get_tile_xy(minlon, minlat, zoom)
+    maxx, miny = _get_tile_xy(maxlon, maxlat, zoom)
+    return minx, miny, maxx, maxy
+
+
+def _get_tile_xy(lon, lat, zoom):
+    n = 1 << zoom
+    lat = math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2.0 * n)
+    return max(0, min(x, n - 1)), max(0, min(y, n - 1))
+
+
+def clear_cached_clusters(nodeid):
+    """
+    Invalidates the cached tiles of the clustered zoom levels of a geometry node, after its cluster pyramid has been refreshed
+
+    """
+
+    _replace_generation(f"mvt_cluster_generation_{nodeid}")
+
+
+def _get_generations(nodeid):
+    keys = [f"mvt_generation_{nodeid}", f"mvt_cluster_generation_{nodeid}"]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generations[key] = _get_generation(key)
+    return generations[keys[0]], generations[keys[1]]
+
+
+def _get_generation(key, timeout=None):
+    generation = cache.get(key)
+    if generation is None:
+        generation = str(uuid.uuid4())
+        if not cache.add(key, generation, timeout):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def _get_tile_generation_key(nodeid, zoom, x, y):
+    return f"mvt_tile_generation_{nodeid}_{zoom}_{x}_{y}"
+
+
+def _replace_generation(key):
+    cache.set(key, str(uuid.uuid4()), None)
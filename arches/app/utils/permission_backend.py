@@ -1,7 +1,10 @@
+import uuid
+import hashlib
 from arches.app.models.models import Node, TileModel, EditLog
 from arches.app.models.system_settings import settings
 from guardian.backends import check_support
 from guardian.backends import ObjectPermissionBackend
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from guardian.core import ObjectPermissionChecker
 from guardian.shortcuts import (
@@ -16,10 +19,8 @@ from guardian.shortcuts import (
 from guardian.models import GroupObjectPermission, UserObjectPermission
 from guardian.exceptions import WrongAppError
 from django.contrib.auth.models import User, Group, Permission
-from arches.app.models.models import ResourceInstance
-from arches.app.search.search_engine_factory import SearchEngineFactory
-from arches.app.search.elasticsearch_dsl_builder import Bool, Query, Terms, Nested
-from arches.app.search.mappings import RESOURCES_INDEX
+from django.contrib.contenttypes.models import ContentType
+from arches.app.models.models import ResourceInstance, ResourceInstanceRestriction
 
 
 class PermissionBackend(ObjectPermissionBackend):
@@ -69,7 +70,7 @@ def get_restricted_users(resource):
     for user, perms in user_and_group_perms.items():
         if user.is_superuser:
             pass
-        elif user in user_perms and "no_access_to_resourceinstance" in user_perms[user]:
+        elif user.is_active and user in user_perms and "no_access_to_resourceinstance" in user_perms[user]:
             for k, v in result.items():
                 v.append(user.id)
         else:
@@ -85,38 +86,229 @@ def get_restricted_users(resource):
     return result
 
 
-def get_restricted_instances(user, search_engine=None, allresources=False):
+def get_restricted_users_bulk(resources):
+    """
+    Takes a list of resource instances and identifies which users are explicitly restricted from
+    reading, editing, deleting, or accessing each of them using a handful of set based queries
+    rather than the two permission lookups per resource required by get_restricted_users
+
+    returns a dictionary keyed by resource instance id (as a string) of the same results get_restricted_users returns
+
+    """
+
+    return _get_restricted_users_by_id([str(resource.resourceinstanceid) for resource in resources])
+
+
+def _get_restricted_users_by_id(resourceids):
+    content_type = ContentType.objects.get_for_model(ResourceInstance)
+    user_perms = {}
+    group_perms = {}
+    for object_pk, user_id, codename in UserObjectPermission.objects.filter(
+        content_type=content_type, object_pk__in=resourceids
+    ).values_list("object_pk", "user_id", "permission__codename"):
+        user_perms.setdefault(object_pk, {}).setdefault(user_id, set()).add(codename)
+    for object_pk, group_id, codename in GroupObjectPermission.objects.filter(
+        content_type=content_type, object_pk__in=resourceids
+    ).values_list("object_pk", "group_id", "permission__codename"):
+        group_perms.setdefault(object_pk, {}).setdefault(group_id, set()).add(codename)
+
+    group_ids = {group_id for perms in group_perms.values() for group_id in perms}
+    group_members = {}
+    for group_id, user_id in User.groups.through.objects.filter(group_id__in=group_ids).values_list("group_id", "user_id"):
+        group_members.setdefault(group_id, set()).add(user_id)
+
+    user_ids = {user_id for perms in user_perms.values() for user_id in perms}
+    user_ids |= {user_id for members in group_members.values() for user_id in members}
+    users = {
+        user_id: (is_superuser, is_active)
+        for user_id, is_superuser, is_active in User.objects.filter(pk__in=user_ids).values_list("id", "is_superuser", "is_active")
+    }
+
+    ret = {}
+    for resourceid in resourceids:
+        result = {
+            "no_access": [],
+            "cannot_read": [],
+            "cannot_write": [],
+            "cannot_delete": [],
+        }
+        resource_user_perms = user_perms.get(resourceid, {})
+        resource_group_perms = group_perms.get(resourceid, {})
+        user_and_group_perms = {user_id: set(perms) for user_id, perms in resource_user_perms.items()}
+        for group_id, perms in resource_group_perms.items():
+            for user_id in group_members.get(group_id, ()):
+                user_and_group_perms.setdefault(user_id, set()).update(perms)
+
+        for user_id in sorted(user_and_group_perms):
+            is_superuser, is_active = users[user_id]
+            if is_superuser:
+                pass
+            elif is_active and "no_access_to_resourceinstance" in resource_user_perms.get(user_id, ()):
+                for k, v in result.items():
+                    v.append(user_id)
+            else:
+                # inactive users have no object permissions (see guardian.core.ObjectPermissionChecker),
+                # including an explicit no access permission
+                perms = user_and_group_perms[user_id] if is_active else set()
+                if "view_resourceinstance" not in perms:
+                    result["cannot_read"].append(user_id)
+                if "change_resourceinstance" not in perms:
+                    result["cannot_write"].append(user_id)
+                if "delete_resourceinstance" not in perms:
+                    result["cannot_delete"].append(user_id)
+                if "no_access_to_resourceinstance" in perms and len(perms) == 1:
+                    result["no_access"].append(user_id)
+        ret[resourceid] = result
+
+    return ret
+
+
+def get_restricted_instances(user, allresources=False):
+    """
+    Returns a list of the ids of the resource instances a user has no access to,
+    or if allresources is True the ids of the resource instances with a no access permission for any user or group
+
+    The ids are read from the database and kept in the cache
+    under a version that changes whenever the restrictions are refreshed
+
+    Arguments:
+    user -- the user to get the restricted instances of
+
+    Keyword Arguments:
+    allresources -- True to return the instances with a no access permission, whoever it's for
+
+    """
+
     if allresources is False and user.is_superuser is True:
         return []
 
     if allresources is True:
-        restricted_group_instances = {
-            perm["object_pk"]
-            for perm in GroupObjectPermission.objects.filter(permission__codename="no_access_to_resourceinstance").values("object_pk")
-        }
-        restricted_user_instances = {
-            perm["object_pk"]
-            for perm in UserObjectPermission.objects.filter(permission__codename="no_access_to_resourceinstance").values("object_pk")
-        }
-        all_restricted_instances = list(restricted_group_instances | restricted_user_instances)
-        return all_restricted_instances
+        cache_key = f"restricted_instances_{get_restricted_instances_version()}_all"
     else:
-        terms = Terms(field="permissions.users_with_no_access", terms=[str(user.id)])
-        query = Query(search_engine, start=0, limit=settings.SEARCH_RESULT_LIMIT)
-        has_access = Bool()
-        nested_term_filter = Nested(path="permissions", query=terms)
-        has_access.must(nested_term_filter)
-        query.add_query(has_access)
-        results = query.search(index=RESOURCES_INDEX, scroll="1m")
-        scroll_id = results["_scroll_id"]
-        total = results["hits"]["total"]["value"]
-        if total > settings.SEARCH_RESULT_LIMIT:
-            pages = total // settings.SEARCH_RESULT_LIMIT
-            for page in range(pages):
-                results_scrolled = query.se.es.scroll(scroll_id=scroll_id, scroll="1m")
-                results["hits"]["hits"] += results_scrolled["hits"]["hits"]
-        restricted_ids = [res["_id"] for res in results["hits"]["hits"]]
-        return restricted_ids
+        cache_key = f"restricted_instances_{get_restricted_instances_version()}_{user.id}"
+
+    restricted_ids = cache.get(cache_key)
+    if restricted_ids is None:
+        if allresources is True:
+            # a group's no access permission restricts the instance even while the group has no members
+            restricted_ids = {
+                str(resourceid)
+                for resourceid in GroupObjectPermission.objects.filter(permission__codename="no_access_to_resourceinstance").values_list(
+                    "object_pk", flat=True
+                )
+            }
+            restricted_ids |= {
+                str(resourceid)
+                for resourceid in UserObjectPermission.objects.filter(permission__codename="no_access_to_resourceinstance").values_list(
+                    "object_pk", flat=True
+                )
+            }
+            restricted_ids = list(restricted_ids)
+        else:
+            restrictions = ResourceInstanceRestriction.objects.filter(user_id=user.id)
+            restricted_ids = [str(resourceid) for resourceid in restrictions.values_list("resourceinstance_id", flat=True)]
+        cache.set(cache_key, restricted_ids, settings.RESTRICTED_INSTANCES_CACHE_TIMEOUT)
+    return list(restricted_ids)
+
+
+def get_restricted_instances_among(user, resourceids):
+    """
+    Returns the set of ids, out of a list of resource instance ids, of the instances a user has no access to
+
+    Only the given instances are looked up, so the cost doesn't grow with the number of instances the user is restricted from
+
+    """
+
+    if user.is_superuser is True or len(resourceids) == 0:
+        return set()
+    restrictions = ResourceInstanceRestriction.objects.filter(user_id=user.id, resourceinstance_id__in=resourceids)
+    return {str(resourceid) for resourceid in restrictions.values_list("resourceinstance_id", flat=True)}
+
+
+def exclude_restricted_instances(queryset, user, field="resourceinstance_id"):
+    """
+    Excludes the rows of a queryset that belong to resource instances a user has no access to,
+    the restrictions are applied by the database as a subquery
+
+    Arguments:
+    queryset -- the queryset to filter
+    user -- the user to filter the queryset for
+
+    Keyword Arguments:
+    field -- the field of the queryset's model holding the resource instance id
+
+    """
+
+    if user.is_superuser is True:
+        return queryset
+    restricted = ResourceInstanceRestriction.objects.filter(user_id=user.id).values("resourceinstance_id")
+    return queryset.exclude(**{f"{field}__in": restricted})
+
+
+def get_restricted_instances_fingerprint(user):
+    """
+    Returns a fingerprint of the set of resource instances a user has no access to,
+    or None if the user isn't restricted from any instances
+
+    Users that are restricted from exactly the same instances share the same fingerprint
+
+    """
+
+    if user.is_superuser is True:
+        return None
+
+    cache_key = f"restricted_instances_fingerprint_{get_restricted_instances_version()}_{user.id}"
+    fingerprint = cache.get(cache_key)
+    if fingerprint is None:
+        restricted_ids = sorted(get_restricted_instances(user))
+        fingerprint = hashlib.sha1(",".join(restricted_ids).encode()).hexdigest() if len(restricted_ids) > 0 else ""
+        cache.set(cache_key, fingerprint, settings.RESTRICTED_INSTANCES_CACHE_TIMEOUT)
+    return fingerprint if fingerprint != "" else None
+
+
+def get_restricted_instances_version():
+    """
+    Returns the current version of the cached restricted instance lists
+
+    """
+
+    version = cache.get("restricted_instances_version")
+    if version is None:
+        version = str(uuid.uuid4())
+        if not cache.add("restricted_instances_version", version, None):
+            version = cache.get("restricted_instances_version", version)
+    return version
+
+
+def refresh_restricted_instances(resourceids=None):
+    """
+    Recalculates the users that have no access to a list of resource instances, stores them in the
+    resource_instance_restrictions table and invalidates the cached restricted instance lists
+
+    Keyword Arguments:
+    resourceids -- a list of resource instance ids, if None the restrictions of every resource instance are rebuilt
+
+    """
+
+    content_type = ContentType.objects.get_for_model(ResourceInstance)
+    if resourceids is None:
+        ResourceInstanceRestriction.objects.all().delete()
+        resourceids = set(UserObjectPermission.objects.filter(content_type=content_type).values_list("object_pk", flat=True))
+        resourceids |= set(GroupObjectPermission.objects.filter(content_type=content_type).values_list("object_pk", flat=True))
+    resourceids = sorted({str(resourceid) for resourceid in resourceids})
+
+    batch_size = settings.BULK_IMPORT_BATCH_SIZE
+    for start in range(0, len(resourceids), batch_size):
+        batch = resourceids[start : start + batch_size]
+        existing_ids = {str(resourceid) for resourceid in ResourceInstance.objects.filter(pk__in=batch).values_list("pk", flat=True)}
+        restrictions = []
+        for resourceid, restricted_users in _get_restricted_users_by_id([i for i in batch if i in existing_ids]).items():
+            for user_id in restricted_users["no_access"]:
+                restrictions.append(ResourceInstanceRestriction(resourceinstance_id=resourceid, user_id=user_id))
+        ResourceInstanceRestriction.objects.filter(resourceinstance_id__in=batch).delete()
+        ResourceInstanceRestriction.objects.bulk_create(restrictions)
+
+    cache.set("restricted_instances_version", str(uuid.uuid4()), None)
 
 
 def get_groups_for_object(perm, obj):
@@ -0,0 +1,158 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.utils.betterJSONSerializer import JSONSerializer
+from arches.app.utils import graph_metadata
+
+
+def get_constraints(nodegroupid):
+    """
+    Returns a list of (constraint, nodeids) tuples of the unique constraints of the card of a nodegroup,
+    where nodeids is the sorted list of the ids of the nodes the constraint is made of
+
+    """
+
+    return graph_metadata.get_constraints(nodegroupid)
+
+
+def get_constraint_value(tile, nodeid):
+    """
+    Returns the value a saved tile holds in a node as far as unique constraints are concerned,
+    for a tile with provisional edits this is the value of the first edit to the node
+
+    """
+
+    if tile.provisionaledits is None:
+        return tile.data.get(nodeid)
+    for edit in tile.provisionaledits.values():
+        if nodeid in edit["value"]:
+            return edit["value"][nodeid]
+    return ""
+
+
+def get_value_hash(values):
+    """
+    Returns a hash of a list of node values, values that are equal hash the same
+
+    """
+
+    serialized_values = JSONSerializer().serialize(_normalize(values), sort_keys=True)
+    return hashlib.sha1(serialized_values.encode("utf-8")).hexdigest()
+
+
+def get_tiles_with_values(constraint, values, resourceinstanceid=None, exclude_tileid=None):
+    """
+    Returns a queryset of the tiles that hold a list of values in the nodes of a constraint
+
+    Arguments:
+    constraint -- the constraint (a ConstraintModel)
+    values -- the values, in the order of the constraint's sorted node ids
+
+    Keyword Arguments:
+    resourceinstanceid -- only return tiles of this resource instance
+    exclude_tileid -- the id of a tile to leave out, usually the tile being checked
+
+    """
+
+    constraint_values = models.ConstraintValue.objects.filter(constraint=constraint, valuehash=get_value_hash(values))
+    if resourceinstanceid is not None:
+        constraint_values = constraint_values.filter(resourceinstance_id=resourceinstanceid)
+    if exclude_tileid is not None:
+        constraint_values = constraint_values.exclude(tile_id=exclude_tileid)
+    return models.TileModel.objects.filter(tileid__in=constraint_values.values("tile_id"))
+
+
+def index_tiles(tiles):
+    """
+    Updates the hashed constraint values of a list of saved tiles
+
+    """
+
+    constraints_by_nodegroup = {}
+    constraint_values = []
+    tileids = []
+    for tile in tiles:
+        nodegroupid = str(tile.nodegroup_id)
+        if nodegroupid not in constraints_by_nodegroup:
+            constraints_by_nodegroup[nodegroupid] = get_constraints(nodegroupid)
+        for constraint, nodeids in constraints_by_nodegroup[nodegroupid]:
+            constraint_values.append(_get_constraint_value_model(constraint, nodeids, tile))
+        if len(constraints_by_nodegroup[nodegroupid]) > 0:
+            tileids.append(tile.tileid)
+
+    if len(tileids) > 0:
+        models.ConstraintValue.objects.filter(tile_id__in=tileids).delete()
+        models.ConstraintValue.objects.bulk_create(constraint_values, batch_size=settings.BULK_IMPORT_BATCH_SIZE)
+
+
+def rebuild_constraint_values(constraints=None, batch_size=None):
+    """
+    Rehashes the constraint values of all the tiles constrained by a list of constraints,
+    returns the number of tiles hashed
+
+    Keyword Arguments:
+    constraints -- a list of constraint ids, if None the values of every constraint are rebuilt
+    batch_size -- the number of tiles to read and write at a time, defaults to settings.BULK_IMPORT_BATCH_SIZE
+
+    """
+
+    batch_size = settings.BULK_IMPORT_BATCH_SIZE if batch_size is None else batch_size
+    constraint_models = models.ConstraintModel.objects.select_related("card").prefetch_related("nodes")
+    if constraints is not None:
+        constraint_models = constraint_models.filter(pk__in=constraints)
+
+    count = 0
+    for constraint in constraint_models:
+        nodeids = sorted(str(node.nodeid) for node in constraint.nodes.all())
+        models.ConstraintValue.objects.filter(constraint=constraint).delete()
+        tiles = models.TileModel.objects.filter(nodegroup_id=constraint.card.nodegroup_id).only(
+            "tileid", "resourceinstance", "nodegroup", "data", "provisionaledits"
+        )
+        constraint_values = []
+        for tile in tiles.iterator(chunk_size=batch_size):
+            constraint_values.append(_get_constraint_value_model(constraint, nodeids, tile))
+            if len(constraint_values) >= batch_size:
+                models.ConstraintValue.objects.bulk_create(constraint_values)
+                count += len(constraint_values)
+                constraint_values = []
+        models.ConstraintValue.objects.bulk_create(constraint_values)
+        count += len(constraint_values)
+    return count
+
+
+def _get_constraint_value_model(constraint, nodeids, tile):
+    return models.ConstraintValue(
+        constraint=constraint,
+        tile_id=tile.tileid,
+        resourceinstance_id=tile.resourceinstance_id,
+        valuehash=get_value_hash([get_constraint_value(tile, nodeid) for nodeid in nodeids]),
+    )
+
+
+def _normalize(value):
+    # 1 and 1.0 are equal values but serialize differently
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
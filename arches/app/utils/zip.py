@@ -19,8 +19,9 @@ import os
 import zipfile
 import datetime
 from io import BytesIO
+from tempfile import TemporaryFile
 from arches.app.models import models
-from django.http import HttpResponse
+from django.http import FileResponse
 
 
 def create_zip_file(files_for_export, filekey):
@@ -29,27 +30,54 @@ def create_zip_file(files_for_export, filekey):
     """
 
     buffer = BytesIO()
-    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip:
-        for f in files_for_export:
-            f[filekey].seek(0)
-            zip.writestr(f["name"], f[filekey].read())
-
-    zip.close()
-    buffer.flush()
+    write_zip_file(files_for_export, buffer, filekey)
+    close_files(files_for_export, filekey)
     zip_stream = buffer.getvalue()
     buffer.close()
     return zip_stream
 
 
+def write_zip_file(files_for_export, dest, filekey="outputfile", chunk_size=1024 * 1024):
+    """
+    Takes a list of dictionaries, each with a file object and a name, and zips up all the files with those names into dest,
+    a binary file like object. Files are copied into the zip a chunk at a time so they never have to be held in memory whole.
+    """
+
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as zip:
+        for f in files_for_export:
+            f[filekey].seek(0)
+            with zip.open(f["name"], "w") as zipped_file:
+                chunk = f[filekey].read(chunk_size)
+                while len(chunk) > 0:
+                    zipped_file.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+                    chunk = f[filekey].read(chunk_size)
+    dest.flush()
+
+
 def zip_response(files_for_export, zip_file_name=None, filekey="outputfile"):
     """
-    Takes a list of dictionaries, each with a file object and a name, returns an HttpResponse object with a zip file.
+    Takes a list of dictionaries, each with a file object and a name, returns a streamed response of a zip file.
+    The zip file is written to a temporary file rather than memory, the response closes it once it's been sent
+    and the zipped files are closed once they've been written to it.
     """
 
-    zip_stream = create_zip_file(files_for_export, filekey)
-    response = HttpResponse()
+    dest = TemporaryFile()
+    write_zip_file(files_for_export, dest, filekey)
+    size = dest.tell()
+    dest.seek(0)
+    close_files(files_for_export, filekey)
+    response = FileResponse(dest, content_type="application/zip")
     response["Content-Disposition"] = "attachment; filename=" + zip_file_name
-    response["Content-length"] = str(len(zip_stream))
-    response["Content-Type"] = "application/zip"
-    response.write(zip_stream)
+    response["Content-length"] = str(size)
     return response
+
+
+def close_files(files_for_export, filekey="outputfile"):
+    """
+    Takes a list of dictionaries, each with a file object and a name, and closes the files once they've been written out,
+    so that the temporary files exports are written to are removed straight away
+    """
+
+    for f in files_for_export:
+        if hasattr(f[filekey], "close"):
+            f[filekey].close()
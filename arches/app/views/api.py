@@ -18,7 +18,7 @@ from urllib import parse
 from django.contrib.auth import authenticate
 from django.shortcuts import render
 from django.views.generic import View
-from django.db import transaction, connection
+from django.db import transaction
 from django.db.models import Q
 from django.http import Http404, HttpResponse
 from django.http.request import QueryDict
@@ -53,11 +53,12 @@ from arches.app.utils.permission_backend import (
     user_can_delete_resource,
     user_can_read_concepts,
     user_is_resource_reviewer,
-    get_restricted_instances,
+    exclude_restricted_instances,
     check_resource_instance_permissions,
     get_nodegroups_by_perm,
 )
 from arches.app.utils.geo_utils import GeoUtils
+from arches.app.utils import mvt
 from arches.app.search.components.base import SearchFilterFactory
 from arches.app.datatypes.datatypes import DataTypeFactory
 from arches.app.search.search_engine_factory import SearchEngineFactory
@@ -264,10 +265,9 @@ class GeoJSON(APIBase):
 
     def get_name(self, resource):
         module = importlib.import_module("arches.app.functions.primary_descriptors")
-        PrimaryDescriptorsFunction = getattr(module, "PrimaryDescriptorsFunction")()
-        functionConfig = models.FunctionXGraph.objects.filter(graph_id=resource.graph_id, function__functiontype="primarydescriptors")
-        if len(functionConfig) == 1:
-            return PrimaryDescriptorsFunction.get_primary_descriptor_from_nodes(resource, functionConfig[0].config["name"])
+        compiled_descriptors = module.get_compiled_descriptors(resource.graph_id)
+        if compiled_descriptors.configured:
+            return compiled_descriptors.get_descriptor("name", compiled_descriptors.get_tiles(resource.resourceinstanceid))
         else:
             return _("Unnamed Resource")
 
@@ -312,7 +312,6 @@ class GeoJSON(APIBase):
         property_tiles = models.TileModel.objects.filter(nodegroup_id__in=nodegroups)
         property_node_map = {}
         property_nodes = models.Node.objects.filter(nodegroup_id__in=nodegroups).order_by("sortorder")
-        restricted_resource_ids = get_restricted_instances(request.user, self.se)
         for node in property_nodes:
             property_node_map[str(node.nodeid)] = {"node": node}
             if node.fieldname is None or node.fieldname == "":
@@ -325,8 +324,7 @@ class GeoJSON(APIBase):
             tiles = tiles.filter(resourceinstance_id__in=resourceid.split(","))
         if tileid is not None:
             tiles = tiles.filter(tileid=tileid)
-        tiles = tiles.order_by("sortorder")
-        tiles = [tile for tile in tiles if str(tile.resourceinstance_id) not in restricted_resource_ids]
+        tiles = exclude_restricted_instances(tiles, request.user).order_by("sortorder")
         if limit is not None:
             start = (page - 1) * limit
             end = start + limit
@@ -387,9 +385,6 @@ class GeoJSON(APIBase):
 
 
 class MVT(APIBase):
-    EARTHCIRCUM = 40075016.6856
-    PIXELSPERTILE = 256
-
     def get(self, request, nodeid, zoom, x, y):
         if hasattr(request.user, "userprofile") is not True:
             models.UserProfile.objects.create(user=request.user)
@@ -398,88 +393,7 @@ class MVT(APIBase):
             node = models.Node.objects.get(nodeid=nodeid, nodegroup_id__in=viewable_nodegroups)
         except models.Node.DoesNotExist:
             raise Http404()
-        config = node.config
-        cache_key = f"mvt_{nodeid}_{zoom}_{x}_{y}"
-        tile = cache.get(cache_key)
-        if tile is None:
-            resource_ids = get_restricted_instances(request.user, allresources=True)
-            if len(resource_ids) == 0:
-                resource_ids.append("10000000-0000-0000-0000-000000000001")  # This must have a uuid that will never be a resource id.
-            resource_ids = tuple(resource_ids)
-            with connection.cursor() as cursor:
-                if int(zoom) <= int(config["clusterMaxZoom"]):
-                    arc = self.EARTHCIRCUM / ((1 << int(zoom)) * self.PIXELSPERTILE)
-                    distance = arc * float(config["clusterDistance"])
-                    min_points = int(config["clusterMinPoints"])
-                    distance = settings.CLUSTER_DISTANCE_MAX if distance > settings.CLUSTER_DISTANCE_MAX else distance
-                    cursor.execute(
-                        """WITH clusters(tileid, resourceinstanceid, nodeid, geom, cid)
-                        AS (
-                            SELECT m.*,
-                            ST_ClusterDBSCAN(geom, eps := %s, minpoints := %s) over () AS cid
-                            FROM (
-                                SELECT tileid,
-                                    resourceinstanceid,
-                                    nodeid,
-                                    geom
-                                FROM geojson_geometries
-                                WHERE nodeid = %s and resourceinstanceid not in %s
-                            ) m
-                        )
-
-                        SELECT ST_AsMVT(
-                            tile,
-                             %s,
-                            4096,
-                            'geom',
-                            'id'
-                        ) FROM (
-                            SELECT resourceinstanceid::text,
-                                row_number() over () as id,
-                                1 as total,
-                                ST_AsMVTGeom(
-                                    geom,
-                                    TileBBox(%s, %s, %s, 3857)
-                                ) AS geom,
-                                '' AS extent
-                            FROM clusters
-                            WHERE cid is NULL
-                            UNION
-                            SELECT NULL as resourceinstanceid,
-                                row_number() over () as id,
-                                count(*) as total,
-                                ST_AsMVTGeom(
-                                    ST_Centroid(
-                                        ST_Collect(geom)
-                                    ),
-                                    TileBBox(%s, %s, %s, 3857)
-                                ) AS geom,
-                                ST_AsGeoJSON(
-                                    ST_Extent(geom)
-                                ) AS extent
-                            FROM clusters
-                            WHERE cid IS NOT NULL
-                            GROUP BY cid
-                        ) as tile;""",
-                        [distance, min_points, nodeid, resource_ids, nodeid, zoom, x, y, zoom, x, y],
-                    )
-                else:
-                    cursor.execute(
-                        """SELECT ST_AsMVT(tile, %s, 4096, 'geom', 'id') FROM (SELECT tileid,
-                            id,
-                            resourceinstanceid,
-                            nodeid,
-                            ST_AsMVTGeom(
-                                geom,
-                                TileBBox(%s, %s, %s, 3857)
-                            ) AS geom,
-                            1 AS total
-                        FROM geojson_geometries
-                        WHERE nodeid = %s and resourceinstanceid not in %s) AS tile;""",
-                        [nodeid, zoom, x, y, nodeid, resource_ids],
-                    )
-                tile = bytes(cursor.fetchone()[0])
-                cache.set(cache_key, tile, settings.TILE_CACHE_TIMEOUT)
+        tile = mvt.get_tile(node, zoom, x, y, request.user)
         if not len(tile):
             raise Http404()
         return HttpResponse(tile, content_type="application/x-protobuf")
@@ -614,7 +528,8 @@ class Resources(APIBase):
                     models.ResourceInstance.objects.get(pk=resourceid)  # check for existance
                     exporter = ResourceExporter(format=format)
                     output = exporter.writer.write_resources(resourceinstanceids=[resourceid], indent=indent, user=request.user)
-                    out = output[0]["outputfile"].getvalue()
+                    with output[0]["outputfile"] as outputfile:
+                        out = outputfile.getvalue()
                 except models.ResourceInstance.DoesNotExist:
                     logger.error(_("The specified resource '{0}' does not exist. JSON-LD export failed.".format(resourceid)))
                     return JSONResponse(status=404)
@@ -1448,6 +1363,14 @@ class Tile(APIBase):
             return JSONResponse(_("Tile not found."), status=404)
 
     def post(self, request, tileid):
+        if tileid in (None, "") and len(dict(request.POST.items())) == 0 and len(dict(request.FILES.items())) == 0:
+            try:
+                data = JSONDeserializer().deserialize(request.body)
+            except ValueError:
+                data = None
+            if isinstance(data, list):
+                return self.bulk_post(request, data)
+
         tileview = TileView()
         tileview.action = "update_tile"
         # check that no data is on POST or FILES before assigning body to POST (otherwise request fails)
@@ -1456,6 +1379,31 @@ class Tile(APIBase):
             request.POST["data"] = request.body
         return tileview.post(request)
 
+    def bulk_post(self, request, data):
+        """
+        Saves a list of tiles posted as a json array in one go (see Tile.bulk_save)
+
+        Querystring parameters:
+        transaction_id -- the id of the edit log transaction to record the edits under
+
+        """
+
+        tiles = [TileProxyModel(tiledata) for tiledata in data]
+        permitted_nodegroups = {str(nodegroup.pk) for nodegroup in get_nodegroups_by_perm(request.user, "models.write_nodegroup")}
+        for tile in tiles:
+            for flattened_tile in tile.get_flattened_tiles():
+                if str(flattened_tile.nodegroup_id) not in permitted_nodegroups:
+                    return JSONResponse(_("User does not have permission to edit this node."), status=403)
+        for resourceid in {str(tile.resourceinstance_id) for tile in tiles}:
+            if not user_can_edit_resource(request.user, resourceid):
+                return JSONResponse(_("User does not have permission to edit this resource."), status=403)
+
+        try:
+            saved_tiles = TileProxyModel.bulk_save(tiles, user=request.user, transaction_id=request.GET.get("transaction_id"))
+        except TileValidationError as e:
+            return JSONResponse({"error": e.message}, status=400)
+        return JSONResponse({"tileids": [tile.tileid for tile in saved_tiles]}, status=200)
+
 
 @method_decorator(csrf_exempt, name="dispatch")
 class Node(APIBase):
@@ -418,7 +418,7 @@ class GraphDataView(View):
         elif self.action == "delete_instances":
             try:
                 graph = Graph.objects.get(graphid=graphid)
-                graph.delete_instances()
+                graph.delete_instances(user=request.user)
                 return JSONResponse(
                     {
                         "success": True,
@@ -434,13 +434,15 @@ class GraphDataView(View):
             try:
                 graph = Graph.objects.get(graphid=graphid)
                 if graph.isresource:
-                    graph.delete_instances()
+                    graph.delete_instances(user=request.user)
                     graph.isactive = False
                     graph.save(validate=False)
                 graph.delete()
                 return JSONResponse({"success": True})
             except GraphValidationError as e:
                 return JSONErrorResponse(e.title, e.message)
+            except ModelInactiveError as e:
+                return JSONErrorResponse(e.title, e.message)
 
         return HttpResponseNotFound()
 
@@ -54,6 +54,7 @@ from arches.app.utils.permission_backend import (
     user_can_delete_resource,
     user_can_edit_resource,
     user_can_read_resource,
+    refresh_restricted_instances,
 )
 from arches.app.utils.response import JSONResponse, JSONErrorResponse
 from arches.app.search.search_engine_factory import SearchEngineFactory
@@ -393,6 +394,7 @@ class ResourcePermissionDataView(View):
         assign_perm("change_resourceinstance", user, resource)
         assign_perm("delete_resourceinstance", user, resource)
         remove_perm("no_access_to_resourceinstance", user, resource)
+        refresh_restricted_instances([resourceinstanceid])
         return self.get_instance_permissions(resource)
 
     def make_instance_public(self, resourceinstanceid, graphid=None):
@@ -433,6 +435,8 @@ class ResourcePermissionDataView(View):
                 resource.graph_id = resource_instance.graph_id
                 resource.index()
 
+            refresh_restricted_instances([instance["resourceinstanceid"] for instance in data["selectedInstances"]])
+
 
 @method_decorator(can_edit_resource_instance, name="dispatch")
 class ResourceEditLogView(BaseManagerView):
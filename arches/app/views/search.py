@@ -18,6 +18,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from base64 import b64decode
 from datetime import datetime
+import hashlib
 import logging
 import os
 import json
@@ -25,7 +26,7 @@ from django.contrib.auth import authenticate
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.cache import cache
 from django.db import connection
-from django.http import HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils.translation import ugettext as _
 from arches.app.models import models
@@ -42,7 +43,7 @@ from arches.app.search.components.base import SearchFilterFactory
 from arches.app.search.mappings import RESOURCES_INDEX
 from arches.app.views.base import MapBaseManagerView
 from arches.app.models.concept import get_preflabel_from_conceptid
-from arches.app.utils.permission_backend import get_nodegroups_by_perm, user_is_resource_reviewer
+from arches.app.utils.permission_backend import get_nodegroups_by_perm, get_restricted_instances_fingerprint, user_is_resource_reviewer
 import arches.app.utils.zip as zip_utils
 import arches.app.utils.task_management as task_management
 from arches.app.utils.data_management.resources.formats.htmlfile import HtmlWriter
@@ -287,10 +288,9 @@ def get_dsl_from_search_string(request):
     return JSONResponse(dsl)
 
 
-def search_results(request, returnDsl=False):
+def search_results(request, returnDsl=False, stream=True):
     for_export = request.GET.get("export")
     pages = request.GET.get("pages", None)
-    total = int(request.GET.get("total", "0"))
     resourceinstanceid = request.GET.get("id", None)
     load_tiles = request.GET.get("tiles", False)
     if load_tiles:
@@ -298,18 +298,11 @@ def search_results(request, returnDsl=False):
             load_tiles = json.loads(load_tiles)
         except TypeError:
             pass
-    se = SearchEngineFactory().create()
     permitted_nodegroups = get_permitted_nodegroups(request.user)
-    include_provisional = get_provisional_type(request)
     search_filter_factory = SearchFilterFactory(request)
-    search_results_object = {"query": Query(se)}
 
     try:
-        for filter_type, querystring in list(request.GET.items()) + [("search-results", "")]:
-            search_filter = search_filter_factory.get_filter(filter_type)
-            if search_filter:
-                search_filter.append_dsl(search_results_object, permitted_nodegroups, include_provisional)
-        append_instance_permission_filter_dsl(request, search_results_object)
+        search_results_object = get_search_results_object(request, search_filter_factory, permitted_nodegroups)
     except Exception as err:
         logger.exception(err)
         return JSONErrorResponse(message=err)
@@ -332,33 +325,37 @@ def search_results(request, returnDsl=False):
     dsl.include("provisional_resource")
     if load_tiles:
         dsl.include("tiles")
+    dsl.dsl["track_total_hits"] = settings.SEARCH_TRACK_TOTAL_HITS
     if for_export or pages:
-        results = dsl.search(index=RESOURCES_INDEX, scroll="1m")
-        scroll_id = results["_scroll_id"]
-        if not pages:
-            if total <= settings.SEARCH_EXPORT_LIMIT:
-                pages = (total // settings.SEARCH_RESULT_LIMIT) + 1
-            if total > settings.SEARCH_EXPORT_LIMIT:
-                pages = int(settings.SEARCH_EXPORT_LIMIT // settings.SEARCH_RESULT_LIMIT) - 1
-        for page in range(int(pages)):
-            results_scrolled = dsl.se.es.scroll(scroll_id=scroll_id, scroll="1m")
-            results["hits"]["hits"] += results_scrolled["hits"]["hits"]
+        limit = (int(pages) + 1) * settings.SEARCH_RESULT_LIMIT if pages else settings.SEARCH_EXPORT_LIMIT
+        content = stream_search_results(request, dsl, search_results_object, search_filter_factory, permitted_nodegroups, limit)
+        if not stream:
+            # for callers within arches that read the content of the response
+            return HttpResponse("".join(content), content_type="application/json")
+        return StreamingHttpResponse(content, content_type="application/json")
+    if resourceinstanceid is None and settings.SEARCH_RESULTS_CACHE_TIMEOUT:
+        cache_key = get_search_results_cache_key(request, dsl, permitted_nodegroups)
+        results = cache.get(cache_key)
+        if results is None:
+            results = dsl.search(index=RESOURCES_INDEX)
+            if results is not None:
+                cache.set(cache_key, results, settings.SEARCH_RESULTS_CACHE_TIMEOUT)
     else:
         results = dsl.search(index=RESOURCES_INDEX, id=resourceinstanceid)
 
     ret = {}
     if results is not None:
+        try:
+            total_results = results["hits"]["total"]["value"]
+        except (KeyError, TypeError):
+            total_results = None
         if "hits" not in results:
             if "docs" in results:
                 results = {"hits": {"hits": results["docs"]}}
             else:
                 results = {"hits": {"hits": [results]}}
 
-        # allow filters to modify the results
-        for filter_type, querystring in list(request.GET.items()) + [("search-results", "")]:
-            search_filter = search_filter_factory.get_filter(filter_type)
-            if search_filter:
-                search_filter.post_search_hook(search_results_object, results, permitted_nodegroups)
+        run_post_search_hooks(request, search_filter_factory, search_results_object, results, permitted_nodegroups)
 
         ret["results"] = results
 
@@ -367,7 +364,7 @@ def search_results(request, returnDsl=False):
 
         ret["reviewer"] = user_is_resource_reviewer(request.user)
         ret["timestamp"] = datetime.now()
-        ret["total_results"] = dsl.count(index=RESOURCES_INDEX)
+        ret["total_results"] = dsl.count(index=RESOURCES_INDEX) if total_results is None else total_results
         ret["userid"] = request.user.id
         return JSONResponse(ret)
 
@@ -376,6 +373,127 @@ def search_results(request, returnDsl=False):
         return JSONResponse(ret, status=500)
 
 
+def run_post_search_hooks(request, search_filter_factory, search_results_object, results, permitted_nodegroups):
+    # allow filters to modify the results
+    for filter_type, querystring in list(request.GET.items()) + [("search-results", "")]:
+        search_filter = search_filter_factory.get_filter(filter_type)
+        if search_filter:
+            search_filter.post_search_hook(search_results_object, results, permitted_nodegroups)
+
+
+def stream_search_results(request, dsl, search_results_object, search_filter_factory, permitted_nodegroups, limit):
+    """
+    Yields the json of the response to a search a page of results at a time, paging through the results with
+    search_after so that no more than a page of results (settings.SEARCH_RESULT_LIMIT) is held in memory at once.
+    The post search hooks of the search filters are run on each page before it's written out
+
+    Arguments:
+    request -- the search request
+    dsl -- the query of the search
+    search_results_object -- the search results object the query was built in
+    search_filter_factory -- the factory of the search filters of the request
+    permitted_nodegroups -- the nodegroups the user is permitted to read
+    limit -- the maximum number of hits to return
+
+    """
+
+    serializer = JSONSerializer()
+    total_results = 0
+    count = 0
+    aggregations = None
+    yield '{"results": {"hits": {"hits": ['
+    for results in dsl.search_after_pages(index=RESOURCES_INDEX, size=settings.SEARCH_RESULT_LIMIT):
+        total_results = results["hits"]["total"]["value"]
+        results["hits"]["hits"] = results["hits"]["hits"][: limit - count]
+        run_post_search_hooks(request, search_filter_factory, search_results_object, results, permitted_nodegroups)
+        if aggregations is None:
+            # every page is aggregated over all the results, the first page's aggregations are returned
+            aggregations = results.get("aggregations")
+        for hit in results["hits"]["hits"]:
+            yield ("," if count > 0 else "") + serializer.serialize(hit)
+            count += 1
+        if count >= limit:
+            break
+    yield '], "total": {0}}}'.format(serializer.serialize({"value": total_results, "relation": "eq"}))
+    if aggregations is not None:
+        yield ', "aggregations": {0}'.format(serializer.serialize(aggregations))
+    yield "}"
+
+    ret = dict(search_results_object)
+    ret["reviewer"] = user_is_resource_reviewer(request.user)
+    ret["timestamp"] = datetime.now()
+    ret["total_results"] = total_results
+    ret["userid"] = request.user.id
+    for key, value in ret.items():
+        yield ", {0}: {1}".format(serializer.serialize(key), serializer.serialize(value))
+    yield "}"
+
+
+def get_search_results_cache_key(request, dsl, permitted_nodegroups):
+    """
+    Returns the key the results of a search are cached under, made from the query and a fingerprint of
+    the user's permissions so that users only ever share results with users who can see the same things
+
+    """
+
+    fingerprint = [
+        sorted(str(nodegroupid) for nodegroupid in permitted_nodegroups),
+        user_is_resource_reviewer(request.user),
+        get_restricted_instances_fingerprint(request.user),
+    ]
+    key = JSONSerializer().serialize({"dsl": dsl.dsl, "start": dsl.start, "limit": dsl.limit, "permissions": fingerprint}, sort_keys=True)
+    return "search_results_{0}".format(hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+
+def get_search_results_object(request, search_filter_factory, permitted_nodegroups):
+    """
+    Returns the search results object of a search request, holding the query built by the search filters
+    under the "query" key
+
+    """
+
+    se = SearchEngineFactory().create()
+    include_provisional = get_provisional_type(request)
+    search_results_object = {"query": Query(se)}
+    for filter_type, querystring in list(request.GET.items()) + [("search-results", "")]:
+        search_filter = search_filter_factory.get_filter(filter_type)
+        if search_filter:
+            search_filter.append_dsl(search_results_object, permitted_nodegroups, include_provisional)
+    append_instance_permission_filter_dsl(request, search_results_object)
+    return search_results_object
+
+
+def search_results_hits(request, limit=None):
+    """
+    Yields the hits of a search one at a time with the tiles the user is permitted to read, paging through the results
+    with search_after so that no more than a page of results (settings.SEARCH_RESULT_LIMIT) is held in memory at once.
+    Unlike search_results the post search hooks of the search filters aren't run, as they prepare a page of results for display
+
+    Keyword Arguments:
+    limit -- the maximum number of hits to return, defaults to settings.SEARCH_EXPORT_LIMIT
+
+    """
+
+    limit = settings.SEARCH_EXPORT_LIMIT if limit is None else limit
+    permitted_nodegroups = get_permitted_nodegroups(request.user)
+    search_filter_factory = SearchFilterFactory(request)
+    search_results_object = get_search_results_object(request, search_filter_factory, permitted_nodegroups)
+    dsl = search_results_object.pop("query", None)
+    dsl.include("graph_id")
+    dsl.include("resourceinstanceid")
+    dsl.include("tiles")
+
+    count = 0
+    for results in dsl.search_after_pages(index=RESOURCES_INDEX, size=settings.SEARCH_RESULT_LIMIT):
+        for hit in results["hits"]["hits"]:
+            # only return the tiles a user is allowed to read
+            hit["_source"]["tiles"] = [tile for tile in hit["_source"].get("tiles", []) if tile["nodegroup_id"] in permitted_nodegroups]
+            yield hit
+            count += 1
+            if count >= limit:
+                return
+
+
 def get_provisional_type(request):
     """
     Parses the provisional filter data to determine if a search results will
@@ -16,10 +16,13 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+from arches.app.models import models
 from arches.app.models.graph import Graph
 from arches.app.models.system_settings import settings
+from arches.app.utils import mvt
 from django.core.management.base import BaseCommand, CommandError
 from django.core.cache import cache
+from django.contrib.auth.models import User
 from arches.app.utils.betterJSONSerializer import JSONSerializer
 
 
@@ -32,6 +35,19 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("operation", nargs="?", help="operation 'livereload' starts livereload for this project on port 35729")
 
+        parser.add_argument(
+            "-z", "--maxzoom", action="store", type=int, dest="maxzoom", default=5, help="The highest zoom level of map tiles to cache"
+        )
+
+        parser.add_argument(
+            "-u",
+            "--username",
+            action="store",
+            dest="username",
+            default=None,
+            help="Cache map tiles for users with the same resource instance restrictions as this user",
+        )
+
     def handle(self, *args, **options):
         if options["operation"] == "graphs":
             self.cache_graphs()
@@ -42,6 +58,9 @@ class Command(BaseCommand):
         if options["operation"] == "clear":
             self.clear()
 
+        if options["operation"] == "tiles":
+            self.cache_tiles(max_zoom=options["maxzoom"], username=options["username"])
+
     def clear(self):
         cache.clear()
 
@@ -58,3 +77,9 @@ class Command(BaseCommand):
             graph_from_cache = JSONSerializer().serialize(graphc)
             graph_from_db = JSONSerializer().serialize(graph)
             print(f"Cache for {graph.name} is valid: {len(graph_from_cache) == len(graph_from_db)}")
+
+    def cache_tiles(self, max_zoom=5, username=None):
+        user = User.objects.get(username=username) if username is not None else None
+        for node in models.Node.objects.filter(datatype="geojson-feature-collection").exclude(config=None):
+            count = mvt.seed_tiles(node, max_zoom, user=user)
+            print(f"Cached {count} map tiles for {node.name}")
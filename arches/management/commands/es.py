@@ -32,6 +32,7 @@ from arches.app.search.mappings import (
     delete_resource_relations_index,
 )
 import arches.app.utils.index_database as index_database_util
+from arches.app.utils import index_queue
 
 
 class Command(BaseCommand):
@@ -54,6 +55,7 @@ class Command(BaseCommand):
                 "index_resources",
                 "index_resources_by_type",
                 "index_resource_relations",
+                "index_queue",
                 "add_index",
                 "delete_index",
             ],
@@ -66,6 +68,7 @@ class Command(BaseCommand):
             + "'index_resources'=Indexes all resources from the database"
             + "'index_resources_by_type'=Indexes only resources of a given resource_model/graph"
             + "'index_resource_relations'=Indexes all resource to resource relation records"
+            + "'index_queue'=Indexes the resources waiting in the index queue (see DEFER_RESOURCE_INDEXING)"
             + "'add_index'=Register a new index in Elasticsearch"
             + "'delete_index'=Deletes a named index from Elasticsearch",
         )
@@ -115,6 +118,25 @@ class Command(BaseCommand):
             help="Silences the status bar output during certain operations, use in celery operations for example",
         )
 
+        parser.add_argument(
+            "-mp",
+            "--processes",
+            action="store",
+            dest="processes",
+            type=int,
+            default=1,
+            help="The number of worker processes used to index resources, "
+            + "a value greater than 1 partitions the resources by id and indexes the partitions in parallel",
+        )
+
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            dest="resume",
+            default=False,
+            help="Resume an interrupted resource index, skipping the partitions of resources that were already indexed",
+        )
+
         parser.add_argument("-n", "--name ", action="store", dest="name", default=None, help="Name of the custom index")
 
     def handle(self, *args, **options):
@@ -132,18 +154,29 @@ class Command(BaseCommand):
 
         if options["operation"] == "index_database":
             self.index_database(
-                batch_size=options["batch_size"], clear_index=options["clear_index"], name=options["name"], quiet=options["quiet"]
+                batch_size=options["batch_size"],
+                clear_index=options["clear_index"],
+                name=options["name"],
+                quiet=options["quiet"],
+                processes=options["processes"],
+                resume=options["resume"],
             )
 
         if options["operation"] == "reindex_database":
-            self.reindex_database(batch_size=options["batch_size"], name=options["name"], quiet=options["quiet"])
+            self.reindex_database(
+                batch_size=options["batch_size"], name=options["name"], quiet=options["quiet"], processes=options["processes"]
+            )
 
         if options["operation"] == "index_concepts":
             index_database_util.index_concepts(clear_index=options["clear_index"], batch_size=options["batch_size"])
 
         if options["operation"] == "index_resources":
             index_database_util.index_resources(
-                clear_index=options["clear_index"], batch_size=options["batch_size"], quiet=options["quiet"]
+                clear_index=options["clear_index"],
+                batch_size=options["batch_size"],
+                quiet=options["quiet"],
+                processes=options["processes"],
+                resume=options["resume"],
             )
 
         if options["operation"] == "index_resources_by_type":
@@ -152,11 +185,17 @@ class Command(BaseCommand):
                 clear_index=options["clear_index"],
                 batch_size=options["batch_size"],
                 quiet=options["quiet"],
+                processes=options["processes"],
+                resume=options["resume"],
             )
 
         if options["operation"] == "index_resource_relations":
             index_database_util.index_resource_relations(clear_index=options["clear_index"], batch_size=options["batch_size"])
 
+        if options["operation"] == "index_queue":
+            indexed = index_queue.process_queue(batch_size=options["batch_size"])
+            print("Indexed {0} queued resources".format(indexed))
+
     def register_index(self, name):
         es_index = get_index(name)
         es_index.prepare_index()
@@ -165,16 +204,16 @@ class Command(BaseCommand):
         es_index = get_index(name)
         es_index.delete_index()
 
-    def index_database(self, batch_size, clear_index=True, name=None, quiet=False):
+    def index_database(self, batch_size, clear_index=True, name=None, quiet=False, processes=1, resume=False):
         if name is not None:
             index_database_util.index_custom_indexes(index_name=name, clear_index=clear_index, batch_size=batch_size, quiet=quiet)
         else:
-            index_database_util.index_db(clear_index=clear_index, batch_size=batch_size, quiet=quiet)
+            index_database_util.index_db(clear_index=clear_index, batch_size=batch_size, quiet=quiet, processes=processes, resume=resume)
 
-    def reindex_database(self, batch_size, name=None, quiet=False):
+    def reindex_database(self, batch_size, name=None, quiet=False, processes=1):
         self.delete_indexes(name=name)
         self.setup_indexes(name=name)
-        self.index_database(batch_size=batch_size, clear_index=False, name=name, quiet=quiet)
+        self.index_database(batch_size=batch_size, clear_index=False, name=name, quiet=quiet, processes=processes)
 
     def setup_indexes(self, name=None):
         if name is None:
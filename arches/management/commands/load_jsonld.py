@@ -19,16 +19,21 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 import os
 import json
 import time
+import pickle
+from multiprocessing import Pool
 
 from arches.app.models import models as archesmodels
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
 from arches.app.models.resource import Resource
 from arches.app.utils.data_management.resources.formats.rdffile import JsonLdReader
+from arches.app.utils.data_management.resources import copy_loader
+from arches.app.utils.data_management.resources.copy_loader import CopyLoader, copy_resources
 from arches.app.models.models import TileModel
 from arches.app.datatypes.datatypes import DataTypeFactory
-from arches.app.search.search_engine_factory import SearchEngineInstance
+from arches.app.search.search_engine_factory import SearchEngineFactory, SearchEngineInstance
 from arches.app.utils.betterJSONSerializer import JSONSerializer
+from arches.app.utils import edit_log, tile_constraints
 from arches.app.models.system_settings import settings
 
 
@@ -86,6 +91,31 @@ class Command(BaseCommand):
 
         parser.add_argument("--fast", default=0, action="store", type=int, dest="fast", help="Use bulk_save to store n records at a time")
 
+        parser.add_argument(
+            "--copy",
+            default=False,
+            action="store_true",
+            dest="copy",
+            help="In fast mode, store the records with COPY rather than bulk_create",
+        )
+
+        parser.add_argument(
+            "--defer-indexes",
+            default=False,
+            action="store_true",
+            dest="defer_indexes",
+            help="With --copy, drop the database indexes of the resource and tile tables while loading and rebuild them afterwards",
+        )
+
+        parser.add_argument(
+            "--workers",
+            default=0,
+            type=int,
+            action="store",
+            dest="workers",
+            help="In fast mode, load the records with a pool of n worker processes rather than in this process",
+        )
+
         parser.add_argument("-q", "--quiet", default=False, action="store_true", dest="quiet", help="Don't announce every record")
 
         parser.add_argument(
@@ -124,8 +154,23 @@ class Command(BaseCommand):
             print("ERROR: stripping fields not exposed to advanced search only works in fast mode")
             return
 
+        if options["copy"] and not options["fast"]:
+            print("ERROR: storing records with COPY only works in fast mode")
+            return
+
+        if options["workers"] > 1 and not options["fast"]:
+            print("ERROR: loading records with worker processes only works in fast mode")
+            return
+
         self.resources = []
-        self.load_resources(options)
+        self.copy = options["copy"]
+        self.strip_search = options["strip_search"]
+        if self.copy:
+            # the workers return the geometry nodes of the records they copy for this loader to refresh
+            with CopyLoader(defer_indexes=options["defer_indexes"]) as self.loader:
+                self.load_resources(options)
+        else:
+            self.load_resources(options)
 
     def load_resources(self, options):
 
@@ -152,7 +197,10 @@ class Command(BaseCommand):
             }
             for nodeid, datatype, srch in archesmodels.Node.objects.values_list("nodeid", "datatype", "issearchable")
         }
-        self.node_datatypes = {str(nodeid): datatype for nodeid, datatype in archesmodels.Node.objects.values_list("nodeid", "datatype")}
+
+        if options["workers"] > 1:
+            self.load_resources_in_parallel(models, options)
+            return
 
         start = time.time()
         seen = 0
@@ -160,104 +208,195 @@ class Command(BaseCommand):
 
         for m in models:
             print(f"Loading {m}")
-            graphid = graph_uuid_map.get(m, None)
+            graphid = self.get_graphid(m)
             if not graphid:
-                # Check slug
-                try:
-                    graphid = archesmodels.GraphModel.objects.get(slug=m).pk
-                except:
-                    print(f"Couldn't find a model definition for {m}; skipping")
-                    continue
+                continue
             # We have a good model, so build the pre-processed tree once
             self.reader.graphtree = self.reader.process_graph(graphid)
-            block = options["block"]
-            if block and "," not in block:
-                blocks = [block]
-            else:
-                blocks = os.listdir(f"{source}/{m}")
-                blocks.sort()
-                blocks = [b for b in blocks if b[0] not in ["_", "."]]
-                if "," in block:
-                    # {slice},{max-slices}
-                    (cslice, mslice) = block.split(",")
-                    cslice = int(cslice) - 1
-                    mslice = int(mslice)
-                    blocks = blocks[cslice::mslice]
 
             loaded_model = 0
-
-            try:
-                for b in blocks:
-                    files = os.listdir(f"{source}/{m}/{b}")
-                    files.sort()
-                    for f in files:
-                        if not f.endswith(options["suffix"]):
-                            continue
-                        elif f.startswith(".") or f.startswith("_"):
-                            continue
-
-                        if options["max"] > 0 and loaded_model >= options["max"]:
-                            raise StopIteration()
-                        seen += 1
-                        if seen <= options["skip"]:
-                            # Do it this way to keep the counts correct
-                            continue
-                        fn = f"{source}/{m}/{b}/{f}"
-                        # Check file size of record
-                        if not options["quiet"]:
-                            print(f"About to import {fn}")
-                        if options["toobig"]:
-                            sz = os.os.path.getsize(fn)
-                            if sz > options["toobig"]:
-                                if not quiet:
-                                    print(f" ... Skipping due to size:  {sz} > {options['toobig']}")
-                                continue
-                        uu = f.replace(f".{options['suffix']}", "")
-                        fh = open(fn)
-                        data = fh.read()
-                        fh.close()
-                        # FIXME Timezone / DateTime Workaround
-                        # FIXME The following line should be removed when #5669 / #6346 are closed
-                        data = data.replace("T00:00:00Z", "")
-                        jsdata = json.loads(data)
-                        jsdata = fix_js_data(data, jsdata, m)
-                        if len(uu) != 36 or uu[8] != "-":
-                            # extract uuid from data if filename is not a UUID
-                            uu = jsdata["id"][-36:]
-                        if jsdata:
-                            try:
-                                if options["fast"]:
-                                    l = self.fast_import_resource(
-                                        uu,
-                                        graphid,
-                                        jsdata,
-                                        n=options["fast"],
-                                        reload=options["force"],
-                                        quiet=options["quiet"],
-                                        strip_search=options["strip_search"],
-                                    )
-                                else:
-                                    l = self.import_resource(uu, graphid, jsdata, reload=options["force"], quiet=options["quiet"])
-                                loaded += l
-                                loaded_model += l
-                            except Exception as e:
-                                print(f"*** Failed to load {fn}:\n     {e}\n")
-                                if not options["ignore_errors"]:
-                                    raise
-                        else:
-                            print(" ... skipped due to bad data :(")
-                        if not seen % 100:
-                            print(f" ... seen {seen} / loaded {loaded} in {time.time()-start}")
-            except StopIteration as e:
-                break
-            except:
-                raise
+            for fn in self.get_files(source, m, options["block"], options["suffix"]):
+                if options["max"] > 0 and loaded_model >= options["max"]:
+                    break
+                seen += 1
+                if seen <= options["skip"]:
+                    # Do it this way to keep the counts correct
+                    continue
+                try:
+                    l = self.load_file(fn, graphid, m, options)
+                    loaded += l
+                    loaded_model += l
+                except Exception as e:
+                    print(f"*** Failed to load {fn}:\n     {e}\n")
+                    if not options["ignore_errors"]:
+                        raise
+                if not seen % 100:
+                    print(f" ... seen {seen} / loaded {loaded} in {time.time()-start}")
         if options["fast"] and self.resources:
             self.save_resources()
             self.index_resources(options["strip_search"])
             self.resources = []
         print(f"Total Time: seen {seen} / loaded {loaded} in {time.time()-start} seconds")
 
+    def load_resources_in_parallel(self, models, options):
+        """
+        Shards the files of the models across a pool of worker processes, each of which saves its shards in batches of
+        options["fast"] records, the models' graph trees are built once and shared with the workers
+
+        """
+
+        source = options["source"]
+        start = time.time()
+        seen = 0
+        graph_trees = {}
+        tasks = []
+        for m in models:
+            graphid = self.get_graphid(m)
+            if not graphid:
+                continue
+            graph_trees[str(graphid)] = self.reader.process_graph(graphid)
+            files = self.get_files(source, m, options["block"], options["suffix"])
+            if options["skip"] > seen:
+                skipped = min(options["skip"] - seen, len(files))
+                seen += skipped
+                files = files[skipped:]
+            if options["max"] > 0:
+                files = files[: options["max"]]
+            print(f"Found {len(files)} files to load for {m}")
+            for i in range(0, len(files), options["fast"]):
+                tasks.append((m, str(graphid), files[i : i + options["fast"]]))
+
+        if len(tasks) == 0:
+            print("Nothing to load")
+            return
+
+        # pickled once rather than with each task
+        shared = pickle.dumps({"graph_trees": graph_trees, "node_info": self.node_info})
+        worker_stats = {}
+        loaded = 0
+        failed = 0
+        # connections can't be shared with forked processes, each worker opens its own
+        connections.close_all()
+        pool = Pool(min(options["workers"], len(tasks)), initializer=_init_load_worker, initargs=(shared, options))
+        try:
+            for pid, task_seen, task_loaded, failures, seconds, geometry_nodeids in pool.imap_unordered(_load_files, tasks):
+                stats = worker_stats.setdefault(pid, {"seen": 0, "loaded": 0, "seconds": 0})
+                stats["seen"] += task_seen
+                stats["loaded"] += task_loaded
+                stats["seconds"] += seconds
+                seen += task_seen
+                loaded += task_loaded
+                failed += len(failures)
+                if self.copy:
+                    self.loader.geometry_nodeids |= geometry_nodeids
+                for fn, error in failures:
+                    print(f"*** Failed to load {fn}:\n     {error}\n")
+                if len(failures) > 0 and not options["ignore_errors"]:
+                    pool.terminate()
+                    break
+                print(f" ... seen {seen} / loaded {loaded} in {time.time()-start}")
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            # let the workers exit rather than terminating them
+            pool.close()
+        finally:
+            pool.join()
+
+        for pid, stats in worker_stats.items():
+            print(
+                "Worker {0}: seen {1} / loaded {2} in {3:.1f} seconds, {4:.1f} records/second".format(
+                    pid, stats["seen"], stats["loaded"], stats["seconds"], stats["loaded"] / stats["seconds"] if stats["seconds"] else 0
+                )
+            )
+        elapsed = time.time() - start
+        print(
+            f"Total Time: seen {seen} / loaded {loaded} / failed {failed} in {elapsed} seconds, "
+            f"{loaded / elapsed if elapsed else 0:.1f} records/second"
+        )
+        if failed > 0 and not options["ignore_errors"]:
+            raise CommandError(f"{failed} files failed to load")
+
+    def get_graphid(self, model):
+        graphid = graph_uuid_map.get(model, None)
+        if not graphid:
+            # Check slug
+            try:
+                graphid = archesmodels.GraphModel.objects.get(slug=model).pk
+            except:
+                print(f"Couldn't find a model definition for {model}; skipping")
+        return graphid
+
+    def get_files(self, source, model, block, suffix):
+        """
+        Returns the paths of the files of a model to load, in the order they're loaded
+
+        """
+
+        if block and "," not in block:
+            blocks = [block]
+        else:
+            blocks = os.listdir(f"{source}/{model}")
+            blocks.sort()
+            blocks = [b for b in blocks if b[0] not in ["_", "."]]
+            if "," in block:
+                # {slice},{max-slices}
+                (cslice, mslice) = block.split(",")
+                cslice = int(cslice) - 1
+                mslice = int(mslice)
+                blocks = blocks[cslice::mslice]
+
+        paths = []
+        for b in blocks:
+            files = os.listdir(f"{source}/{model}/{b}")
+            files.sort()
+            paths.extend(f"{source}/{model}/{b}/{f}" for f in files if f.endswith(suffix) and f[0] not in ["_", "."])
+        return paths
+
+    def load_file(self, fn, graphid, model, options):
+        """
+        Loads the record in a file, returns the number of records loaded (0 or 1)
+
+        """
+
+        f = os.path.basename(fn)
+        # Check file size of record
+        if not options["quiet"]:
+            print(f"About to import {fn}")
+        if options["toobig"]:
+            sz = os.path.getsize(fn) / 1024
+            if sz > options["toobig"]:
+                if not options["quiet"]:
+                    print(f" ... Skipping due to size:  {sz} > {options['toobig']}")
+                return 0
+        uu = f.replace(f".{options['suffix']}", "")
+        fh = open(fn)
+        data = fh.read()
+        fh.close()
+        # FIXME Timezone / DateTime Workaround
+        # FIXME The following line should be removed when #5669 / #6346 are closed
+        data = data.replace("T00:00:00Z", "")
+        jsdata = json.loads(data)
+        jsdata = fix_js_data(data, jsdata, model)
+        if len(uu) != 36 or uu[8] != "-":
+            # extract uuid from data if filename is not a UUID
+            uu = jsdata["id"][-36:]
+        if not jsdata:
+            print(" ... skipped due to bad data :(")
+            return 0
+        if options["fast"]:
+            return self.fast_import_resource(
+                uu,
+                graphid,
+                jsdata,
+                n=options["fast"],
+                reload=options["force"],
+                quiet=options["quiet"],
+                strip_search=options["strip_search"],
+            )
+        return self.import_resource(uu, graphid, jsdata, reload=options["force"], quiet=options["quiet"])
+
     def fast_import_resource(self, resourceid, graphid, data, n=1000, reload="ignore", quiet=True, strip_search=False):
         try:
             resource_instance = Resource.objects.get(pk=resourceid)
@@ -314,30 +453,40 @@ class Command(BaseCommand):
         return 1
 
     def save_resources(self):
+        if self.copy:
+            # the resources are indexed as they're copied unless fields that aren't searchable are to be stripped
+            copy_resources(self.resources, index=(not self.strip_search), datatype_factory=self.datatype_factory)
+            return
+
         tiles = []
         for resource in self.resources:
             resource.tiles = resource.get_flattened_tiles()
             tiles.extend(resource.tiles)
         Resource.objects.bulk_create(self.resources)
         TileModel.objects.bulk_create(tiles)
+        tile_constraints.index_tiles(tiles)
         for t in tiles:
             for nodeid in t.data.keys():
                 datatype = self.node_info[nodeid]["datatype"]
                 datatype.pre_tile_save(t, nodeid)
-        for resource in self.resources:
-            resource.save_edit(edit_type="create")
+        with edit_log.EditLogWriter():
+            for resource in self.resources:
+                resource.save_edit(edit_type="create")
 
     def index_resources(self, strip_search=False):
-        se = SearchEngineInstance
+        if self.copy and not strip_search:
+            return
+
+        se = getattr(self, "se", SearchEngineInstance)
         documents = []
         term_list = []
-        for resource in self.resources:
-            if strip_search:
-                document, terms = monkey_get_documents_to_index(resource, node_info=self.node_info)
-            else:
-                document, terms = resource.get_documents_to_index(
-                    fetchTiles=False, datatype_factory=self.datatype_factory, node_datatypes=self.node_datatypes
-                )
+        if strip_search:
+            resource_documents = [monkey_get_documents_to_index(resource, node_info=self.node_info) for resource in self.resources]
+        else:
+            resource_documents = Resource.get_documents_to_index_bulk(
+                self.resources, fetchTiles=False, datatype_factory=self.datatype_factory
+            )
+        for document, terms in resource_documents:
             documents.append(se.create_bulk_item(index="resources", id=document["resourceinstanceid"], data=document))
             for term in terms:
                 term_list.append(se.create_bulk_item(index="terms", id=term["_id"], data=term["_source"]))
@@ -345,6 +494,73 @@ class Command(BaseCommand):
         se.bulk_index(term_list)
 
 
+_load_worker = {}
+
+
+def _init_load_worker(shared, options):
+    """
+    Initializes a load worker process with its own database and search engine connections and a command
+    holding the graph trees and node info built by the parent process, the worker doesn't inherit its parent's
+    edit log writers or copy loaders, which only exit in the parent
+
+    """
+
+    connections.close_all()
+    edit_log.reset()
+    copy_loader.reset()
+    shared = pickle.loads(shared)
+    command = Command()
+    command.reader = JsonLdReader()
+    command.jss = JSONSerializer()
+    command.datatype_factory = DataTypeFactory()
+    command.se = SearchEngineFactory().create()
+    command.node_info = shared["node_info"]
+    command.graph_trees = shared["graph_trees"]
+    command.resources = []
+    command.copy = options["copy"]
+    command.strip_search = options["strip_search"]
+    _load_worker["command"] = command
+    _load_worker["options"] = options
+
+
+def _load_files(task):
+    """
+    Loads a shard of the files of a model and saves the records still waiting to be saved,
+    returns a tuple of the worker's process id, the number of files seen, the number of records loaded,
+    a list of (file, error) tuples of the files that failed to load, the time taken in seconds and the ids of
+    the geometry nodes of the records copied (for the parent's CopyLoader to refresh)
+
+    """
+
+    model, graphid, files = task
+    command = _load_worker["command"]
+    options = _load_worker["options"]
+    command.reader.graphtree = command.graph_trees[graphid]
+    start = time.time()
+    seen = 0
+    loaded = 0
+    failures = []
+    with CopyLoader(refresh_geometries=False) as loader:
+        for fn in files:
+            seen += 1
+            try:
+                loaded += command.load_file(fn, graphid, model, options)
+            except Exception as e:
+                failures.append((fn, str(e)))
+                if not options["ignore_errors"]:
+                    command.resources = []
+                    return os.getpid(), seen, loaded, failures, time.time() - start, loader.geometry_nodeids
+
+        if command.resources:
+            try:
+                command.save_resources()
+                command.index_resources(options["strip_search"])
+            except Exception as e:
+                failures.append((f"the last {len(command.resources)} records of {files[0]} to {files[-1]}", str(e)))
+            command.resources = []
+    return os.getpid(), seen, loaded, failures, time.time() - start, loader.geometry_nodeids
+
+
 def monkey_get_documents_to_index(self, node_info):
     document = {}
     document["displaydescription"] = None
@@ -197,6 +197,22 @@ class Command(BaseCommand):
             functions attached to the resource, as well as prevent some logging statements from printing to console.",
         )
 
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            dest="copy",
+            help="Bulk load new resources into the database with COPY statements, the fastest way to load large numbers of resources.",
+        )
+
+        parser.add_argument(
+            "--defer_db_indexes",
+            action="store_true",
+            dest="defer_db_indexes",
+            help="With --copy, drops the database indexes of the resource, tile, relation and geometry tables while loading \
+            and rebuilds them once the load is complete. If the load is killed before they're rebuilt, the log has the statements \
+            to recreate them with.",
+        )
+
         parser.add_argument(
             "-di",
             "--defer_indexing",
@@ -298,6 +314,8 @@ class Command(BaseCommand):
                 use_multiprocessing=options["use_multiprocessing"],
                 force=options["yes"],
                 prevent_indexing=prevent_indexing,
+                copy=options["copy"],
+                defer_db_indexes=options["defer_db_indexes"],
             )
 
             if defer_indexing and not prevent_indexing:
@@ -1026,6 +1044,7 @@ class Command(BaseCommand):
                             else:
                                 file["outputfile"].seek(0)
                                 shutil.copyfileobj(file["outputfile"], f, 16 * 1024)
+                                file["outputfile"].close()
                 except KeyError:
                     utils.print_message("{0} is not a valid export file format.".format(file_format))
                     sys.exit()
@@ -1056,6 +1075,8 @@ class Command(BaseCommand):
         use_multiprocessing=False,
         force=False,
         prevent_indexing=False,
+        copy=False,
+        defer_db_indexes=False,
     ):
         """
         Imports business data from all formats. A config file (mapping file) is required for .csv format.
@@ -1118,6 +1139,8 @@ class Command(BaseCommand):
                         use_multiprocessing=use_multiprocessing,
                         prevent_indexing=prevent_indexing,
                         transaction_id=transaction_id,
+                        copy=copy,
+                        defer_db_indexes=defer_db_indexes,
                     )
                 else:
                     utils.print_message("No file found at indicated location: {0}".format(source))
@@ -1254,6 +1277,7 @@ class Command(BaseCommand):
             for file in data:
                 with open(os.path.join(data_dest, file["name"]), "w") as f:
                     f.write(file["outputfile"].getvalue())
+                file["outputfile"].close()
         else:
             utils.print_message("No destination directory specified. Please rerun this command with the '-d' parameter populated.")
             sys.exit()
@@ -16,9 +16,13 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import importlib
 from arches.management.commands import utils
 from arches.app.models import models
 from arches.app.models.graph import Graph
+from arches.app.models.resource import Resource
+from arches.app.models.system_settings import settings
+from arches.app.utils import tile_constraints
 from django.core.management.base import BaseCommand, CommandError
 import arches.app.utils.data_management.resources.remover as resource_remover
 
@@ -41,14 +45,30 @@ class Command(BaseCommand):
             "--graph",
             action="store",
             dest="graph",
-            help="A graphid of the Resource Model you would like to remove all instances from.",
+            help="A graphid of the Resource Model you would like to remove all instances from, update the descriptors of, or index the unique constraints of.",
+        )
+
+        parser.add_argument(
+            "-b",
+            "--batch_size",
+            action="store",
+            type=int,
+            dest="batch_size",
+            default=settings.BULK_IMPORT_BATCH_SIZE,
+            help="The number of resources (or tiles when indexing unique constraints) to update or remove at a time.",
         )
 
     def handle(self, *args, **options):
         if options["operation"] == "remove_resources":
-            self.remove_resources(force=options["yes"], graphid=options["graph"])
+            self.remove_resources(force=options["yes"], graphid=options["graph"], batch_size=options["batch_size"])
+
+        if options["operation"] == "update_descriptors":
+            self.update_descriptors(graphid=options["graph"], batch_size=options["batch_size"])
 
-    def remove_resources(self, load_id="", graphid=None, force=False):
+        if options["operation"] == "index_constraints":
+            self.index_constraints(graphid=options["graph"], batch_size=options["batch_size"])
+
+    def remove_resources(self, load_id="", graphid=None, force=False, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
         """
         Runs the resource_remover command found in data_management.resources
         """
@@ -68,6 +88,49 @@ class Command(BaseCommand):
             resource_remover.clear_resources()
         else:
             graph = Graph.objects.get(graphid=graphid)
-            graph.delete_instances(verbose=True)
+            graph.delete_instances(verbose=True, batch_size=batch_size)
 
         return
+
+    def update_descriptors(self, graphid=None, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
+        """
+        Calculates and persists the descriptors (name, description and map_popup) of all the resources of a
+        Resource Model, or of every Resource Model if no graphid is given
+
+        """
+
+        module = importlib.import_module("arches.app.functions.primary_descriptors")
+        graphs = models.GraphModel.objects.filter(isresource=True).exclude(pk=settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID)
+        if graphid is not None:
+            graphs = graphs.filter(pk=graphid)
+
+        for graph in graphs:
+            compiled_descriptors = module.get_compiled_descriptors(graph.pk)
+            resourceids = list(Resource.objects.filter(graph_id=graph.pk).order_by("pk").values_list("pk", flat=True))
+            for start in range(0, len(resourceids), batch_size):
+                resources = list(Resource.objects.filter(pk__in=resourceids[start : start + batch_size]))
+                resource_tiles = {str(resource.pk): [] for resource in resources}
+                for tile in models.TileModel.objects.filter(
+                    resourceinstance_id__in=resourceids[start : start + batch_size],
+                    nodegroup_id__in=list(compiled_descriptors.nodegroupids),
+                ):
+                    resource_tiles[str(tile.resourceinstance_id)].append(tile)
+                for resource in resources:
+                    resource.descriptors = resource.get_descriptors(
+                        tiles=resource_tiles[str(resource.pk)], compiled_descriptors=compiled_descriptors
+                    )
+                Resource.objects.bulk_update(resources, ["descriptors"])
+            print("Updated the descriptors of %s %s resources" % (len(resourceids), graph.name))
+
+    def index_constraints(self, graphid=None, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
+        """
+        Rebuilds the hashed tile values used to check the unique constraints of the cards of a
+        Resource Model, or of every Resource Model if no graphid is given
+
+        """
+
+        constraints = None
+        if graphid is not None:
+            constraints = list(models.ConstraintModel.objects.filter(card__graph_id=graphid).values_list("constraintid", flat=True))
+        count = tile_constraints.rebuild_constraint_values(constraints=constraints, batch_size=batch_size)
+        print(f"Indexed the unique constraint values of {count} tiles")
@@ -530,6 +530,24 @@ SEARCH_TERM_SENSITIVITY = 3
 WORDS_PER_SEARCH_TERM = 10  # set to None for unlimited number of words allowed for search terms
 SEARCH_RESULT_LIMIT = 10000  # should be less than or equal to elasticsearch configuration, index.max_result_window (default = 10,000)
 
+# True to count every search hit, or the number of hits to count accurately up to (elasticsearch counts up to 10,000 by default)
+SEARCH_TRACK_TOTAL_HITS = True
+
+# the number of seconds to cache the results of a search for, so that repeating a search (eg. when paging back) doesn't
+# query elasticsearch again, cached results aren't updated when resources are edited, 0 to disable caching
+SEARCH_RESULTS_CACHE_TIMEOUT = 0
+
+# set to True to queue resources to be indexed by a celery worker when their tiles are saved or deleted, rather than
+# indexing them as part of the request, edits to a resource made within RESOURCE_INDEX_QUEUE_DELAY seconds of each other
+# are indexed together, pass flush_index=true with a request to have the resources it edits indexed straight away
+DEFER_RESOURCE_INDEXING = False
+RESOURCE_INDEX_QUEUE_DELAY = 5  # seconds
+
+# set to True to update only the values of the edited tiles in a resource's search document when a tile is saved or deleted,
+# rather than rebuilding and resending the whole document, edits to tiles used in the resource's descriptors still
+# rebuild the whole document, as does any edit if ELASTICSEARCH_CUSTOM_INDEXES are configured
+PARTIAL_RESOURCE_INDEX_UPDATES = False
+
 ETL_USERNAME = "ETL"  # override this setting in your packages settings.py file
 
 GOOGLE_ANALYTICS_TRACKING_ID = None
@@ -634,6 +652,9 @@ CELERY_CHECK_ONLY_INSPECT_BROKER = False
 
 AUTO_REFRESH_GEOM_VIEW = True
 TILE_CACHE_TIMEOUT = 600  # seconds
+RESTRICTED_INSTANCES_CACHE_TIMEOUT = 3600  # seconds
+TILE_CACHE_INVALIDATION_MAX_ZOOM = 22  # the highest zoom level of cached map tiles cleared when a geometry changes
+TILE_CACHE_INVALIDATION_TILE_LIMIT = 1000  # clear all of a node's cached map tiles if a geometry change touches more than this many
 CLUSTER_DISTANCE_MAX = 5000  # meters
 GRAPH_MODEL_CACHE_TIMEOUT = None  # seconds * hours * days = ~1mo
 
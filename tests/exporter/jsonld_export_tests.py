@@ -16,6 +16,7 @@ from arches.app.models.models import TileModel, ResourceInstance
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 from arches.app.utils.data_management.resources.importer import BusinessDataImporter
 from arches.app.utils.data_management.resources.exporter import ResourceExporter as BusinessDataExporter
+from arches.app.utils.data_management.resources.formats.rdffile import JsonLdReader
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as ResourceGraphImporter
 
 # these tests can be run from the command line via
@@ -547,3 +548,23 @@ class JsonLDExportTests(ArchesTestCase):
         botb = 'http://www.cidoc-crm.org/cidoc-crm/P82a_begin_of_the_begin'
         self.assertTrue(tsdata[botb]['@value'] == "2019-11-01")
 
+    def test_jsonl_export_round_trip(self):
+        graphid = "bf734b4e-f6b5-11e9-8f09-a4d18cec433a"
+        export = BusinessDataExporter("json-ld").export(graph_id=graphid)
+        self.assertTrue(export[0]["name"].endswith(".jsonl"))
+        with export[0]["outputfile"] as outputfile:
+            outputfile.seek(0)
+            documents = [json.loads(line) for line in outputfile]
+        self.assertTrue(outputfile.closed)
+
+        resourceids = [str(resourceid) for resourceid in ResourceInstance.objects.filter(graph_id=graphid).values_list("pk", flat=True)]
+        self.assertCountEqual([document["@id"].split("/")[-1] for document in documents], resourceids)
+
+        # each line reads back in as the tiles of the resource it was exported from
+        reader = JsonLdReader()
+        for document in documents:
+            resourceid = document["@id"].split("/")[-1]
+            reader.read_resource(document, resourceid=resourceid, graphid=graphid)
+            read_tiles = [tile.data for tile in reader.resources[0].tiles]
+            saved_tiles = [tile.data for tile in TileModel.objects.filter(resourceinstance_id=resourceid)]
+            self.assertCountEqual(read_tiles, saved_tiles)
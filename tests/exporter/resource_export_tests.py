@@ -19,14 +19,20 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 import os
 import json
 import csv
+import shutil
+import tempfile
+import uuid
 from io import BytesIO
+from unittest import mock
 from tests import test_settings
 from operator import itemgetter
 from django.core import management
 from tests.base_test import ArchesTestCase
 from arches.app.utils.skos import SKOSReader
-from arches.app.models.models import TileModel, ResourceInstance
+from arches.app.models.models import EditLog, TileModel, ResourceInstance
+from arches.app.models.system_settings import settings
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
+from arches.app.utils.data_management.resources import importer
 from arches.app.utils.data_management.resources.importer import BusinessDataImporter
 from arches.app.utils.data_management.resources.exporter import ResourceExporter as BusinessDataExporter
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as ResourceGraphImporter
@@ -42,6 +48,7 @@ class BusinessDataExportTests(ArchesTestCase):
         cls.loadOntology()
 
     def setUp(self):
+        self.graphid = "ab74af76-fa0e-11e6-9e3e-026d961c88e6"
         skos = SKOSReader()
         rdf = skos.read_file("tests/fixtures/data/concept_label_test_scheme.xml")
         ret = skos.save_concepts_from_skos(rdf)
@@ -58,6 +65,21 @@ class BusinessDataExportTests(ArchesTestCase):
     def tearDownClass(cls):
         pass
 
+    def reimport(self, export_file, file_name, mapping_file=None):
+        """
+        Deletes the exported resources and imports them again from an export file, closing it
+
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, file_name)
+            with export_file, open(path, "w", encoding="utf-8", newline="") as f:
+                export_file.seek(0)
+                shutil.copyfileobj(export_file, f)
+            self.assertTrue(export_file.closed)
+            ResourceInstance.objects.filter(graph_id=self.graphid).delete()
+            BusinessDataImporter(path, mapping_file=mapping_file).import_business_data()
+
     def test_csv_export(self):
         BusinessDataImporter("tests/fixtures/data/csv/resource_export_test.csv").import_business_data()
 
@@ -70,31 +92,6 @@ class BusinessDataExportTests(ArchesTestCase):
         self.assertDictEqual(dict(csv_input), dict(csv_output))
 
     def test_json_export(self):
-        def deep_sort(obj):
-            """
-            Recursively sort list or dict nested lists. Taken from
-            https://stackoverflow.com/questions/18464095/how-to-achieve-assertdictequal-with-assertsequenceequal-applied-to-values
-            """
-
-            if isinstance(obj, dict):
-                _sorted = {}
-                for key in sorted(obj):
-                    _sorted[key] = deep_sort(obj[key])
-
-            elif isinstance(obj, list):
-                new_list = []
-                for val in obj:
-                    new_list.append(deep_sort(val))
-                try:
-                    _sorted = sorted(new_list, key=itemgetter("tileid"))
-                except:
-                    _sorted = new_list
-
-            else:
-                _sorted = obj
-
-            return _sorted
-
         BusinessDataImporter("tests/fixtures/data/json/resource_export_business_data_truth.json").import_business_data()
 
         export = BusinessDataExporter("json").export("ab74af76-fa0e-11e6-9e3e-026d961c88e6")
@@ -104,3 +101,97 @@ class BusinessDataExportTests(ArchesTestCase):
         json_truth = deep_sort(json.load(open("tests/fixtures/data/json/resource_export_business_data_truth.json")))
 
         self.assertDictEqual(json_export, json_truth)
+
+    def test_csv_export_round_trip(self):
+        mapping_file = "tests/fixtures/data/csv/resource_export_test.mapping"
+        BusinessDataImporter("tests/fixtures/data/csv/resource_export_test.csv").import_business_data()
+
+        export = BusinessDataExporter("csv", configs=mapping_file, single_file=True).export()
+        csv_export = list(csv.DictReader(export[0]["outputfile"].getvalue().split("\r\n")))
+        self.reimport(export[0]["outputfile"], "resource_export_test.csv", mapping_file=mapping_file)
+
+        export = BusinessDataExporter("csv", configs=mapping_file, single_file=True).export()
+        with export[0]["outputfile"] as outputfile:
+            csv_reexport = list(csv.DictReader(outputfile.getvalue().split("\r\n")))
+
+        # the resources are given new ids when they're imported again
+        for rows in (csv_export, csv_reexport):
+            for row in rows:
+                row.pop("ResourceID")
+        self.assertGreater(len(csv_export), 0)
+        self.assertCountEqual(csv_reexport, csv_export)
+
+    def test_json_export_round_trip(self):
+        BusinessDataImporter("tests/fixtures/data/json/resource_export_business_data_truth.json").import_business_data()
+
+        export = BusinessDataExporter("json").export(self.graphid)
+        json_export = deep_sort(json.loads(export[0]["outputfile"].getvalue()))
+        self.reimport(export[0]["outputfile"], "resource_export_test.json")
+
+        export = BusinessDataExporter("json").export(self.graphid)
+        with export[0]["outputfile"] as outputfile:
+            json_reexport = deep_sort(json.loads(outputfile.getvalue()))
+
+        self.assertDictEqual(json_reexport, json_export)
+
+    def test_jsonl_import_with_multiprocessing(self):
+        class InProcessPool(object):
+            # runs the workers' initializer and chunks in this process, which can see the test's transaction
+            def __init__(self, processes, initializer, initargs):
+                initializer(*initargs)
+
+            def imap_unordered(self, func, iterable):
+                return map(func, iterable)
+
+            def terminate(self):
+                pass
+
+            def close(self):
+                pass
+
+            def join(self):
+                pass
+
+        with open("tests/fixtures/data/json/resource_export_business_data_truth.json") as f:
+            resources = json.load(f)["business_data"]["resources"]
+        transaction_id = uuid.uuid4()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "resource_export_test.jsonl")
+            with open(path, "w") as f:
+                for resource in resources:
+                    f.write(json.dumps(resource) + "\n")
+            with mock.patch.object(settings, "BULK_IMPORT_BATCH_SIZE", 1), mock.patch.object(
+                importer, "Pool", InProcessPool
+            ), mock.patch.object(importer.connections, "close_all"):
+                BusinessDataImporter(path).import_business_data(use_multiprocessing=True, transaction_id=transaction_id)
+
+        resourceids = [resource["resourceinstance"]["resourceinstanceid"] for resource in resources]
+        self.assertEqual(ResourceInstance.objects.filter(resourceinstanceid__in=resourceids).count(), len(resources))
+        edits = EditLog.objects.filter(transactionid=transaction_id, edittype="create")
+        self.assertCountEqual([str(edit.resourceinstanceid) for edit in edits], resourceids)
+
+
+def deep_sort(obj):
+    """
+    Recursively sort list or dict nested lists. Taken from
+    https://stackoverflow.com/questions/18464095/how-to-achieve-assertdictequal-with-assertsequenceequal-applied-to-values
+    """
+
+    if isinstance(obj, dict):
+        _sorted = {}
+        for key in sorted(obj):
+            _sorted[key] = deep_sort(obj[key])
+
+    elif isinstance(obj, list):
+        new_list = []
+        for val in obj:
+            new_list.append(deep_sort(val))
+        try:
+            _sorted = sorted(new_list, key=itemgetter("tileid"))
+        except:
+            _sorted = new_list
+
+    else:
+        _sorted = obj
+
+    return _sorted
@@ -16,22 +16,36 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import datetime
 import json
 import os
 import time
+import uuid
+from unittest import mock
 
 from tests import test_settings
 from django.contrib.auth.models import User, Group
 from django.core import management
+from django.db import connection
 from django.urls import reverse
 from django.test.client import Client
 from guardian.shortcuts import assign_perm, get_perms
+from arches.app.datatypes.datatypes import DataTypeFactory, StringDataType
 from arches.app.models import models
-from arches.app.models.resource import Resource
+from arches.app.models.graph import Graph
+from arches.app.models.resource import Resource, ModelInactiveError
+from arches.app.models.system_settings import settings
 from arches.app.models.tile import Tile
+from arches.app.search.elasticsearch_dsl_builder import Query, Term
+from arches.app.search.mappings import RESOURCES_INDEX
+from arches.app.search.search_engine_factory import SearchEngineInstance as se
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as resource_graph_importer
+from arches.app.utils.data_management.resources import copy_loader, remover
+from arches.app.utils.data_management.resources.importer import update_relation_graphids
 from arches.app.utils.exceptions import InvalidNodeNameException, MultipleNodesFoundException
+from arches.app.utils import index_database
+from arches.app.utils import mvt
 from arches.app.utils.index_database import index_resources_by_type
 from tests.base_test import ArchesTestCase
 
@@ -205,6 +219,55 @@ class ResourceTests(ArchesTestCase):
 
         self.assertEqual(result, "Passed")
 
+    def test_resume_reindex_by_resource_type(self):
+        """
+        Test a resumed reindex skips the completed ranges and continues the others from the last resource indexed
+        """
+
+        resourceids = ["aa000000-0000-0000-0000-00000000000{0}".format(i) for i in range(1, 4)]
+        for resourceid in resourceids:
+            Resource(graph_id=self.search_model_graphid, resourceinstanceid=resourceid).save(index=False)
+
+        ranges = index_database.get_resource_ranges()
+        self.assertEqual(len(ranges), index_database.RESOURCE_INDEX_RANGES)
+        for rangestart, rangeend in ranges:
+            checkpoint = models.ResourceIndexCheckpoint(graph_id=self.search_model_graphid, rangestart=rangestart, rangeend=rangeend)
+            if rangestart.startswith("aa"):
+                checkpoint.lastindexedid = resourceids[0]
+                checkpoint.indexed = 1
+            else:
+                checkpoint.completed = datetime.datetime.now()
+            checkpoint.save()
+
+        indexed = []
+        with mock.patch.object(index_database, "index_resource_batch") as index_resource_batch:
+            index_resource_batch.side_effect = lambda resources, *args: indexed.extend(str(r.resourceinstanceid) for r in resources)
+            index_database.index_resources_by_type(self.search_model_graphid, clear_index=False, batch_size=1, quiet=True, resume=True)
+
+        self.assertEqual(indexed, resourceids[1:])
+        checkpoint = models.ResourceIndexCheckpoint.objects.get(
+            graph_id=self.search_model_graphid, rangestart=resourceids[0][:8] + "-0000-0000-0000-000000000000"
+        )
+        self.assertEqual(str(checkpoint.lastindexedid), resourceids[2])
+        self.assertEqual(checkpoint.indexed, 3)
+        self.assertIsNotNone(checkpoint.completed)
+
+    def test_reindex_by_resource_type_command(self):
+        """
+        Test the es command reindexes every resource of a type and clears the checkpoints of a run that passed
+        """
+
+        management.call_command(
+            "es", "index_resources_by_type", resource_types=self.search_model_graphid, clear_index=True, quiet=True, resume=True
+        )
+
+        self.assertFalse(models.ResourceIndexCheckpoint.objects.filter(graph_id=self.search_model_graphid).exists())
+        query = Query(se=se)
+        query.add_query(Term(field="graph_id", term=self.search_model_graphid))
+        self.assertEqual(
+            se.count(index=RESOURCES_INDEX, body=query.dsl), Resource.objects.filter(graph_id=self.search_model_graphid).count()
+        )
+
     def test_creator_has_permissions(self):
         """
         Test user that created instance has full permissions
@@ -218,3 +281,320 @@ class ResourceTests(ArchesTestCase):
         test_resource.save(user=user)
         perms = set(get_perms(user, test_resource))
         self.assertEqual(perms, {"view_resourceinstance", "change_resourceinstance", "delete_resourceinstance"})
+
+    def test_compiled_descriptors(self):
+        """
+        Test descriptors are rendered from the cached templates and that the cache is cleared when the function config changes
+        """
+
+        config = {
+            "name": {"nodegroup_id": self.search_model_name_nodeid, "string_template": "<Name>"},
+            "description": {"nodegroup_id": "", "string_template": ""},
+            "map_popup": {"nodegroup_id": "", "string_template": ""},
+        }
+        self.assertEqual(self.test_resource.get_descriptor("name"), "undefined")
+
+        function_x_graph = models.FunctionXGraph.objects.create(
+            function_id="60000000-0000-0000-0000-000000000001", graph_id=self.search_model_graphid, config=config
+        )
+        self.assertEqual(self.test_resource.get_descriptor("name"), "Test Name 1")
+        self.assertEqual(self.test_resource.get_descriptor("description"), "Undefined")
+
+        config["name"]["string_template"] = "Name: <Name>"
+        function_x_graph.config = config
+        function_x_graph.save()
+        self.assertEqual(self.test_resource.get_descriptor("name"), "Name: Test Name 1")
+
+        function_x_graph.delete()
+        self.assertEqual(self.test_resource.get_descriptor("name"), "undefined")
+
+    def test_persisted_descriptors(self):
+        """
+        Test the persisted descriptors of a resource are refreshed when a tile participating in them is saved or deleted
+        """
+
+        config = {
+            "name": {"nodegroup_id": self.search_model_name_nodeid, "string_template": "<Name>"},
+            "description": {"nodegroup_id": "", "string_template": ""},
+            "map_popup": {"nodegroup_id": "", "string_template": ""},
+        }
+        function_x_graph = models.FunctionXGraph.objects.create(
+            function_id="60000000-0000-0000-0000-000000000001", graph_id=self.search_model_graphid, config=config
+        )
+
+        test_resource = Resource(graph_id=self.search_model_graphid)
+        tile = Tile(data={self.search_model_name_nodeid: "Persisted Name"}, nodegroup_id=self.search_model_name_nodeid)
+        test_resource.tiles.append(tile)
+        test_resource.save(index=False)
+        self.assertEqual(models.ResourceInstance.objects.get(pk=test_resource.pk).descriptors["name"], "Persisted Name")
+
+        tile.data[self.search_model_name_nodeid] = "Updated Name"
+        tile.save(index=False)
+        self.assertEqual(Resource.objects.get(pk=test_resource.pk).displayname, "Updated Name")
+
+        tile.delete(index=False)
+        self.assertEqual(Resource.objects.get(pk=test_resource.pk).displayname, "Undefined")
+
+        config["description"] = {"nodegroup_id": self.search_model_name_nodeid, "string_template": "<Name>"}
+        function_x_graph.config = config
+        function_x_graph.save()
+        self.assertIsNone(models.ResourceInstance.objects.get(pk=test_resource.pk).descriptors)
+
+        function_x_graph.delete()
+        test_resource.delete()
+
+    def test_persisted_descriptors_are_read_only(self):
+        """
+        Test reading the descriptors of a resource without persisted descriptors calculates them without saving them
+        """
+
+        test_resource = Resource(graph_id=self.search_model_graphid)
+        test_resource.save(index=False)
+        models.ResourceInstance.objects.filter(pk=test_resource.pk).update(descriptors=None)
+
+        resource = Resource.objects.get(pk=test_resource.pk)
+        self.assertEqual(resource.displayname, resource.get_descriptor("name"))
+        self.assertIsNone(models.ResourceInstance.objects.get(pk=test_resource.pk).descriptors)
+
+    def test_delete_resources(self):
+        """
+        Test resources and their tiles are deleted in bulk with a single edit log entry for each batch
+        """
+
+        resourceids = []
+        for name in ["Bulk Delete 1", "Bulk Delete 2", "Bulk Delete 3"]:
+            test_resource = Resource(graph_id=self.search_model_graphid)
+            test_resource.tiles.append(Tile(data={self.search_model_name_nodeid: name}, nodegroup_id=self.search_model_name_nodeid))
+            test_resource.save(index=False)
+            resourceids.append(str(test_resource.pk))
+
+        count = remover.delete_resources(resourceids=resourceids, batch_size=2)
+
+        self.assertEqual(count, 3)
+        self.assertFalse(models.ResourceInstance.objects.filter(pk__in=resourceids).exists())
+        self.assertFalse(models.TileModel.objects.filter(resourceinstance_id__in=resourceids).exists())
+        self.assertTrue(models.ResourceInstance.objects.filter(pk=self.test_resource.pk).exists())
+        edits = models.EditLog.objects.filter(edittype="bulk_delete")
+        self.assertEqual(edits.count(), 2)
+        self.assertCountEqual([resourceid for edit in edits for resourceid in edit.oldvalue["resourceinstanceids"]], resourceids)
+
+    def test_delete_instances_of_inactive_graph(self):
+        """
+        Test the instances of an inactive graph can't be deleted, but deleting them does nothing if it has none
+        """
+
+        graph = Graph.new(name="Inactive Model", is_resource=True)
+        self.assertFalse(graph.isactive)
+        graph.delete_instances()
+
+        models.ResourceInstance.objects.create(graph_id=graph.graphid)
+        with self.assertRaises(ModelInactiveError):
+            graph.delete_instances()
+        self.assertTrue(models.ResourceInstance.objects.filter(graph_id=graph.graphid).exists())
+
+    def test_delete_referenced_resource(self):
+        """
+        Test deleting a resource removes the references to it from the tiles of other resources and reindexes them
+        """
+
+        deleted_resource = Resource(graph_id=self.search_model_graphid)
+        deleted_resource.save(index=False)
+        referencing_resource = Resource(graph_id=self.search_model_graphid)
+        referencing_resource.save(index=False)
+        other_resourceid = str(uuid.uuid4())
+        nodeid = self.search_model_sensitive_info_nodeid
+        tile = models.TileModel.objects.create(
+            resourceinstance_id=referencing_resource.pk,
+            nodegroup_id=nodeid,
+            data={nodeid: [{"resourceId": str(deleted_resource.pk)}, {"resourceId": other_resourceid}]},
+        )
+        now = datetime.datetime.now()
+        models.ResourceXResource.objects.bulk_create(
+            [
+                models.ResourceXResource(
+                    resourceinstanceidfrom_id=referencing_resource.pk,
+                    resourceinstanceidto_id=deleted_resource.pk,
+                    tileid=tile,
+                    nodeid_id=nodeid,
+                    created=now,
+                    modified=now,
+                )
+            ]
+        )
+
+        with mock.patch.object(remover.index_queue, "index_resources") as index_resources:
+            remover.delete_resources(resourceids=[str(deleted_resource.pk)])
+
+        self.assertEqual(models.TileModel.objects.get(pk=tile.pk).data[nodeid], [{"resourceId": other_resourceid}])
+        self.assertFalse(models.ResourceXResource.objects.filter(resourceinstanceidto_id=deleted_resource.pk).exists())
+        self.assertEqual(index_resources.call_args[0][0], {str(referencing_resource.pk)})
+
+    def test_get_documents_to_index(self):
+        """
+        Test the document of a resource is built from the datatypes of its graph's nodes
+        """
+
+        node_datatypes = DataTypeFactory().get_node_datatypes(self.search_model_graphid)
+        self.assertIsInstance(node_datatypes[self.search_model_name_nodeid], StringDataType)
+
+        document, terms = self.test_resource.get_documents_to_index()
+        self.assertIn("Test Name 1", [string["string"] for string in document["strings"]])
+        self.assertEqual([domain["label"] for domain in document["domains"]], ["Mock concept"])
+        self.assertEqual(len(document["date_ranges"]), 1)
+
+    def test_partial_index_update(self):
+        """
+        Test updating the values of a nodegroup in a resource's document gives the same document as reindexing the whole resource
+        """
+
+        def get_indexed_values(resourceid):
+            se.refresh(index=RESOURCES_INDEX)
+            document = se.search(index=RESOURCES_INDEX, id=resourceid)["_source"]
+            values = {
+                "tiles": sorted((tile["tileid"], JSONSerializer().serialize(tile["data"], sort_keys=True)) for tile in document["tiles"])
+            }
+            for field in ("strings", "dates", "numbers"):
+                values[field] = sorted(JSONSerializer().serialize(value, sort_keys=True) for value in document.get(field, []))
+            return values
+
+        test_resource = Resource(graph_id=self.search_model_graphid)
+        name_tile = Tile(data={self.search_model_name_nodeid: "Partial Name"}, nodegroup_id=self.search_model_name_nodeid)
+        test_resource.tiles.append(name_tile)
+        date_tile = Tile(data={self.search_model_creation_date_nodeid: "1941-01-01"}, nodegroup_id=self.search_model_creation_date_nodeid)
+        test_resource.tiles.append(date_tile)
+        test_resource.save()
+
+        with mock.patch.object(settings, "DEFER_RESOURCE_INDEXING", False), mock.patch.object(
+            settings, "PARTIAL_RESOURCE_INDEX_UPDATES", True
+        ):
+            date_tile = Tile.objects.get(pk=date_tile.tileid)
+            date_tile.data[self.search_model_creation_date_nodeid] = "1942-02-02"
+            date_tile.save()
+            sensitive_tile = Tile(
+                data={self.search_model_sensitive_info_nodeid: "Partial Secret"},
+                nodegroup_id=self.search_model_sensitive_info_nodeid,
+                resourceinstance_id=test_resource.pk,
+            )
+            sensitive_tile.save()
+        partially_indexed = get_indexed_values(str(test_resource.pk))
+
+        Resource.objects.get(pk=test_resource.pk).index()
+        fully_indexed = get_indexed_values(str(test_resource.pk))
+
+        self.assertEqual(partially_indexed, fully_indexed)
+        self.assertIn(str(sensitive_tile.tileid), [tileid for tileid, data in fully_indexed["tiles"]])
+
+    def test_copy_resources(self):
+        """
+        Test new resources are saved with their tiles and geometries with COPY statements
+        """
+
+        test_resource = Resource(graph_id=self.search_model_graphid)
+        test_resource.tiles.append(Tile(data={self.search_model_name_nodeid: 'Copied "Name"'}, nodegroup_id=self.search_model_name_nodeid))
+        test_resource.tiles.append(Tile(data={self.search_model_geom_nodeid: self.geom}, nodegroup_id=self.search_model_geom_nodeid))
+
+        copy_loader.copy_resources([test_resource], index=False)
+
+        resource = Resource.objects.get(pk=test_resource.pk)
+        self.assertEqual(resource.graph_id, test_resource.graph_id)
+        self.assertEqual(resource.descriptors, test_resource.descriptors)
+        tile = models.TileModel.objects.get(resourceinstance_id=test_resource.pk, nodegroup_id=self.search_model_name_nodeid)
+        self.assertEqual(tile.data, {self.search_model_name_nodeid: 'Copied "Name"'})
+        self.assertEqual(models.GeoJSONGeometry.objects.filter(resourceinstance_id=test_resource.pk).count(), 1)
+        self.assertTrue(models.EditLog.objects.filter(resourceinstanceid=str(test_resource.pk), edittype="create").exists())
+
+    def test_bulk_save_refreshes_saved_geometries(self):
+        """
+        Test a bulk save rebuilds the geometries of only the tiles it saves and defers refreshing the map clusters
+        """
+
+        test_resources = [Resource(graph_id=self.search_model_graphid) for i in range(3)]
+        for resource in test_resources:
+            resource.save(index=False)
+        tiles = [
+            Tile(
+                data={self.search_model_geom_nodeid: self.geom}, nodegroup_id=self.search_model_geom_nodeid, resourceinstance_id=resource.pk
+            )
+            for resource in test_resources
+        ]
+
+        with mock.patch.object(mvt, "geometries_changed") as geometries_changed, mock.patch.object(
+            mvt, "refresh_clusters"
+        ) as refresh_clusters:
+            Tile.bulk_save(tiles, index=False)
+
+        geometries = models.GeoJSONGeometry.objects.filter(resourceinstance_id__in=[resource.pk for resource in test_resources])
+        self.assertCountEqual([geometry.tile_id for geometry in geometries], [tile.tileid for tile in tiles])
+        geometries_changed.assert_called_once()
+        self.assertEqual(list(geometries_changed.call_args[0][0].keys()), [self.search_model_geom_nodeid])
+        refresh_clusters.assert_not_called()
+
+    def test_copy_loader_returns_geometry_nodes_to_its_parent(self):
+        """
+        Test a loader that doesn't refresh geometries collects the geometry nodes of the resources copied for
+        a loader in the parent process to refresh once
+        """
+
+        test_resource = Resource(graph_id=self.search_model_graphid)
+        test_resource.tiles.append(Tile(data={self.search_model_geom_nodeid: self.geom}, nodegroup_id=self.search_model_geom_nodeid))
+
+        with mock.patch.object(copy_loader.mvt, "refresh_clusters") as refresh_clusters, mock.patch.object(
+            copy_loader.mvt, "clear_cached_tiles"
+        ) as clear_cached_tiles:
+            with copy_loader.CopyLoader(refresh_geometries=False) as worker_loader:
+                copy_loader.copy_resources([test_resource], index=False)
+            self.assertEqual(worker_loader.geometry_nodeids, {self.search_model_geom_nodeid})
+            refresh_clusters.assert_not_called()
+
+            with copy_loader.CopyLoader() as loader:
+                loader.geometry_nodeids |= worker_loader.geometry_nodeids
+            clear_cached_tiles.assert_called_once_with(self.search_model_geom_nodeid)
+
+    def test_deferred_indexes_are_rebuilt(self):
+        """
+        Test a loader that defers indexes rebuilds them when it exits, even if the load fails
+        """
+
+        def get_indexes():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = ANY(%s)", [copy_loader.COPY_TABLES])
+                return sorted(name for name, in cursor.fetchall())
+
+        indexes = get_indexes()
+        try:
+            with copy_loader.CopyLoader(defer_indexes=True) as loader:
+                self.assertGreater(len(loader.indexes), 0)
+                self.assertEqual(len(get_indexes()), len(indexes) - len(loader.indexes))
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(get_indexes(), indexes)
+
+    def test_update_relation_graphids(self):
+        """
+        Test the graph ids of relations saved before their resources existed are filled in, a batch at a time
+        """
+
+        resources = [Resource(graph_id=self.search_model_graphid) for i in range(3)]
+        for resource in resources:
+            resource.save(index=False)
+        now = datetime.datetime.now()
+        models.ResourceXResource.objects.bulk_create(
+            [
+                models.ResourceXResource(
+                    resourceinstanceidfrom_id=resources[0].pk, resourceinstanceidto_id=resource.pk, created=now, modified=now
+                )
+                for resource in resources[1:]
+            ]
+            + [
+                models.ResourceXResource(
+                    resourceinstanceidfrom_id=resources[0].pk, resourceinstanceidto_id=uuid.uuid4(), created=now, modified=now
+                )
+            ]
+        )
+
+        self.assertGreaterEqual(update_relation_graphids(batch_size=1, index=False), 3)
+        relations = models.ResourceXResource.objects.filter(resourceinstanceidfrom_id=resources[0].pk)
+        self.assertEqual(relations.filter(resourceinstancefrom_graphid_id=self.search_model_graphid).count(), 3)
+        self.assertEqual(relations.filter(resourceinstanceto_graphid_id=self.search_model_graphid).count(), 2)
+        self.assertEqual(update_relation_graphids(index=False), 0)
@@ -23,12 +23,15 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from unittest import mock
 from tests import test_settings
 from tests.base_test import ArchesTestCase
 from django.db import connection
 from django.core import management
 from django.contrib.auth.models import User
 from django.http import HttpRequest
+from arches.app.datatypes.base import BaseDataType
+from arches.app.models import models
 from arches.app.models.tile import Tile, TileCardinalityError
 
 
@@ -160,6 +163,86 @@ class TileTests(ArchesTestCase):
 
         self.assertEqual(tiles.count(), 2)
 
+    def test_save_unchanged(self):
+        """
+        Test that saving a tile that hasn't changed writes nothing
+
+        """
+
+        json = {
+            "tiles": [
+                {
+                    "tiles": [],
+                    "resourceinstance_id": "40000000-0000-0000-0000-000000000000",
+                    "parenttile_id": "",
+                    "nodegroup_id": "72048cb3-adbc-11e6-9ccf-14109fd34195",
+                    "tileid": "",
+                    "data": {"72048cb3-adbc-11e6-9ccf-14109fd34195": "TEST 1"},
+                }
+            ],
+            "resourceinstance_id": "40000000-0000-0000-0000-000000000000",
+            "parenttile_id": "",
+            "nodegroup_id": "7204869c-adbc-11e6-8bec-14109fd34195",
+            "tileid": "",
+            "data": {},
+        }
+
+        t = Tile(json)
+        t.save(index=False)
+        child_tile = Tile.objects.get(pk=t.tiles[0].tileid)
+        edits = models.EditLog.objects.filter(tileinstanceid=child_tile.tileid)
+        self.assertEqual(edits.count(), 1)
+
+        child_tile.save(index=False)
+        self.assertTrue(child_tile.is_unchanged)
+        self.assertEqual(edits.count(), 1)
+
+        child_tile.data["72048cb3-adbc-11e6-9ccf-14109fd34195"] = "TEST 2"
+        child_tile.save(index=False)
+        self.assertFalse(child_tile.is_unchanged)
+        self.assertEqual(child_tile.changed_nodeids, ["72048cb3-adbc-11e6-9ccf-14109fd34195"])
+        self.assertEqual(edits.count(), 2)
+
+    def test_bulk_save(self):
+        """
+        Test that we can save a list of Tile objects, and their child tiles, back to the database in one go
+
+        """
+
+        json = {
+            "tiles": [
+                {
+                    "tiles": [],
+                    "resourceinstance_id": "40000000-0000-0000-0000-000000000000",
+                    "parenttile_id": "",
+                    "nodegroup_id": "72048cb3-adbc-11e6-9ccf-14109fd34195",
+                    "tileid": "",
+                    "data": {"72048cb3-adbc-11e6-9ccf-14109fd34195": "TEST 1"},
+                }
+            ],
+            "resourceinstance_id": "40000000-0000-0000-0000-000000000000",
+            "parenttile_id": "",
+            "nodegroup_id": "7204869c-adbc-11e6-8bec-14109fd34195",
+            "tileid": "",
+            "data": {},
+        }
+
+        saved_tiles = Tile.bulk_save([Tile(json)], index=False)
+        tiles = Tile.objects.filter(resourceinstance_id="40000000-0000-0000-0000-000000000000")
+        self.assertEqual(tiles.count(), 2)
+
+        child_tile = saved_tiles[1]
+        child_tile.data["72048cb3-adbc-11e6-9ccf-14109fd34195"] = "TEST 2"
+        Tile.bulk_save([child_tile], index=False)
+        self.assertEqual(tiles.count(), 2)
+        self.assertEqual(Tile.objects.get(pk=child_tile.tileid).data["72048cb3-adbc-11e6-9ccf-14109fd34195"], "TEST 2")
+        self.assertEqual(models.EditLog.objects.filter(tileinstanceid=child_tile.tileid, edittype="tile edit").count(), 1)
+
+        # nodes whose values haven't changed aren't prepared for saving again
+        with mock.patch.object(BaseDataType, "pre_tile_save") as pre_tile_save:
+            Tile.bulk_save([child_tile], index=False)
+        pre_tile_save.assert_not_called()
+
     def test_simple_get(self):
         """
         Test that we can get a Tile object
@@ -39,6 +39,11 @@ from arches.app.utils.permission_backend import user_can_edit_resource
 from arches.app.utils.permission_backend import user_can_read_concepts
 from arches.app.utils.permission_backend import user_has_resource_model_permissions
 from arches.app.utils.permission_backend import get_restricted_users
+from arches.app.utils.permission_backend import get_restricted_users_bulk
+from arches.app.utils.permission_backend import get_restricted_instances
+from arches.app.utils.permission_backend import refresh_restricted_instances
+from arches.app.utils.permission_backend import get_restricted_instances_among
+from arches.app.utils.permission_backend import exclude_restricted_instances
 
 # these tests can be run from the command line via
 # python manage.py test tests/permissions/permission_tests.py --pattern="*.py" --settings="tests.test_settings"
@@ -154,3 +159,83 @@ class PermissionTests(ArchesTestCase):
         ]
 
         self.assertTrue(all(results) is True)
+
+    def test_get_restricted_users_bulk(self):
+        """
+        Tests that the set based restriction lookup agrees with the per resource lookup
+        for several resources with a mix of group, user and inactive user permissions.
+        """
+
+        jim = User.objects.get(username="jim")
+        sam = User.objects.get(username="sam")
+        inactive_user = User.objects.create_user(username="inactive", email="inactive@test.com", password="Test12345!")
+        inactive_user.is_active = False
+        inactive_user.save()
+        self.group.user_set.add(inactive_user)
+
+        resource = ResourceInstance.objects.get(resourceinstanceid=self.resource_instance_id)
+        assign_perm("no_access_to_resourceinstance", self.group, resource)
+        assign_perm("view_resourceinstance", self.user, resource)
+        assign_perm("change_resourceinstance", jim, resource)
+
+        user_restricted = ResourceInstance.objects.create(graph_id=self.data_type_graphid)
+        assign_perm("no_access_to_resourceinstance", sam, user_restricted)
+        assign_perm("no_access_to_resourceinstance", inactive_user, user_restricted)
+        assign_perm("view_resourceinstance", jim, user_restricted)
+
+        mixed = ResourceInstance.objects.create(graph_id=self.data_type_graphid)
+        assign_perm("view_resourceinstance", self.group, mixed)
+        assign_perm("no_access_to_resourceinstance", self.user, mixed)
+        assign_perm("change_resourceinstance", inactive_user, mixed)
+        assign_perm("delete_resourceinstance", sam, mixed)
+
+        unrestricted = ResourceInstance.objects.create(graph_id=self.data_type_graphid)
+
+        resources = [resource, user_restricted, mixed, unrestricted]
+        restrictions = get_restricted_users_bulk(resources)
+
+        self.assertNotIn(inactive_user.id, restrictions[str(user_restricted.pk)]["no_access"])
+        for resource in resources:
+            expected = get_restricted_users(resource)
+            for key, user_ids in expected.items():
+                self.assertEqual(sorted(user_ids), restrictions[str(resource.pk)][key])
+
+    def test_get_restricted_instances(self):
+        """
+        Tests that refreshing the persisted restrictions invalidates the cached restricted instances.
+        """
+
+        sam = User.objects.get(username="sam")
+        self.assertTrue(self.resource_instance_id not in get_restricted_instances(sam))
+
+        resource = ResourceInstance.objects.get(resourceinstanceid=self.resource_instance_id)
+        assign_perm("no_access_to_resourceinstance", self.group, resource)
+        refresh_restricted_instances([self.resource_instance_id])
+
+        self.assertTrue(self.resource_instance_id in get_restricted_instances(sam))
+        self.assertTrue(self.resource_instance_id in get_restricted_instances(sam, allresources=True))
+        self.assertEqual(get_restricted_instances(User.objects.get(username="admin")), [])
+
+        empty_group = Group.objects.create(name="No Members")
+        private_resource = ResourceInstance.objects.create(graph_id=self.data_type_graphid)
+        assign_perm("no_access_to_resourceinstance", empty_group, private_resource)
+        refresh_restricted_instances([private_resource.pk])
+
+        self.assertTrue(str(private_resource.pk) in get_restricted_instances(sam, allresources=True))
+        self.assertTrue(str(private_resource.pk) not in get_restricted_instances(sam))
+
+    def test_restricted_instances_in_sql(self):
+        """
+        Tests that restricted instances are filtered by looking up only the instances in question.
+        """
+
+        sam = User.objects.get(username="sam")
+        resource = ResourceInstance.objects.get(resourceinstanceid=self.resource_instance_id)
+        assign_perm("no_access_to_resourceinstance", self.group, resource)
+        refresh_restricted_instances([self.resource_instance_id])
+
+        self.assertEqual(get_restricted_instances_among(sam, [self.resource_instance_id]), {self.resource_instance_id})
+        self.assertEqual(get_restricted_instances_among(User.objects.get(username="admin"), [self.resource_instance_id]), set())
+        resources = ResourceInstance.objects.filter(resourceinstanceid=self.resource_instance_id)
+        self.assertFalse(exclude_restricted_instances(resources, sam, field="resourceinstanceid").exists())
+        self.assertTrue(exclude_restricted_instances(resources, User.objects.get(username="admin"), field="resourceinstanceid").exists())
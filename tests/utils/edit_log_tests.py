@@ -0,0 +1,95 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import uuid
+from django.db import transaction
+from tests.base_test import ArchesTestCase
+from arches.app.models import models
+from arches.app.utils import edit_log
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/edit_log_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class EditLogWriterTests(ArchesTestCase):
+    def setUp(self):
+        self.transactionid = uuid.uuid4()
+
+    def get_edit(self, note):
+        return models.EditLog(note=note, edittype="test", transactionid=self.transactionid)
+
+    def get_notes(self):
+        return list(models.EditLog.objects.filter(transactionid=self.transactionid).values_list("note", flat=True))
+
+    def test_edits_are_written_when_the_writer_exits(self):
+        with edit_log.EditLogWriter():
+            edit_log.write(self.get_edit("1"))
+            with edit_log.EditLogWriter():
+                edit_log.write(self.get_edit("2"))
+            self.assertEqual(self.get_notes(), [])
+        self.assertEqual(sorted(self.get_notes()), ["1", "2"])
+
+    def test_atomic_writer_drops_its_edits_on_error(self):
+        with edit_log.EditLogWriter():
+            edit_log.write(self.get_edit("1"))
+            try:
+                with edit_log.EditLogWriter(atomic=True):
+                    edit_log.write(self.get_edit("2"))
+                    raise ValueError()
+            except ValueError:
+                pass
+            edit_log.write(self.get_edit("3"))
+        self.assertEqual(sorted(self.get_notes()), ["1", "3"])
+
+    def test_edits_are_written_in_batches(self):
+        with edit_log.EditLogWriter(batch_size=2):
+            for note in ("1", "2", "3"):
+                edit_log.write(self.get_edit(note))
+            self.assertEqual(sorted(self.get_notes()), ["1", "2"])
+        self.assertEqual(sorted(self.get_notes()), ["1", "2", "3"])
+
+    def test_nested_writers_write_full_batches_when_they_exit(self):
+        with edit_log.EditLogWriter(batch_size=2):
+            edit_log.write(self.get_edit("1"))
+            with edit_log.EditLogWriter(batch_size=2):
+                edit_log.write(self.get_edit("2"))
+                edit_log.write(self.get_edit("3"))
+                self.assertEqual(self.get_notes(), [])
+            self.assertEqual(sorted(self.get_notes()), ["1", "2", "3"])
+            try:
+                with transaction.atomic(), edit_log.EditLogWriter(batch_size=2, atomic=True):
+                    with edit_log.EditLogWriter(batch_size=2):
+                        edit_log.write(self.get_edit("4"))
+                        edit_log.write(self.get_edit("5"))
+                    self.assertEqual(sorted(self.get_notes()), ["1", "2", "3", "4", "5"])
+                    raise ValueError()
+            except ValueError:
+                pass
+        # edits written by a rolled back transaction are rolled back with it
+        self.assertEqual(sorted(self.get_notes()), ["1", "2", "3"])
+
+    def test_forked_processes_start_with_an_empty_buffer(self):
+        writer = edit_log.EditLogWriter()
+        writer.__enter__()
+        edit_log.write(self.get_edit("1"))
+        # what's run in a forked process when it starts
+        edit_log.reset()
+        edit_log.write(self.get_edit("2"))
+        self.assertEqual(self.get_notes(), ["2"])
+        writer.__exit__(None, None, None)
+        self.assertEqual(self.get_notes(), ["2"])
@@ -0,0 +1,67 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+from tests import test_settings
+from tests.base_test import ArchesTestCase
+from django.core import management
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from arches.app.models import models
+from arches.app.utils import graph_metadata
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/graph_metadata_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class GraphMetadataTests(ArchesTestCase):
+    @classmethod
+    def setUpClass(cls):
+        for path in test_settings.RESOURCE_GRAPH_LOCATIONS:
+            management.call_command("packages", operation="import_graphs", source=path)
+        cls.nodeid = "72048cb3-adbc-11e6-9ccf-14109fd34195"
+
+    def test_get_node_without_queries(self):
+        node = graph_metadata.get_node(self.nodeid)
+        self.assertEqual(str(node.nodeid), self.nodeid)
+
+        with CaptureQueriesContext(connection) as queries:
+            graph_metadata.get_node(self.nodeid)
+            graph_metadata.get_nodes(node.nodegroup_id)
+            graph_metadata.get_constraints(node.nodegroup_id)
+        self.assertEqual(len(queries), 0)
+
+    def test_metadata_reloaded_when_node_changes(self):
+        node = models.Node.objects.get(pk=self.nodeid)
+        graph_metadata.get_node(self.nodeid)
+        node.description = "a changed description"
+        node.save()
+        self.assertEqual(graph_metadata.get_node(self.nodeid).description, "a changed description")
+
+    def test_missing_node(self):
+        with self.assertRaises(models.Node.DoesNotExist):
+            graph_metadata.get_node("00000000-0000-0000-0000-000000000000")
+
+    def test_functions_resolved_once(self):
+        node = graph_metadata.get_node(self.nodeid)
+        metadata = graph_metadata.get_nodegroup_metadata(node.nodegroup_id)
+        functions = metadata.get_functions(node.nodegroup_id)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(metadata.get_functions(node.nodegroup_id), functions)
+        self.assertEqual(len(queries), 0)
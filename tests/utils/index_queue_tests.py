@@ -0,0 +1,64 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import uuid
+from unittest import mock
+from django.core.cache import cache
+from django.http import HttpRequest
+from tests.base_test import ArchesTestCase
+from arches.app.models import models
+from arches.app.utils import index_queue
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/index_queue_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class IndexQueueTests(ArchesTestCase):
+    def test_resources_are_queued_once(self):
+        resourceids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        index_queue.queue_resources(resourceids)
+        index_queue.queue_resources([resourceids[0], resourceids[0]])
+        self.assertEqual(models.ResourceIndexQueue.objects.filter(resourceinstanceid__in=resourceids).count(), 2)
+
+    def test_process_queue_for_some_resources(self):
+        resourceids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        index_queue.queue_resources(resourceids)
+
+        # resources that no longer exist are dropped from the queue without being indexed
+        self.assertEqual(index_queue.process_queue(resourceids=[resourceids[0]]), 1)
+        queued = models.ResourceIndexQueue.objects.filter(resourceinstanceid__in=resourceids).values_list("resourceinstanceid", flat=True)
+        self.assertEqual([str(resourceid) for resourceid in queued], [resourceids[1]])
+
+    def test_unscheduled_queue_only_indexes_given_resources(self):
+        resourceids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        index_queue.queue_resources(resourceids)
+        cache.delete(index_queue.SCHEDULED_CACHE_KEY)
+
+        # if the broker can't be reached only the resources a request queued itself are indexed
+        with mock.patch("arches.app.tasks.index_queued_resources.apply_async", side_effect=Exception("broker unreachable")):
+            index_queue.schedule_queue_processing(resourceids=[resourceids[0]])
+        queued = models.ResourceIndexQueue.objects.filter(resourceinstanceid__in=resourceids).values_list("resourceinstanceid", flat=True)
+        self.assertEqual([str(resourceid) for resourceid in queued], [resourceids[1]])
+        self.assertIsNone(cache.get(index_queue.SCHEDULED_CACHE_KEY))
+
+    def test_flush_requested(self):
+        request = HttpRequest()
+        self.assertFalse(index_queue.flush_requested(request))
+        request.GET["flush_index"] = "true"
+        self.assertTrue(index_queue.flush_requested(request))
+        self.assertFalse(index_queue.flush_requested(None))
@@ -0,0 +1,65 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import uuid
+from unittest import mock
+from tests.base_test import ArchesTestCase
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.utils.mvt import clear_cached_tiles, get_cluster_parameters, get_tile_cache_key, get_tile_range
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/mvt_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class MVTTests(ArchesTestCase):
+    def test_get_tile_range_of_world(self):
+        self.assertEqual(get_tile_range((-180, -90, 180, 90), 0), (0, 0, 0, 0))
+        self.assertEqual(get_tile_range((-180, -90, 180, 90), 2), (0, 0, 3, 3))
+
+    def test_get_tile_range_of_point(self):
+        # a point in London
+        self.assertEqual(get_tile_range((-0.1275, 51.5072, -0.1275, 51.5072), 10), (511, 340, 511, 340))
+
+    def test_get_tile_range_of_box(self):
+        self.assertEqual(get_tile_range((1, 1, 91, 67), 2), (2, 0, 3, 1))
+
+    def test_get_cluster_parameters(self):
+        node = models.Node(config={"clusterDistance": 20, "clusterMinPoints": 3, "clusterMaxZoom": 14})
+        distance, min_points = get_cluster_parameters(node, 14)
+        self.assertAlmostEqual(distance, 40075016.6856 / (16384 * 256) * 20)
+        self.assertEqual(min_points, 3)
+
+        # the distance is capped at low zoom levels
+        distance, min_points = get_cluster_parameters(node, 0)
+        self.assertEqual(distance, settings.CLUSTER_DISTANCE_MAX)
+
+    def test_tile_cache_keys(self):
+        node = models.Node(nodeid=uuid.uuid4(), config={"clusterDistance": 20, "clusterMinPoints": 3, "clusterMaxZoom": 5})
+        unrestricted_key = get_tile_cache_key(node, 10, 511, 340)
+        restricted_key = get_tile_cache_key(node, 10, 511, 340, fingerprint="abc")
+        self.assertNotEqual(unrestricted_key, restricted_key)
+        self.assertEqual(restricted_key, get_tile_cache_key(node, 10, 511, 340, fingerprint="abc"))
+
+        # clearing the tiles in some bounds invalidates them for every fingerprint, but leaves other tiles alone
+        other_key = get_tile_cache_key(node, 10, 0, 0, fingerprint="abc")
+        with mock.patch.object(models.Node.objects, "get", return_value=node):
+            clear_cached_tiles(node.nodeid, [(-0.1275, 51.5072, -0.1275, 51.5072)])
+        self.assertNotEqual(unrestricted_key, get_tile_cache_key(node, 10, 511, 340))
+        self.assertNotEqual(restricted_key, get_tile_cache_key(node, 10, 511, 340, fingerprint="abc"))
+        self.assertEqual(other_key, get_tile_cache_key(node, 10, 0, 0, fingerprint="abc"))
@@ -0,0 +1,41 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+from tests.base_test import ArchesTestCase
+from arches.app.models import models
+from arches.app.utils.tile_constraints import get_constraint_value, get_value_hash
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/tile_constraints_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class TileConstraintsTests(ArchesTestCase):
+    def test_equal_values_hash_the_same(self):
+        self.assertEqual(get_value_hash(["a", {"x": 1, "y": 2}]), get_value_hash(["a", {"y": 2, "x": 1}]))
+        self.assertEqual(get_value_hash([1, None]), get_value_hash([1.0, None]))
+        self.assertNotEqual(get_value_hash(["a", "b"]), get_value_hash(["b", "a"]))
+        self.assertNotEqual(get_value_hash([1.5]), get_value_hash([1]))
+
+    def test_provisional_constraint_value(self):
+        nodeid = "72048cb3-adbc-11e6-9ccf-14109fd34195"
+        tile = models.TileModel(data={nodeid: "saved"})
+        self.assertEqual(get_constraint_value(tile, nodeid), "saved")
+
+        tile.provisionaledits = {"1": {"value": {nodeid: "provisional"}}}
+        self.assertEqual(get_constraint_value(tile, nodeid), "provisional")
@@ -0,0 +1,39 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import zipfile
+from io import BytesIO, StringIO
+from tests.base_test import ArchesTestCase
+from arches.app.utils.zip import write_zip_file
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/zip_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class ZipTests(ArchesTestCase):
+    def test_write_zip_file(self):
+        files = [
+            {"name": "text.csv", "outputfile": StringIO("a,b\r\n1,2\r\n")},
+            {"name": "binary.dat", "outputfile": BytesIO(b"\x00\x01" * 10)},
+        ]
+        dest = BytesIO()
+        write_zip_file(files, dest, chunk_size=3)
+
+        with zipfile.ZipFile(dest) as zip:
+            self.assertEqual(zip.read("text.csv"), b"a,b\r\n1,2\r\n")
+            self.assertEqual(zip.read("binary.dat"), b"\x00\x01" * 10)
@@ -26,12 +26,14 @@ Replace this with more appropriate tests for your application.
 import os
 import json
 import time
+from unittest import mock
 from tests.base_test import ArchesTestCase
 from django.urls import reverse
 from django.contrib.auth.models import User, Group
-from django.test.client import Client
+from django.test.client import Client, RequestFactory
 from arches.app.models import models
 from arches.app.models.resource import Resource
+from arches.app.models.system_settings import settings
 from arches.app.models.tile import Tile
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as ResourceGraphImporter
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
@@ -39,6 +41,9 @@ from guardian.shortcuts import assign_perm
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Query, Term
 from arches.app.search.mappings import TERMS_INDEX, CONCEPTS_INDEX, RESOURCE_RELATIONS_INDEX, RESOURCES_INDEX
+from arches.app.search.search_export import SearchResultsExporter
+import arches.app.utils.zip as zip_utils
+from arches.app.views import search
 
 # these tests can be run from the command line via
 # python manage.py test tests/views/search_tests.py --pattern="*.py" --settings="tests.test_settings"
@@ -484,6 +489,61 @@ class SearchTests(ArchesTestCase):
         self.assertEqual(response_json["results"]["hits"]["total"]["value"], 2)
         self.assertCountEqual(extract_pks(response_json), [str(self.date_resource.pk), str(self.date_and_cultural_period_resource.pk)])
 
+    def test_total_results_from_search_hits(self):
+        temporal_filter = {"fromDate": "1940-01-01", "toDate": "1945-01-01", "dateNodeId": "", "inverted": False}
+        response_json = get_response_json(self.client, temporal_filter=temporal_filter)
+        self.assertEqual(response_json["total_results"], response_json["results"]["hits"]["total"]["value"])
+
+    def test_paged_search_is_streamed(self):
+        self.client.login(username="admin", password="admin")
+        with mock.patch.object(settings, "SEARCH_RESULT_LIMIT", 1):
+            response = self.client.get("/search/resources", {"pages": "1"})
+            self.assertTrue(response.streaming)
+            response_json = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(response_json["total_results"], 4)
+        self.assertEqual(response_json["results"]["hits"]["total"]["value"], 4)
+        self.assertEqual(len(extract_pks(response_json)), 2)
+        self.assertIn("geo_aggs", response_json["results"]["aggregations"])
+
+    def test_paged_search_content_for_callers_within_arches(self):
+        request = RequestFactory().get("/search/resources", {"pages": "1"})
+        request.user = User.objects.get(username="admin")
+        with mock.patch.object(settings, "SEARCH_RESULT_LIMIT", 1):
+            response = search.search_results(request, stream=False)
+        self.assertFalse(response.streaming)
+        response_json = json.loads(response.content)
+        self.assertEqual(response_json["total_results"], 4)
+        self.assertEqual(len(extract_pks(response_json)), 2)
+        self.assertIn("aggregations", response_json["results"])
+
+    def test_search_export_is_streamed(self):
+        """
+        Test that the exporter reads a page of search results at a time, exporting each page before the next is searched for
+
+        """
+
+        request = RequestFactory().get("/search/export_results", {"format": "tilecsv"})
+        request.user = User.objects.get(username="admin")
+        exporter = SearchResultsExporter(search_request=request)
+        searches = []
+        pages_searched = []
+        search = Query.search
+
+        def search_page(query, *args, **kwargs):
+            searches.append(kwargs)
+            return search(query, *args, **kwargs)
+
+        def flatten_tiles(*args, **kwargs):
+            pages_searched.append(len(searches))
+            return SearchResultsExporter.flatten_tiles(exporter, *args, **kwargs)
+
+        with mock.patch.object(settings, "SEARCH_RESULT_LIMIT", 1), mock.patch.object(Query, "search", search_page), mock.patch.object(
+            exporter, "flatten_tiles", flatten_tiles
+        ):
+            export_files, export_info = exporter.export("tilecsv", "false")
+        zip_utils.close_files(export_files)
+        self.assertEqual(pages_searched, [1, 2, 3, 4])
+
 
 def extract_pks(response_json):
     return [result["_source"]["resourceinstanceid"] for result in response_json["results"]["hits"]["hits"]]